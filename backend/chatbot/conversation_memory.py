@@ -0,0 +1,187 @@
+import os
+import asyncio
+from typing import Any, Dict, List, Optional
+from openai import AsyncOpenAI
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain.memory import ConversationBufferMemory
+from models.conversation import ConversationContext
+from models.tracing import traced
+from models.usage import count_tokens, get_usage_tracker
+
+
+def format_messages(messages: List[BaseMessage]) -> List[Dict[str, str]]:
+    """Convert langchain messages to OpenAI chat messages"""
+    return [
+        {
+            "role": "user" if isinstance(msg, HumanMessage) else "assistant",
+            "content": msg.content,
+        }
+        for msg in messages
+    ]
+
+
+class TokenBudgetedMemory:
+    """Keeps the chat history sent to the LLM within a token budget.
+
+    The last `window_turns` exchanges are sent verbatim. Older messages are
+    folded into a rolling summary stored on the ConversationContext and
+    removed from the buffer. The summary and the current search parameters
+    are sent as one system message ahead of the window. If the window plus
+    summary is still over budget, the oldest window messages are left out.
+
+    Folding runs in the background after a turn and is awaited at the start
+    of the next turn, so summarization doesn't add to response latency.
+    """
+
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        token_budget: int = 1500,
+        window_turns: int = 3,
+        summary_max_tokens: int = 300,
+        model: str = "gpt-4o-mini",
+    ):
+        self.client = client
+        self.token_budget = token_budget
+        self.window_turns = window_turns
+        self.summary_max_tokens = summary_max_tokens
+        self.model = model
+
+        # Counters
+        self.compactions = 0
+        self.folded_messages = 0
+        self.summary_errors = 0
+
+    @classmethod
+    def from_env(cls, client: AsyncOpenAI) -> Optional["TokenBudgetedMemory"]:
+        """Create from MEMORY_* environment variables, or None in plain buffer mode"""
+        if os.getenv("MEMORY_MODE", "buffer") != "budgeted":
+            return None
+        return cls(
+            client,
+            token_budget=int(os.getenv("MEMORY_TOKEN_BUDGET", "1500")),
+            window_turns=int(os.getenv("MEMORY_WINDOW_TURNS", "3")),
+            summary_max_tokens=int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "300")),
+        )
+
+    def build_history(
+        self, memory: ConversationBufferMemory, context: ConversationContext
+    ) -> List[Dict[str, str]]:
+        """Return the summary message plus as much of the recent window as fits"""
+        history = []
+        used = 0
+
+        preamble = self._preamble(context)
+        if preamble:
+            history.append({"role": "system", "content": preamble})
+            used += count_tokens(preamble)
+
+        window = format_messages(memory.chat_memory.messages[-2 * self.window_turns :])
+        kept = []
+        for message in reversed(window):
+            tokens = count_tokens(message["content"])
+            if kept and used + tokens > self.token_budget:
+                break
+            kept.append(message)
+            used += tokens
+
+        history.extend(reversed(kept))
+        return history
+
+    def _preamble(self, context: ConversationContext) -> str:
+        parts = []
+        if context._history_summary:
+            parts.append(
+                f"Summary of the earlier conversation: {context._history_summary}"
+            )
+        if context._last_search_params:
+            parts.append(
+                "Current search parameters: "
+                + context._last_search_params.model_dump_json(exclude_none=True)
+            )
+        return "\n".join(parts)
+
+    def schedule_compaction(
+        self, memory: ConversationBufferMemory, context: ConversationContext
+    ):
+        """Fold messages older than the window into the summary in the background"""
+        if len(memory.chat_memory.messages) <= 2 * self.window_turns:
+            return
+        if context._compaction_task and not context._compaction_task.done():
+            return
+        context._compaction_task = asyncio.create_task(self.compact(memory, context))
+
+    async def wait_for_compaction(self, context: ConversationContext):
+        """Wait for a pending background compaction of this session"""
+        task = context._compaction_task
+        if task and not task.done():
+            try:
+                await task
+            except Exception as e:
+                print(f"Error compacting conversation memory: {e}")
+
+    async def compact(
+        self, memory: ConversationBufferMemory, context: ConversationContext
+    ):
+        """Fold messages older than the window into the rolling summary"""
+        messages = memory.chat_memory.messages
+        fold_count = len(messages) - 2 * self.window_turns
+        if fold_count <= 0:
+            return
+
+        folded = messages[:fold_count]
+        try:
+            summary = await self._summarize(context._history_summary, folded)
+        except Exception as e:
+            # Keep the messages; build_history still enforces the budget
+            print(f"Error summarizing conversation memory: {e}")
+            self.summary_errors += 1
+            return
+
+        # The buffer may have been cleared while summarizing
+        if memory.chat_memory.messages[:fold_count] != folded:
+            return
+
+        del memory.chat_memory.messages[:fold_count]
+        context._history_summary = summary
+        self.compactions += 1
+        self.folded_messages += fold_count
+
+    @traced("summarize")
+    async def _summarize(self, summary: str, messages: List[BaseMessage]) -> str:
+        """Incrementally update the summary with the folded messages"""
+        transcript = "\n".join(
+            f"{m['role']}: {m['content']}" for m in format_messages(messages)
+        )
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": f"""You maintain a running summary of a shopping assistant conversation.
+                    Update the existing summary with the new messages. Keep what the user is looking for,
+                    their stated preferences (budget, ratings, style, size, sort order), products they liked
+                    or rejected, and questions already asked. Drop greetings and product descriptions.
+                    Reply with the updated summary only, in under {self.summary_max_tokens} tokens.""",
+                },
+                {
+                    "role": "user",
+                    "content": f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}",
+                },
+            ],
+            temperature=0,
+            max_tokens=self.summary_max_tokens,
+        )
+        get_usage_tracker().record_llm(response.model, response.usage)
+        return response.choices[0].message.content.strip()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return compaction counters"""
+        return {
+            "enabled": True,
+            "token_budget": self.token_budget,
+            "window_turns": self.window_turns,
+            "compactions": self.compactions,
+            "folded_messages": self.folded_messages,
+            "summary_errors": self.summary_errors,
+        }
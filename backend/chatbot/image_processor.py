@@ -0,0 +1,173 @@
+import io
+import os
+import base64
+import asyncio
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+from fastapi import UploadFile
+
+# Leading bytes of the image formats the vision model accepts
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+
+
+def sniff_mime(header: bytes) -> Optional[str]:
+    """Return the image MIME type from a file's first bytes, or None"""
+    for signature, mime in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mime
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds the size cap"""
+
+
+class UnsupportedImage(ValueError):
+    """Raised when an upload is not a supported image format"""
+
+
+class ImageProcessor:
+    """Saves uploads without blocking the event loop and shrinks images
+    before they are sent to the vision model.
+
+    Uploads are copied to disk in `chunk_size` chunks, rejected past
+    `max_upload_bytes`, and typed from their content rather than the
+    client's filename. Before analysis the image is downscaled so its
+    longest side is at most `max_side` pixels and re-encoded as JPEG. File
+    IO, decoding, resizing and base64 encoding all run in worker threads.
+    """
+
+    def __init__(
+        self,
+        max_upload_bytes: int = 10 * 1024 * 1024,
+        max_side: int = 768,
+        jpeg_quality: int = 85,
+        chunk_size: int = 256 * 1024,
+    ):
+        self.max_upload_bytes = max_upload_bytes
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self.chunk_size = chunk_size
+
+        # Counters
+        self.uploads = 0
+        self.rejected_uploads = 0
+        self.upload_bytes = 0
+        self.vision_bytes = 0
+
+    @classmethod
+    def from_env(cls) -> "ImageProcessor":
+        """Create from IMAGE_* environment variables"""
+        return cls(
+            max_upload_bytes=int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", "10485760")),
+            max_side=int(os.getenv("IMAGE_MAX_SIDE", "768")),
+            jpeg_quality=int(os.getenv("IMAGE_JPEG_QUALITY", "85")),
+        )
+
+    async def save_upload(
+        self, upload: UploadFile, path_without_ext: str
+    ) -> Tuple[str, str]:
+        """
+        Stream an upload to disk, returning the saved path (with an extension
+        for its sniffed type) and the SHA-256 of its content. Raises
+        UploadTooLarge or UnsupportedImage.
+        """
+        chunk = await upload.read(self.chunk_size)
+        mime = sniff_mime(chunk)
+        if mime is None:
+            self.rejected_uploads += 1
+            raise UnsupportedImage("Unsupported image format")
+
+        path = path_without_ext + EXTENSIONS[mime]
+        digest = hashlib.sha256()
+        size = 0
+
+        def write(data: bytes):
+            digest.update(data)
+            buffer.write(data)
+
+        buffer = await asyncio.to_thread(open, path, "wb")
+        try:
+            while chunk:
+                size += len(chunk)
+                if size > self.max_upload_bytes:
+                    raise UploadTooLarge(
+                        f"Image is larger than {self.max_upload_bytes} bytes"
+                    )
+                await asyncio.to_thread(write, chunk)
+                chunk = await upload.read(self.chunk_size)
+        except Exception:
+            self.rejected_uploads += 1
+            await asyncio.to_thread(buffer.close)
+            await asyncio.to_thread(os.remove, path)
+            raise
+        await asyncio.to_thread(buffer.close)
+
+        self.uploads += 1
+        self.upload_bytes += size
+        return path, digest.hexdigest()
+
+    async def to_data_url(self, path: str) -> str:
+        """Downscale and encode an image as a data URL for the vision model"""
+        data, mime = await asyncio.to_thread(self._prepare, path)
+        self.vision_bytes += len(data)
+        encoded = await asyncio.to_thread(base64.b64encode, data)
+        return f"data:{mime};base64,{encoded.decode('ascii')}"
+
+    def _prepare(self, path: str) -> Tuple[bytes, str]:
+        """Return (bytes, MIME type) of the image to send; runs in a thread"""
+        with open(path, "rb") as f:
+            data = f.read()
+        mime = sniff_mime(data[:16]) or "image/jpeg"
+
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            # Without Pillow, send the original bytes with their real type
+            return data, mime
+
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                resized = max(image.size) > self.max_side
+                # Let JPEG decode at a reduced scale when it's much larger
+                image.draft("RGB", (self.max_side, self.max_side))
+                image = ImageOps.exif_transpose(image)
+                if image.mode != "RGB":
+                    # Flatten transparency onto white before dropping alpha
+                    rgba = image.convert("RGBA")
+                    image = Image.new("RGB", rgba.size, (255, 255, 255))
+                    image.paste(rgba, mask=rgba.getchannel("A"))
+                image.thumbnail((self.max_side, self.max_side))
+
+                output = io.BytesIO()
+                image.save(output, "JPEG", quality=self.jpeg_quality, optimize=True)
+        except Exception as e:
+            print(f"Error downscaling image, sending original: {e}")
+            return data, mime
+
+        # Small images can grow when re-encoded; keep the original if so
+        if not resized and output.tell() >= len(data):
+            return data, mime
+        return output.getvalue(), "image/jpeg"
+
+    def stats(self) -> Dict[str, Any]:
+        """Return upload and vision payload counters"""
+        return {
+            "uploads": self.uploads,
+            "rejected_uploads": self.rejected_uploads,
+            "upload_bytes": self.upload_bytes,
+            "vision_bytes": self.vision_bytes,
+        }
@@ -0,0 +1,157 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from langchain.memory import ConversationBufferMemory
+from models.conversation import ConversationContext
+
+
+class SessionStore:
+    """Bounded store of per-session conversation context and memory.
+
+    Sessions are kept in least-recently-used order. A session is evicted when
+    it has been idle for longer than `idle_ttl` seconds (checked by a
+    background sweeper), or when `max_sessions` is exceeded. Each session's
+    chat history is trimmed from the oldest message once it holds more than
+    `max_history_bytes` of message text.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        idle_ttl: float = 3600,
+        max_history_bytes: int = 65536,
+        sweep_interval: float = 60,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_history_bytes = max_history_bytes
+        self.sweep_interval = sweep_interval
+
+        # session_id -> (context, memory, last_access)
+        self._sessions: OrderedDict = OrderedDict()
+        # session_id -> approximate bytes of chat history
+        self._history_bytes: Dict[str, int] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+        # Counters
+        self.idle_evictions = 0
+        self.capacity_evictions = 0
+        self.trimmed_messages = 0
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        """Create a store from SESSION_* environment variables"""
+        return cls(
+            max_sessions=int(os.getenv("SESSION_MAX_COUNT", "10000")),
+            idle_ttl=float(os.getenv("SESSION_IDLE_TTL", "3600")),
+            max_history_bytes=int(os.getenv("SESSION_MAX_HISTORY_BYTES", "65536")),
+            sweep_interval=float(os.getenv("SESSION_SWEEP_INTERVAL", "60")),
+        )
+
+    def get_or_create(
+        self, session_id: str
+    ) -> Tuple[ConversationContext, ConversationBufferMemory]:
+        """Get or create a session, marking it as recently used"""
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            context = ConversationContext()
+            memory = ConversationBufferMemory(
+                memory_key="chat_history", return_messages=True
+            )
+        else:
+            context, memory, _ = entry
+
+        self._sessions[session_id] = (context, memory, time.monotonic())
+        self._sessions.move_to_end(session_id)
+
+        while len(self._sessions) > self.max_sessions:
+            evicted_id, _ = self._sessions.popitem(last=False)
+            self._history_bytes.pop(evicted_id, None)
+            self.capacity_evictions += 1
+
+        return context, memory
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __getitem__(
+        self, session_id: str
+    ) -> Tuple[ConversationContext, ConversationBufferMemory]:
+        context, memory, _ = self._sessions[session_id]
+        return context, memory
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def record_history(self, session_id: str):
+        """Update the session's history size, trimming the oldest messages over the cap"""
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return
+
+        messages = entry[1].chat_memory.messages
+        sizes = [len(str(message.content).encode("utf-8")) for message in messages]
+        total = sum(sizes)
+
+        # Drop oldest messages, but always keep the latest exchange
+        trim = 0
+        while total > self.max_history_bytes and len(messages) - trim > 2:
+            total -= sizes[trim]
+            trim += 1
+        if trim:
+            del messages[:trim]
+            self.trimmed_messages += trim
+
+        self._history_bytes[session_id] = total
+
+    def sweep(self) -> int:
+        """Evict sessions idle for longer than idle_ttl. Returns the number evicted."""
+        cutoff = time.monotonic() - self.idle_ttl
+        evicted = 0
+        # Sessions are in LRU order, so stop at the first recent one
+        while self._sessions:
+            session_id, (_, _, last_access) = next(iter(self._sessions.items()))
+            if last_access > cutoff:
+                break
+            self._sessions.popitem(last=False)
+            self._history_bytes.pop(session_id, None)
+            evicted += 1
+
+        self.idle_evictions += evicted
+        return evicted
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error sweeping sessions: {e}")
+
+    def start_sweeper(self):
+        """Start the background idle-session sweeper (called on app startup)"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop_sweeper(self):
+        """Stop the background sweeper (called on app shutdown)"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return session gauges and eviction counters"""
+        return {
+            "live_sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_evictions": self.idle_evictions,
+            "capacity_evictions": self.capacity_evictions,
+            "trimmed_messages": self.trimmed_messages,
+            "history_bytes": sum(self._history_bytes.values()),
+        }
@@ -0,0 +1,103 @@
+import os
+import asyncio
+from typing import Any, Dict, List, Optional
+from models.product import AnyProduct
+from models.search import ProductSearcher, SearchParameters
+
+
+class Speculation:
+    """A product search started before the conversation state was known"""
+
+    __slots__ = ("search_params", "task", "upstream", "resolved")
+
+    def __init__(
+        self, search_params: SearchParameters, task: asyncio.Task, upstream: bool
+    ):
+        self.search_params = search_params
+        self.task = task
+        # Whether the search was expected to call Serper (not cached)
+        self.upstream = upstream
+        self.resolved = False
+
+
+class SpeculativeSearch:
+    """Overlaps the product search with conversation state analysis.
+
+    The search starts as soon as parameter extraction returns a base_query.
+    Its result is used if the state turns out to be ready_to_search with
+    the same parameters, and discarded otherwise.
+    """
+
+    def __init__(self, searcher: ProductSearcher):
+        self.searcher = searcher
+
+        # Counters
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.wasted_upstream = 0
+
+    @classmethod
+    def from_env(cls, searcher: ProductSearcher) -> Optional["SpeculativeSearch"]:
+        """Create unless SPECULATIVE_SEARCH is turned off"""
+        if os.getenv("SPECULATIVE_SEARCH", "true").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(searcher)
+
+    def start(
+        self, search_params: SearchParameters, backend: Optional[str] = None
+    ) -> Speculation:
+        """Start searching in the background"""
+        backend = backend or self.searcher.backend
+        catalog_only = backend == "catalog" and self.searcher.catalog is not None
+        upstream = not catalog_only and not self.searcher.is_cached(search_params)
+
+        task = asyncio.create_task(
+            self.searcher.search_products(search_params, backend=backend)
+        )
+        # Retrieve errors of discarded searches so they aren't logged as unhandled
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self.started += 1
+        return Speculation(search_params, task, upstream)
+
+    async def take(
+        self, speculation: Speculation, search_params: SearchParameters
+    ) -> Optional[List[AnyProduct]]:
+        """Return the speculative results if they were searched with
+        search_params, or None if the caller has to search itself"""
+        if speculation.search_params != search_params:
+            return None
+
+        speculation.resolved = True
+        try:
+            products = await speculation.task
+        except Exception as e:
+            print(f"Error in speculative search: {e}")
+            self.errors += 1
+            return None
+        self.hits += 1
+        return products
+
+    def discard(self, speculation: Speculation):
+        """Cancel a speculation whose results were not used"""
+        if speculation.resolved:
+            return
+        speculation.resolved = True
+        speculation.task.cancel()
+        self.misses += 1
+        if speculation.upstream:
+            self.wasted_upstream += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return speculation hit rate and waste counters"""
+        resolved = self.hits + self.misses
+        return {
+            "enabled": True,
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": self.hits / resolved if resolved else 0.0,
+            "wasted_upstream": self.wasted_upstream,
+        }
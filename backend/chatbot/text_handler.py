@@ -1,51 +1,137 @@
 import os
 import json
-import base64
-from typing import Dict, List
+from typing import AsyncIterator, Dict, List, Optional
 from openai import AsyncOpenAI
-from langchain_core.messages import HumanMessage
 from langchain.memory import ConversationBufferMemory
 from datetime import datetime
 from models.search import SearchParameters, ProductSearcher
-from models.product import Product
+from models.product import AnyProduct
 from models.conversation import ConversationContext, ConversationState
 from models.product_store import get_sorted_products, SortOption
+from models.catalog_search import CatalogSearcher
+from models.result_set import ResultSet
+from models.pagination import ProductPaginator
+from models.image_cache import ImageAnalysisCache
+from chatbot.session_store import SessionStore
+from chatbot.conversation_memory import TokenBudgetedMemory, format_messages
+from chatbot.speculative_search import SpeculativeSearch
+from chatbot.image_processor import ImageProcessor
+from models.tracing import instrumented_openai_http_client, span, traced
+from models.usage import get_usage_tracker, set_current_session
+
+# Kept at module level so re-indenting the call can't change the text sent
+IMAGE_ANALYSIS_PROMPT = """You are a shopping assistant specialized in analyzing product images.
+                        Your task is to describe the product in a natural, conversational way that can be used for product search.
+                        Focus on key details that would be useful for finding similar products:
+                        - Product type and key attributes (combined into a hyphenated base_query)
+                        - Potential use cases
+                        
+                        Format your response as a JSON object with:
+                        - base_query: Hyphenated string combining product type and key attributes (e.g., "black-leather-crossbody-handbag", "blue-running-shoes-with-mesh", "vintage-blue-denim-jacket")
+                        
+                        Example:
+                        {
+                            "base_query": "red-leather-crossbody-handbag-with-gold-chain",
+                        }
+                        """
 
 
 class TextMessageHandler:
     def __init__(self):
-        # Initialize OpenAI client
-        self.client = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"])
+        # Initialize OpenAI client, recording call latency and status
+        self.client = AsyncOpenAI(
+            api_key=os.environ["OPENAI_API_KEY"],
+            http_client=instrumented_openai_http_client(),
+        )
+
+        # Bounded store of conversation contexts and memory for each session
+        self.sessions = SessionStore.from_env()
+
+        # Token-budgeted history with rolling summaries (None in buffer mode)
+        self.budgeted_memory = TokenBudgetedMemory.from_env(self.client)
 
-        # Dictionary to store conversation contexts and memory for each session
-        self.sessions: Dict[
-            str, tuple[ConversationContext, ConversationBufferMemory]
-        ] = {}
+        # Initialize product searcher, with the local catalog if enabled
+        self.product_searcher = ProductSearcher(catalog=CatalogSearcher.from_env())
 
-        # Initialize product searcher
-        self.product_searcher = ProductSearcher()
+        # Searches started before state analysis finishes (None if disabled)
+        self.speculative_search = SpeculativeSearch.from_env(self.product_searcher)
+
+        # Streams uploads to disk and shrinks images for the vision model
+        self.image_processor = ImageProcessor.from_env()
+
+        # Analysis results of previously seen images (None if disabled)
+        self.image_cache = ImageAnalysisCache.from_env()
+
+        # Server-side candidates for "show more" pages (None if disabled)
+        self.paginator = ProductPaginator.from_env(self.product_searcher)
+
+        # Answer sort and narrower-filter follow-ups from the last result set
+        reuse = os.getenv("RESULT_REUSE", "true").lower()
+        self.result_reuse = reuse in ("1", "true", "yes")
+        self.reused_result_sets = 0
+        self.reuse_fallbacks = 0
 
     def _get_or_create_session(
         self, session_id: str
     ) -> tuple[ConversationContext, ConversationBufferMemory]:
         """Get or create a new session context and memory."""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = (
-                ConversationContext(),
-                ConversationBufferMemory(
-                    memory_key="chat_history", return_messages=True
-                ),
-            )
-        return self.sessions[session_id]
+        return self.sessions.get_or_create(session_id)
 
-    async def generate_product_response(
+    @traced("refine")
+    def _refine_results(
         self,
-        products: List[Product],
+        context: ConversationContext,
+        search_params: SearchParameters,
+        min_results: int,
+    ) -> Optional[List[AnyProduct]]:
+        """
+        Answer from the session's last result set if search_params only
+        changes the sort or narrows the filters. Returns all matching
+        products in order, or None if a new search is needed.
+        """
+        result_set = context._result_set
+        if not self.result_reuse or result_set is None:
+            return None
+        if not result_set.can_refine(search_params):
+            return None
+
+        products = result_set.refine(search_params)
+        if len(products) < min_results:
+            # Too few local matches; a new search may find more
+            self.reuse_fallbacks += 1
+            return None
+        self.reused_result_sets += 1
+        return products
+
+    def result_reuse_stats(self) -> Dict[str, any]:
+        """Return how many upstream searches result-set reuse avoided"""
+        if not self.result_reuse:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "avoided_upstream_searches": self.reused_result_sets,
+            "fallbacks": self.reuse_fallbacks,
+        }
+
+    async def more_products(
+        self, cursor: str, limit: Optional[int] = None
+    ) -> Optional[Dict[str, any]]:
+        """
+        Return the next page of products for a cursor from a chat response,
+        or None if the cursor is unknown or has expired
+        """
+        if not self.paginator:
+            return None
+        return await self.paginator.next_page(cursor, limit)
+
+    def _build_product_messages(
+        self,
+        products: List[AnyProduct],
         search_params: SearchParameters,
         initial_response: str,
-    ) -> str:
+    ) -> List[Dict[str, str]]:
         """
-        Use LLM to generate a personalized response explaining product recommendations
+        Build the prompt messages for the product recommendation response
         """
         # Create a summary of search parameters for context
         param_summary = {
@@ -134,19 +220,60 @@ class TextMessageHandler:
         
         DO NOT include any price, rating, store information, or additional details."""
 
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    @traced("generate_response")
+    async def generate_product_response(
+        self,
+        products: List[AnyProduct],
+        search_params: SearchParameters,
+        initial_response: str,
+    ) -> str:
+        """
+        Use LLM to generate a personalized response explaining product recommendations
+        """
         # Get response from OpenAI
         response = await self.client.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
+            messages=self._build_product_messages(
+                products, search_params, initial_response
+            ),
             temperature=0.7,
         )
+        get_usage_tracker().record_llm(response.model, response.usage)
 
         return response.choices[0].message.content
 
-    def failover_response(self, products: List[Product]) -> str:
+    async def stream_product_response(
+        self,
+        products: List[AnyProduct],
+        search_params: SearchParameters,
+        initial_response: str,
+    ) -> AsyncIterator[str]:
+        """
+        Same as generate_product_response, but yields text deltas as they arrive
+        """
+        stream = await self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=self._build_product_messages(
+                products, search_params, initial_response
+            ),
+            temperature=0.7,
+            stream=True,
+            # The final chunk then carries the token usage
+            stream_options={"include_usage": True},
+        )
+
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage:
+                get_usage_tracker().record_llm(chunk.model, chunk.usage)
+
+    def failover_response(self, products: List[AnyProduct]) -> str:
         """
         Format product results for chat display
         """
@@ -161,7 +288,9 @@ class TextMessageHandler:
 
         return formatted_text
 
-    async def handle_message(self, message: str, session_id: str) -> Dict:
+    async def handle_message(
+        self, message: str, session_id: str, search_backend: Optional[str] = None
+    ) -> Dict:
         """
         Main handler for processing text messages.
         Returns only the fields used by the frontend:
@@ -169,42 +298,94 @@ class TextMessageHandler:
         - timestamp: ISO format timestamp
         - products: List of products (if any)
         - search_params: Search parameters (if any)
+        - cursor: Cursor for more_products (if more products are available)
         """
+        response = None
+        async for event in self.stream_message(
+            message, session_id, stream_text=False, search_backend=search_backend
+        ):
+            if event["event"] == "done":
+                response = event["data"]
+        return response
+
+    async def stream_message(
+        self,
+        message: str,
+        session_id: str,
+        stream_text: bool = True,
+        search_backend: Optional[str] = None,
+    ) -> AsyncIterator[Dict]:
+        """
+        Process a text message and yield events as each stage completes:
+        - state: conversation state and acknowledgement text, after analysis
+        - products: products and search parameters, after the search
+        - text: response text deltas (only when stream_text is True)
+        - done: the full response, same shape as handle_message returns
+        """
+        speculation = None
+        context = None
+
+        def speculate(search_params: SearchParameters):
+            nonlocal speculation
+            if self.speculative_search and speculation is None:
+                # Refinements of the last result set don't need a search
+                result_set = context._result_set if context else None
+                if (
+                    self.result_reuse
+                    and result_set
+                    and result_set.can_refine(search_params)
+                ):
+                    return
+                speculation = self.speculative_search.start(
+                    search_params, search_backend
+                )
+
+        set_current_session(session_id)
         try:
             # Get or create session context and memory
             context, memory = self._get_or_create_session(session_id)
 
-            # Get chat history for context
-            chat_history = memory.load_memory_variables({})["chat_history"]
-            formatted_history = [
-                {
-                    "role": "user" if isinstance(msg, HumanMessage) else "assistant",
-                    "content": msg.content,
-                }
-                for msg in chat_history
-            ]
+            # Get chat history for context, within the token budget if enabled
+            with span("history"):
+                if self.budgeted_memory:
+                    await self.budgeted_memory.wait_for_compaction(context)
+                    formatted_history = self.budgeted_memory.build_history(
+                        memory, context
+                    )
+                else:
+                    chat_history = memory.load_memory_variables({})["chat_history"]
+                    formatted_history = format_messages(chat_history)
 
             # Analyze user input using conversation context
             (
                 new_state,
                 search_params,
                 initial_response,
-            ) = await context.analyze_user_input(message, formatted_history)
+            ) = await context.analyze_user_input(
+                message, formatted_history, on_search_params=speculate
+            )
 
             # Handle state transitions
             if new_state in [ConversationState.INITIAL, ConversationState.ENDED]:
                 # Clear conversation memory for new/reset search or ended conversation
                 memory.clear()
+                context._history_summary = ""
 
             # Update conversation memory with properly formatted messages
             memory.chat_memory.add_user_message(message)
 
+            yield {
+                "event": "state",
+                "data": {"state": new_state.value, "text": initial_response},
+            }
+
             # Base response structure
             response = {
                 "text": initial_response,
                 "timestamp": datetime.now().isoformat(),
                 "products": [],
                 "search_params": None,
+                "cursor": None,
             }
 
             # If we're ready to search
@@ -213,59 +394,157 @@ class TextMessageHandler:
                 and search_params
                 and search_params.base_query
             ):
-                # Get all matching products
-                products = await self.product_searcher.search_products(search_params)
-
                 limit_return = 3
-                # Sort products if sort option is specified
-                if search_params.sort_by:
-                    return_products = get_sorted_products(
-                        products=products,
-                        sort_by=search_params.sort_by,
-                        limit=limit_return,
+                # Re-sort or filter the last results for follow-up refinements
+                ranked = self._refine_results(context, search_params, limit_return)
+                if ranked is None:
+                    with span("search") as search_span:
+                        # Use the speculative search if it ran with these parameters
+                        products = None
+                        if speculation is not None:
+                            products = await self.speculative_search.take(
+                                speculation, search_params
+                            )
+                        search_span.attributes["speculative"] = products is not None
+                        if products is None:
+                            # Get all matching products
+                            products = await self.product_searcher.search_products(
+                                search_params, backend=search_backend
+                            )
+                    context._result_set = (
+                        ResultSet(search_params, products) if products else None
                     )
-                else:
-                    return_products = products[:limit_return]
 
-                try:
-                    # Try to generate personalized response using LLM
-                    response_text = await self.generate_product_response(
-                        return_products, search_params, initial_response
+                    # Sort products if sort option is specified, keeping the
+                    # whole order when later pages can be requested
+                    if search_params.sort_by:
+                        with span("sort"):
+                            ranked = get_sorted_products(
+                                products=products,
+                                sort_by=search_params.sort_by,
+                                limit=None if self.paginator else limit_return,
+                            )
+                    else:
+                        ranked = products
+                return_products = ranked[:limit_return]
+
+                if self.paginator:
+                    response["cursor"] = self.paginator.create(
+                        search_params, ranked, limit_return, search_backend
+                    )
+
+                with span("serialize"):
+                    response.update(
+                        {
+                            "products": [
+                                product.model_dump() for product in return_products
+                            ],
+                            "search_params": search_params.model_dump(),
+                        }
                     )
+                yield {
+                    "event": "products",
+                    "data": {
+                        "products": response["products"],
+                        "search_params": response["search_params"],
+                        "cursor": response["cursor"],
+                    },
+                }
+
+                usage = get_usage_tracker()
+                try:
+                    # Try to generate personalized response using LLM, unless
+                    # the session has used up its budget
+                    if usage.over_budget():
+                        usage.record_fallback("product_response")
+                        response_text = self.failover_response(return_products)
+                    elif stream_text:
+                        deltas = []
+                        with span("stream_response"):
+                            async for delta in self.stream_product_response(
+                                return_products, search_params, initial_response
+                            ):
+                                deltas.append(delta)
+                                yield {"event": "text", "data": {"delta": delta}}
+                        response_text = "".join(deltas)
+                    else:
+                        response_text = await self.generate_product_response(
+                            return_products, search_params, initial_response
+                        )
                 except Exception as e:
                     print(f"Error generating LLM response: {e}")
                     # Fall back to basic formatting if LLM fails
                     response_text = self.failover_response(return_products)
 
-                response.update(
-                    {
-                        "text": response_text,
-                        "products": [
-                            product.model_dump() for product in return_products
-                        ],
-                        "search_params": search_params.model_dump(),
-                    }
-                )
+                response["text"] = response_text
 
             # Update conversation memory with response
             memory.chat_memory.add_ai_message(response["text"])
-            return response
+            self.sessions.record_history(session_id)
+            if self.budgeted_memory:
+                self.budgeted_memory.schedule_compaction(memory, context)
+            yield {"event": "done", "data": response}
 
         except Exception as e:
             print(f"Error handling message: {e}")
             # Clear memory on error
             if session_id in self.sessions:
                 self.sessions[session_id][1].clear()
+                self.sessions[session_id][0]._history_summary = ""
+                self.sessions[session_id][0]._result_set = None
             error_response = "I apologize, but I encountered an error while processing your request. Let's start over. What are you looking for?"
-            return {
-                "text": error_response,
-                "timestamp": datetime.now().isoformat(),
-                "products": [],
-                "search_params": None,
+            yield {
+                "event": "done",
+                "data": {
+                    "text": error_response,
+                    "timestamp": datetime.now().isoformat(),
+                    "products": [],
+                    "search_params": None,
+                    "cursor": None,
+                },
             }
+        finally:
+            if speculation is not None:
+                self.speculative_search.discard(speculation)
+
+    @traced("vision")
+    async def _analyze_image(self, data_url: str) -> str:
+        """Ask the vision model for a hyphenated base_query describing the product"""
+        response = await self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": IMAGE_ANALYSIS_PROMPT},
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": "Please analyze this product image and describe what you see:",
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": data_url,
+                            },
+                        },
+                    ],
+                },
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=150,
+        )
+        get_usage_tracker().record_llm(response.model, response.usage)
+
+        # Extract the analysis from the response
+        result = json.loads(response.choices[0].message.content)
+        return result["base_query"]
 
     async def handle_image_search(
-        self, image_path: str, image_url: str, session_id: str
+        self,
+        image_path: str,
+        image_url: str,
+        session_id: str,
+        content_hash: Optional[str] = None,
     ) -> Dict[str, any]:
         """
         Analyze an image and extract detailed information about the product
@@ -273,71 +552,45 @@ class TextMessageHandler:
             image_path: Path to the uploaded image file
             image_url: URL to access the uploaded image
             session_id: Session ID for conversation context
+            content_hash: SHA-256 of the image, if already computed on upload
         Returns:
             Dict containing analysis results and image URL for display
         """
+        set_current_session(session_id)
         try:
             # Get or create session context and memory
             context, memory = self._get_or_create_session(session_id)
 
-            # Read and encode image file
-            with open(image_path, "rb") as image_file:
-                image_data = image_file.read()
-                base64_image = base64.b64encode(image_data).decode("utf-8")
-                data_url = f"data:image/jpeg;base64,{base64_image}"
-
-            # Get image analysis from OpenAI
-            response = await self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are a shopping assistant specialized in analyzing product images.
-                        Your task is to describe the product in a natural, conversational way that can be used for product search.
-                        Focus on key details that would be useful for finding similar products:
-                        - Product type and key attributes (combined into a hyphenated base_query)
-                        - Potential use cases
-                        
-                        Format your response as a JSON object with:
-                        - base_query: Hyphenated string combining product type and key attributes (e.g., "black-leather-crossbody-handbag", "blue-running-shoes-with-mesh", "vintage-blue-denim-jacket")
-                        
-                        Example:
-                        {
-                            "base_query": "red-leather-crossbody-handbag-with-gold-chain",
-                        }
-                        """,
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Please analyze this product image and describe what you see:",
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": data_url,
-                                },
-                            },
-                        ],
-                    },
-                ],
-                response_format={"type": "json_object"},
-                max_tokens=150,
-            )
+            # Reuse the analysis of identical or near-identical images
+            fingerprint = None
+            base_query = None
+            if self.image_cache:
+                with span("image_lookup") as lookup_span:
+                    fingerprint = await self.image_cache.fingerprint(
+                        image_path, content_hash
+                    )
+                    base_query = self.image_cache.lookup(*fingerprint)
+                    lookup_span.attributes["hit"] = base_query is not None
+
+            if base_query is None:
+                # Downscale and encode the image off the event loop
+                with span("encode_image"):
+                    data_url = await self.image_processor.to_data_url(image_path)
 
-            # Extract the analysis from the response
-            result = json.loads(response.choices[0].message.content)
+                # Get image analysis from OpenAI
+                base_query = await self._analyze_image(data_url)
+                if fingerprint:
+                    await self.image_cache.add(*fingerprint, base_query)
 
             # Format a natural language description from the hyphenated base_query
-            description = result["base_query"].replace("-", " ")
+            description = base_query.replace("-", " ")
 
             # Create a message indicating what was found in the image
             image_message = f"I found {description} in the image. Would you like me to search for similar products?"
 
             # Update conversation memory with assistant's response
             memory.chat_memory.add_ai_message(image_message)
+            self.sessions.record_history(session_id)
 
             return {
                 "success": True,
@@ -351,6 +604,7 @@ class TextMessageHandler:
             # Reset conversation and memory on error
             if session_id in self.sessions:
                 self.sessions[session_id][1].clear()
+                self.sessions[session_id][0]._history_summary = ""
             error_response = "I apologize, but I encountered an error while analyzing the image. Could you please try uploading it again or describe what you're looking for?"
             return {
                 "success": False,
@@ -0,0 +1,268 @@
+import os
+import re
+import time
+import asyncio
+import secrets
+import mimetypes
+from typing import Any, Dict, Optional, Tuple
+from fastapi import Request, UploadFile
+from fastapi.responses import FileResponse, Response
+from chatbot.image_processor import ImageProcessor
+
+# Content-addressed names: SHA-256 of the file plus its extension
+HASHED_NAME_PATTERN = re.compile(r"([0-9a-f]{64})\.(jpg|png|gif|webp)")
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+LEGACY_CACHE_CONTROL = "public, max-age=3600"
+
+
+class UploadStore:
+    """Content-addressed storage for uploaded images.
+
+    Files are named by the SHA-256 of their content and sharded into
+    subdirectories by the first two hex digits, so identical uploads are
+    stored once and a name never changes meaning. A background collector
+    deletes files not uploaded again within `max_age` seconds, then the
+    least recently uploaded files until the store is under `max_bytes`.
+    Files from before content addressing stay servable in the root
+    directory and are not collected.
+    """
+
+    def __init__(
+        self,
+        root: str = "uploads",
+        max_bytes: int = 1024 * 1024 * 1024,
+        max_age: float = 30 * 86400,
+        gc_interval: float = 3600,
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.gc_interval = gc_interval
+        self._collector: Optional[asyncio.Task] = None
+        os.makedirs(root, exist_ok=True)
+
+        # Counters
+        self.stored = 0
+        self.deduplicated = 0
+        self.collected_files = 0
+        self.collected_bytes = 0
+
+    @classmethod
+    def from_env(cls, root: str = "uploads") -> "UploadStore":
+        """Create a store from UPLOAD_* environment variables"""
+        return cls(
+            root,
+            max_bytes=int(os.getenv("UPLOAD_MAX_BYTES", str(1024 * 1024 * 1024))),
+            max_age=float(os.getenv("UPLOAD_MAX_AGE", str(30 * 86400))),
+            gc_interval=float(os.getenv("UPLOAD_GC_INTERVAL", "3600")),
+        )
+
+    def _shard_path(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name)
+
+    async def save(
+        self, upload: UploadFile, image_processor: ImageProcessor
+    ) -> Tuple[str, str, str]:
+        """
+        Store an upload under its content hash.
+
+        Returns:
+            Tuple of (path, name for /api/images, SHA-256 of the content)
+        """
+        temp = os.path.join(self.root, f".upload-{secrets.token_hex(8)}")
+        temp_path, digest = await image_processor.save_upload(upload, temp)
+        name = digest + os.path.splitext(temp_path)[1]
+        path = self._shard_path(name)
+        stored = await asyncio.to_thread(self._commit, temp_path, path)
+        if stored:
+            self.stored += 1
+        else:
+            self.deduplicated += 1
+        return path, name, digest
+
+    @staticmethod
+    def _commit(temp_path: str, path: str) -> bool:
+        """Move a finished upload into place. Returns False if it was a duplicate."""
+        try:
+            # Count a repeat upload as recent use for the age-based collector
+            os.utime(path)
+            os.remove(temp_path)
+            return False
+        except FileNotFoundError:
+            # Not stored yet, or collected since (the collector runs in a thread)
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        return True
+
+    def resolve(self, name: str) -> Optional[Tuple[str, str, bool]]:
+        """
+        Find a stored image by name.
+
+        Returns:
+            Tuple of (path, ETag, immutable), or None if there is no such image
+        """
+        match = HASHED_NAME_PATTERN.fullmatch(name)
+        if match:
+            path = self._shard_path(name)
+            if os.path.isfile(path):
+                return path, f'"{match.group(1)}"', True
+            return None
+
+        # Legacy timestamp-named uploads in the root directory
+        if name != os.path.basename(name) or name.startswith("."):
+            return None
+        path = os.path.join(self.root, name)
+        if not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        return path, f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"', False
+
+    def collect_garbage(self) -> Tuple[int, int]:
+        """Delete expired and over-budget files. Returns (files, bytes) deleted."""
+        files = []
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if len(shard) != 2 or not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                path = os.path.join(shard_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        # Oldest first: expire by age, then trim to the size budget
+        files.sort()
+        cutoff = time.time() - self.max_age
+        total = sum(size for _, size, _ in files)
+        deleted_files = deleted_bytes = 0
+        for mtime, size, path in files:
+            if mtime >= cutoff and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            deleted_files += 1
+            deleted_bytes += size
+
+        # Stale temp files from interrupted uploads
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".upload-") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+        self.collected_files += deleted_files
+        self.collected_bytes += deleted_bytes
+        return deleted_files, deleted_bytes
+
+    async def _collect_loop(self):
+        while True:
+            await asyncio.sleep(self.gc_interval)
+            try:
+                await asyncio.to_thread(self.collect_garbage)
+            except Exception as e:
+                print(f"Error collecting uploads: {e}")
+
+    def start_collector(self):
+        """Start the background garbage collector (called on app startup)"""
+        if self._collector is None or self._collector.done():
+            self._collector = asyncio.create_task(self._collect_loop())
+
+    async def stop_collector(self):
+        """Stop the background garbage collector (called on app shutdown)"""
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return storage and collection counters"""
+        return {
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "collected_files": self.collected_files,
+            "collected_bytes": self.collected_bytes,
+        }
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses weak comparison
+    return any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single byte range into inclusive (start, end). Returns None if
+    the header is not a single range, raises ValueError if unsatisfiable."""
+    match = RANGE_PATTERN.fullmatch(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _read_range(path: str, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start + 1)
+
+
+async def image_response(
+    request: Request, path: str, etag: str, immutable: bool
+) -> Response:
+    """Serve an image with a strong ETag, conditional GET and byte ranges"""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else LEGACY_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        size = os.path.getsize(path)
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return Response(
+                status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            content = await asyncio.to_thread(_read_range, path, start, end)
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return Response(
+                content=content,
+                status_code=206,
+                media_type=media_type,
+                headers=headers,
+            )
+
+    return FileResponse(path, media_type=media_type, headers=headers)
@@ -1,24 +1,84 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import (
+    FastAPI,
+    UploadFile,
+    File,
+    HTTPException,
+    Form,
+    Request,
+    Header,
+    Depends,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from typing import Optional
-import shutil
+from contextlib import asynccontextmanager
 import os
+import hmac
+import json
 from datetime import datetime
 from chatbot.text_handler import TextMessageHandler
+from chatbot.image_processor import UploadTooLarge, UnsupportedImage
+from chatbot.upload_store import UploadStore, image_response
+from models.llm_cache import get_llm_cache
+from models.semantic_cache import get_semantic_cache
+from models.intent_classifier import get_intent_classifier
+from models.embedding_cache import get_embeddings
+from models.metrics import get_metrics
+from models.tracing import OTLPExporter, TracingMiddleware, span
+from models.usage import get_usage_tracker
 from dotenv import load_dotenv
 from pydantic import BaseModel
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
 text_handler = TextMessageHandler()
 
-# Create uploads directory if it doesn't exist
+# Exports request traces to an OpenTelemetry collector (None if not configured)
+trace_exporter = OTLPExporter.from_env()
+
+# Bearer token for the usage endpoints; they are disabled without one
+USAGE_ADMIN_TOKEN = os.getenv("USAGE_ADMIN_TOKEN")
+
+
+def require_admin(authorization: Optional[str] = Header(None)):
+    """Allow only requests with the usage admin token"""
+    if not USAGE_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(authorization or "", f"Bearer {USAGE_ADMIN_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Admin token required")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared Serper connection pool and start the idle-session
+    # sweeper and upload collector for the lifetime of the app
+    await text_handler.product_searcher.start()
+    text_handler.sessions.start_sweeper()
+    upload_store.start_collector()
+    if trace_exporter:
+        trace_exporter.start()
+    yield
+    await upload_store.stop_collector()
+    await text_handler.sessions.stop_sweeper()
+    await text_handler.product_searcher.close()
+
+    # Persist the catalog and semantic cache indexes so they survive restarts
+    if text_handler.product_searcher.catalog:
+        text_handler.product_searcher.catalog.save()
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        semantic_cache.save()
+    if trace_exporter:
+        await trace_exporter.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Content-addressed image uploads (creates the directory if needed)
 UPLOAD_DIR = "uploads"
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR)
+upload_store = UploadStore.from_env(UPLOAD_DIR)
 
 # Configure CORS with more specific settings
 app.add_middleware(
@@ -32,10 +92,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Trace each request and record request metrics; added last so it is the
+# outermost middleware and its timings include everything below it
+slow_threshold = os.getenv("TRACE_SLOW_THRESHOLD")
+app.add_middleware(
+    TracingMiddleware,
+    exporter=trace_exporter,
+    slow_threshold=float(slow_threshold) if slow_threshold else None,
+)
+
 
 class ChatRequest(BaseModel):
     text: str
     sessionId: str
+    # Optional search backend override: "serper", "catalog" or "auto"
+    searchBackend: Optional[str] = None
+
+
+class MoreProductsRequest(BaseModel):
+    cursor: str
+    # Page size, defaults to the number of products in a chat response
+    limit: Optional[int] = None
 
 
 class Message:
@@ -67,12 +144,73 @@ async def chat_text_v2(message: ChatRequest):
     if not message.sessionId:
         raise HTTPException(status_code=400, detail="Session ID is required")
 
-    response = await text_handler.handle_message(message.text, message.sessionId)
+    if (
+        message.searchBackend
+        and message.searchBackend not in text_handler.product_searcher.BACKENDS
+    ):
+        raise HTTPException(status_code=400, detail="Unknown search backend")
+
+    response = await text_handler.handle_message(
+        message.text, message.sessionId, message.searchBackend
+    )
     return response
 
 
+@app.post("/api/chat/text/v2/stream")
+async def chat_text_v2_stream(message: ChatRequest):
+    """
+    Streaming variant of /api/chat/text/v2 using Server-Sent Events.
+    Emits state, products and text events as each stage completes, then a
+    final done event with the same shape as the /api/chat/text/v2 response.
+    """
+    if not message.text:
+        raise HTTPException(status_code=400, detail="Message text is required")
+    if not message.sessionId:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    if (
+        message.searchBackend
+        and message.searchBackend not in text_handler.product_searcher.BACKENDS
+    ):
+        raise HTTPException(status_code=400, detail="Unknown search backend")
+
+    async def event_stream():
+        events = text_handler.stream_message(
+            message.text, message.sessionId, search_backend=message.searchBackend
+        )
+        try:
+            async for event in events:
+                data = json.dumps(jsonable_encoder(event["data"]))
+                yield f"event: {event['event']}\ndata: {data}\n\n"
+        finally:
+            # Close the stages (and their spans) when the client disconnects
+            await events.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/chat/products/more")
+async def more_products(request: MoreProductsRequest):
+    """
+    Next page of products for a cursor from a chat response, served from
+    the candidates kept server-side without another LLM or search call
+    """
+    if request.limit is not None and not 1 <= request.limit <= 60:
+        raise HTTPException(status_code=400, detail="Limit must be between 1 and 60")
+
+    page = await text_handler.more_products(request.cursor, request.limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Cursor not found or expired")
+    return page
+
+
 @app.post("/api/chat/image")
 async def chat_image(
+    request: Request,
     image: UploadFile = File(...),
     sessionId: str = Form(...),  # Use Form to get the sessionId from form data
 ):
@@ -82,20 +220,34 @@ async def chat_image(
     if not sessionId:
         raise HTTPException(status_code=400, detail="Session ID is required")
 
-    # Save the uploaded image
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    file_extension = os.path.splitext(image.filename)[1]
-    filename = f"image_{timestamp}{file_extension}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
+    # Reject obviously oversized requests before copying anything
+    image_processor = text_handler.image_processor
+    content_length = request.headers.get("content-length", "")
+    if (
+        content_length.isdigit()
+        and int(content_length) > image_processor.max_upload_bytes + 64 * 1024
+    ):
+        raise HTTPException(status_code=413, detail="Image is too large")
 
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(image.file, buffer)
+    # Save the uploaded image under its content hash, streaming it to disk
+    # off the event loop
+    try:
+        with span("save_upload"):
+            file_path, filename, content_hash = await upload_store.save(
+                image, image_processor
+            )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedImage as e:
+        raise HTTPException(status_code=415, detail=str(e))
 
     # Generate image URL
     image_url = f"/api/images/{filename}"
 
     # Get image analysis
-    response = await text_handler.handle_image_search(file_path, image_url, sessionId)
+    response = await text_handler.handle_image_search(
+        file_path, image_url, sessionId, content_hash
+    )
 
     # Add timestamp to response
     response["timestamp"] = datetime.now().isoformat()
@@ -104,8 +256,100 @@ async def chat_image(
 
 
 @app.get("/api/images/{image_name}")
-async def get_image(image_name: str):
-    image_path = os.path.join(UPLOAD_DIR, image_name)
-    if os.path.exists(image_path):
-        return FileResponse(image_path)
-    raise HTTPException(status_code=404, detail="Image not found")
+async def get_image(image_name: str, request: Request):
+    """
+    Serve an uploaded image. Content-addressed images never change, so they
+    are cached as immutable; conditional and range requests are supported.
+    """
+    resolved = upload_store.resolve(image_name)
+    if resolved is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return await image_response(request, *resolved)
+
+
+@app.get("/api/stats")
+async def get_stats():
+    """
+    Runtime statistics for capacity planning
+    """
+    llm_cache = get_llm_cache()
+    semantic_cache = get_semantic_cache()
+    intent_classifier = get_intent_classifier()
+    return {
+        "sessions": text_handler.sessions.stats(),
+        "memory": (
+            text_handler.budgeted_memory.stats()
+            if text_handler.budgeted_memory
+            else {"enabled": False}
+        ),
+        "http_pool": text_handler.product_searcher.pool_stats(),
+        "search": text_handler.product_searcher.search_stats(),
+        "search_cache": text_handler.product_searcher.cache_stats(),
+        "catalog": (
+            text_handler.product_searcher.catalog.stats()
+            if text_handler.product_searcher.catalog
+            else {"enabled": False}
+        ),
+        "llm_cache": llm_cache.stats() if llm_cache else {"enabled": False},
+        "semantic_cache": (
+            semantic_cache.stats() if semantic_cache else {"enabled": False}
+        ),
+        "embedding_cache": get_embeddings().stats(),
+        "speculation": (
+            text_handler.speculative_search.stats()
+            if text_handler.speculative_search
+            else {"enabled": False}
+        ),
+        "images": text_handler.image_processor.stats(),
+        "uploads": upload_store.stats(),
+        "image_cache": (
+            text_handler.image_cache.stats()
+            if text_handler.image_cache
+            else {"enabled": False}
+        ),
+        "result_reuse": text_handler.result_reuse_stats(),
+        "pagination": (
+            text_handler.paginator.stats()
+            if text_handler.paginator
+            else {"enabled": False}
+        ),
+        "fast_path": (
+            intent_classifier.stats() if intent_classifier else {"enabled": False}
+        ),
+        "tracing": trace_exporter.stats() if trace_exporter else {"enabled": False},
+        "usage": get_usage_tracker().stats(),
+    }
+
+
+@app.get("/api/usage", dependencies=[Depends(require_admin)])
+async def get_usage(top_sessions: int = 20):
+    """
+    Token, Serper call and estimated cost totals by endpoint, stage and
+    model, and the costliest sessions (labeled by a hash of their ID)
+    """
+    if not 0 <= top_sessions <= 1000:
+        raise HTTPException(
+            status_code=400, detail="top_sessions must be between 0 and 1000"
+        )
+    return get_usage_tracker().report(top_sessions)
+
+
+@app.get("/api/usage/sessions/{session_id}", dependencies=[Depends(require_admin)])
+async def get_session_usage(session_id: str):
+    """Token, Serper call and estimated cost totals for one session"""
+    usage = get_usage_tracker().session(session_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="No usage recorded for session")
+    return usage
+
+
+@app.get("/metrics")
+async def get_prometheus_metrics():
+    """
+    Request, stage and upstream metrics, plus the numeric /api/stats values,
+    in the Prometheus text format
+    """
+    return PlainTextResponse(
+        get_metrics().render(await get_stats()),
+        media_type="text/plain; version=0.0.4",
+    )
@@ -0,0 +1,111 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry TTL and a stale-while-revalidate window.
+
+    Entries are fresh for `ttl` seconds. After that they may still be served
+    as stale for another `stale_ttl` seconds while the caller refreshes them,
+    and are dropped once both windows have passed.
+    """
+
+    def __init__(self, max_size: int, ttl: float, stale_ttl: float = 0.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # key -> (value, fresh_until, stale_until)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float, float]]" = (
+            OrderedDict()
+        )
+
+        # Counters
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Tuple[Optional[Any], bool]:
+        """Look up a key.
+
+        Returns:
+            Tuple of (value, is_stale). value is None on a miss.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, False
+
+        value, fresh_until, stale_until = entry
+        now = time.monotonic()
+        if now >= stale_until:
+            # Past both the fresh and the stale window
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None, False
+
+        self._entries.move_to_end(key)
+        if now >= fresh_until:
+            self.stale_hits += 1
+            return value, True
+
+        self.hits += 1
+        return value, False
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Insert or replace a key, evicting least recently used entries if full"""
+        if self.max_size <= 0:
+            return
+
+        ttl = self.ttl if ttl is None else ttl
+        now = time.monotonic()
+        self._entries[key] = (value, now + ttl, now + ttl + self.stale_ttl)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def peek(self, key: Hashable) -> Tuple[Optional[Any], bool]:
+        """Like get(), but without counting the lookup or refreshing LRU order"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+        value, fresh_until, stale_until = entry
+        now = time.monotonic()
+        if now >= stale_until:
+            return None, False
+        return value, now >= fresh_until
+
+    def pop(self, key: Hashable):
+        """Remove a key if present"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all entries"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": (
+                (self.hits + self.stale_hits) / lookups if lookups else 0.0
+            ),
+        }
@@ -0,0 +1,329 @@
+import os
+import re
+import math
+import asyncio
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from .product import Product
+from .product_store import ProductStore, product_key, _key_to_id
+from .search import SearchParameters, SearchFilters
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens; hyphenated queries split into words"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class _GrowableArray:
+    """Append-only numpy column that doubles its capacity as it grows"""
+
+    def __init__(self, dtype, fill):
+        self.fill = fill
+        self.data = np.full(1024, fill, dtype=dtype)
+        self.size = 0
+
+    def append(self, value) -> int:
+        if self.size == len(self.data):
+            grown = np.full(len(self.data) * 2, self.fill, dtype=self.data.dtype)
+            grown[: self.size] = self.data
+            self.data = grown
+        self.data[self.size] = value
+        self.size += 1
+        return self.size - 1
+
+    def view(self) -> np.ndarray:
+        return self.data[: self.size]
+
+
+class BM25Index:
+    """Inverted index with BM25 scoring and numeric columns for filtering.
+
+    Rows are append-only: an upsert tombstones the product's old row and
+    appends a new one, and a delete only tombstones. Price and rating are
+    kept as numeric columns with sort orders, so range filters are two
+    binary searches. Rows appended since a column was sorted are compared
+    directly, and the sort order is only rebuilt once they grow past
+    `resort_fraction` of the sorted rows.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, resort_fraction: float = 0.1):
+        self.k1 = k1
+        self.b = b
+        self.resort_fraction = resort_fraction
+
+        self.row_ids: List[int] = []  # row -> product id
+        self.row_of: Dict[int, int] = {}  # live product id -> row
+        self.alive = _GrowableArray(np.bool_, False)
+        self.doc_len = _GrowableArray(np.float32, 0)
+        self.price = _GrowableArray(np.float64, np.nan)
+        self.rating = _GrowableArray(np.float64, np.nan)
+        self.total_len = 0.0
+
+        # term -> (rows, term frequencies), plus frozen numpy copies
+        self.postings: Dict[str, Tuple[List[int], List[int]]] = defaultdict(
+            lambda: ([], [])
+        )
+        self._frozen: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        # column -> (row order, sorted values) over the first len(order) rows
+        self._sorted: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    def add(self, product_id: int, text: str, price: float, rating: Optional[float]):
+        """Index a product, replacing any previous row for the same id"""
+        self.remove(product_id)
+
+        tokens = tokenize(text)
+        row = self.alive.append(True)
+        self.doc_len.append(len(tokens))
+        self.price.append(price if price else np.nan)
+        self.rating.append(rating if rating is not None else np.nan)
+        self.row_ids.append(product_id)
+        self.row_of[product_id] = row
+        self.total_len += len(tokens)
+
+        counts: Dict[str, int] = defaultdict(int)
+        for token in tokens:
+            counts[token] += 1
+        for token, count in counts.items():
+            rows, tfs = self.postings[token]
+            rows.append(row)
+            tfs.append(count)
+            self._frozen.pop(token, None)
+
+    def remove(self, product_id: int):
+        """Tombstone a product's row"""
+        row = self.row_of.pop(product_id, None)
+        if row is not None:
+            self.alive.data[row] = False
+            self.total_len -= float(self.doc_len.data[row])
+
+    def _term(self, token: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        frozen = self._frozen.get(token)
+        if frozen is None:
+            if token not in self.postings:
+                return None
+            rows, tfs = self.postings[token]
+            frozen = (np.array(rows, dtype=np.int64), np.array(tfs, dtype=np.float32))
+            self._frozen[token] = frozen
+        return frozen
+
+    def _sorted_column(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return (row order, sorted values) for a prefix of a numeric column,
+        NaNs last. Rows past the prefix haven't been sorted in yet.
+        """
+        cached = self._sorted.get(name)
+        if cached is None or self.alive.size - len(cached[0]) > max(
+            1024, self.resort_fraction * len(cached[0])
+        ):
+            values = getattr(self, name).view()
+            order = np.argsort(values, kind="stable")
+            cached = (order, values[order])
+            self._sorted[name] = cached
+        return cached
+
+    def _range_mask(
+        self, name: str, low: Optional[float], high: Optional[float]
+    ) -> np.ndarray:
+        order, values = self._sorted_column(name)
+        # NaNs sort last, so the searchable prefix ends at the first NaN
+        valid = len(values) - int(np.isnan(values).sum())
+        start = 0 if low is None else np.searchsorted(values[:valid], low, "left")
+        end = valid if high is None else np.searchsorted(values[:valid], high, "right")
+        mask = np.zeros(self.alive.size, dtype=np.bool_)
+        mask[order[start:end]] = True
+
+        # Rows appended since the sort; NaN fails both comparisons
+        tail = getattr(self, name).view()[len(order) :]
+        if len(tail):
+            tail_mask = np.ones(len(tail), dtype=np.bool_)
+            if low is not None:
+                tail_mask &= tail >= low
+            if high is not None:
+                tail_mask &= tail <= high
+            if low is None and high is None:
+                tail_mask &= ~np.isnan(tail)
+            mask[len(order) :] = tail_mask
+        return mask
+
+    def filter_mask(self, filters: Optional[SearchFilters]) -> np.ndarray:
+        """Live rows that satisfy the price_range and min_rating filters"""
+        mask = self.alive.view().copy()
+        if filters is None:
+            return mask
+        if filters.price_range and (
+            filters.price_range.min is not None or filters.price_range.max is not None
+        ):
+            mask &= self._range_mask(
+                "price", filters.price_range.min, filters.price_range.max
+            )
+        if filters.min_rating:
+            mask &= self._range_mask("rating", float(filters.min_rating), None)
+        return mask
+
+    def search(self, query: str, k: int, mask: np.ndarray) -> List[int]:
+        """Return up to k rows by BM25 score among rows allowed by mask"""
+        n = self.alive.size
+        live = len(self.row_of)
+        if not live:
+            return []
+
+        avg_len = self.total_len / live if self.total_len else 1.0
+        doc_len = self.doc_len.view()
+        scores = np.zeros(n, dtype=np.float32)
+        for token in set(tokenize(query)):
+            term = self._term(token)
+            if term is None:
+                continue
+            rows, tfs = term
+            df = len(rows)
+            idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_len[rows] / avg_len)
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+        candidates = np.flatnonzero(mask & (scores > 0))
+        if len(candidates) > k:
+            top = np.argpartition(-scores[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        return candidates[np.argsort(-scores[candidates], kind="stable")].tolist()
+
+
+class CatalogSearcher:
+    """Local product search over products collected from past Serper results.
+
+    Combines BM25 over product text with FAISS vector search from
+    ProductStore using reciprocal-rank fusion, after applying price_range
+    and min_rating filters. Has the same search_products interface as
+    ProductSearcher.
+    """
+
+    def __init__(
+        self,
+        store: Optional[ProductStore] = None,
+        candidates: int = 200,
+        rrf_k: int = 60,
+    ):
+        self.store = (
+            store
+            if store is not None
+            else ProductStore(os.getenv("CATALOG_INDEX_PATH") or None)
+        )
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.bm25 = BM25Index()
+        # Guards the store and text index; embedding calls happen outside it
+        self._lock = threading.Lock()
+
+        # Counters
+        self.searches = 0
+        self.vector_errors = 0
+
+        # Rebuild the text index from products already in the store
+        for product_id, product in self.store.products.items():
+            self._index(product_id, product)
+
+    @classmethod
+    def from_env(cls) -> Optional["CatalogSearcher"]:
+        """Create a catalog from CATALOG_* environment variables, or None if disabled"""
+        if os.getenv("CATALOG_ENABLED", "false").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(candidates=int(os.getenv("CATALOG_CANDIDATES", "200")))
+
+    def __len__(self) -> int:
+        return len(self.bm25)
+
+    def _index(self, product_id: int, product: Product):
+        text = f"{product.title} {product.source}"
+        self.bm25.add(product_id, text, product.price, product.rating)
+
+    def add_products(self, products: List[Product]):
+        """Add products to the vector store and the text index"""
+        # Embed first so the store's add under the lock hits the embedding cache
+        self.store.embeddings.embed_documents(
+            [self.store._create_product_document(product) for product in products]
+        )
+        with self._lock:
+            self.store.add_products(products)
+            for product in products:
+                self._index(_key_to_id(product_key(product)), product)
+
+    async def collect(self, products: List[Product]):
+        """Add upstream results to the catalog off the event loop"""
+        try:
+            await asyncio.to_thread(self.add_products, products)
+        except Exception as e:
+            print(f"Error adding products to catalog: {e}")
+
+    def save(self):
+        """Persist the vector store (the text index is rebuilt on load)"""
+        self.store.save()
+
+    def _embed_query(self, query: str) -> Optional[np.ndarray]:
+        if self.store.index is None:
+            return None
+        try:
+            return self.store._embed_query(query)
+        except Exception as e:
+            print(f"Error embedding catalog query: {e}")
+            self.vector_errors += 1
+            return None
+
+    def _vector_rows(self, vector: Optional[np.ndarray], mask: np.ndarray) -> List[int]:
+        index = self.store.index
+        if vector is None or index is None or index.ntotal == 0:
+            return []
+
+        # Over-fetch so filtered-out neighbors don't empty the result
+        k = min(index.ntotal, self.candidates * 4)
+        _, ids = index.search(vector, k)
+        rows = []
+        for product_id in ids[0]:
+            row = self.bm25.row_of.get(int(product_id))
+            if row is not None and mask[row]:
+                rows.append(row)
+                if len(rows) == self.candidates:
+                    break
+        return rows
+
+    def search(
+        self, query: str, filters: Optional[SearchFilters], k: int
+    ) -> List[Product]:
+        """Fuse BM25 and vector rankings with reciprocal-rank fusion"""
+        vector = self._embed_query(query)
+
+        with self._lock:
+            mask = self.bm25.filter_mask(filters)
+            rankings = [
+                self.bm25.search(query, self.candidates, mask),
+                self._vector_rows(vector, mask),
+            ]
+
+            fused: Dict[int, float] = defaultdict(float)
+            for ranking in rankings:
+                for rank, row in enumerate(ranking):
+                    fused[row] += 1.0 / (self.rrf_k + rank + 1)
+            rows = sorted(fused, key=fused.get, reverse=True)[:k]
+            return [self.store.products[self.bm25.row_ids[row]] for row in rows]
+
+    async def search_products(
+        self, search_params: SearchParameters, k: int = 60
+    ) -> List[Product]:
+        """Search the local catalog with the same parameters as ProductSearcher"""
+        self.searches += 1
+        query = search_params.build_search_query().replace("-", " ")
+        return await asyncio.to_thread(self.search, query, search_params.filters, k)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return catalog size and search counters"""
+        return {
+            "enabled": True,
+            "products": len(self),
+            "searches": self.searches,
+            "vector_errors": self.vector_errors,
+        }
@@ -1,4 +1,4 @@
-from typing import Optional, Dict, List, Tuple
+from typing import Callable, Optional, Dict, List, Tuple
 from pydantic import BaseModel, Field
 from enum import Enum
 import json
@@ -6,6 +6,12 @@ from openai import AsyncOpenAI
 import os
 from .search import SearchParameters
 from .product_store import SortOption
+from .llm_cache import get_llm_cache
+from .semantic_cache import get_semantic_cache
+from .intent_classifier import get_intent_classifier
+from .result_set import ResultSet
+from .tracing import instrumented_openai_http_client, traced
+from .usage import get_usage_tracker
 import asyncio
 
 
@@ -16,17 +22,41 @@ class ConversationState(Enum):
     ENDED = "ended"  # Conversation has ended
 
 
+class ConversationAnalysis(BaseModel):
+    """Combined result of state classification and parameter extraction"""
+
+    state: ConversationState = Field(..., description="The new conversation state")
+    response: str = Field(..., description="Response message to send to the user")
+    search_params: Optional[SearchParameters] = Field(
+        None, description="Search parameters, null if no product has been mentioned"
+    )
+
+
 class ConversationContext(BaseModel):
     """Tracks the state and collected information during a search conversation"""
 
     # OpenAI client for analysis
     _client: Optional[AsyncOpenAI] = None
-
+    # Parameters of the last search, used by the fast-path classifier
+    _last_search_params: Optional[SearchParameters] = None
+    # Rolling summary of turns folded out of the memory window
+    _history_summary: str = ""
+    _compaction_task: Optional[asyncio.Task] = None
+    # Products of the last upstream search, reused for sort/filter follow-ups
+    _result_set: Optional[ResultSet] = None
+
+    @traced("analyze")
     async def analyze_user_input(
-        self, message: str, chat_history: List[Dict[str, str]]
+        self,
+        message: str,
+        chat_history: List[Dict[str, str]],
+        on_search_params: Optional[Callable[[SearchParameters], None]] = None,
     ) -> Tuple[ConversationState, Optional[SearchParameters], str]:
         """Analyze user input and return the new state, search parameters, and response.
 
+        on_search_params, if given, is called as soon as parameter extraction
+        returns a base_query, possibly before the state analysis finishes.
+
         Returns:
             Tuple containing:
             - ConversationState: The new conversation state
@@ -35,35 +65,64 @@ class ConversationContext(BaseModel):
         """
         try:
             if not self._client:
-                self._client = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"])
-
-            # Run state analysis and parameter extraction in parallel
-            state_task = asyncio.create_task(
-                self._analyze_conversation_state(message, chat_history)
-            )
-            params_task = asyncio.create_task(
-                self._extract_search_parameters(message, chat_history)
-            )
-
-            # Wait for both tasks to complete
-            state_result, search_params = await asyncio.gather(
-                state_task, params_task, return_exceptions=True
-            )
-
-            # Handle any exceptions from the parallel tasks
-            if isinstance(state_result, Exception):
-                print(f"Error in state analysis: {state_result}")
-                state_result = {
-                    "state": "collecting_info",
-                    "response": "I'm having trouble understanding that. Could you please rephrase?",
-                }
-
-            if isinstance(search_params, Exception):
-                print(f"Error in parameter extraction: {search_params}")
-                search_params = SearchParameters(base_query=None)
+                self._client = AsyncOpenAI(
+                    api_key=os.environ["OPENAI_API_KEY"],
+                    http_client=instrumented_openai_http_client(),
+                )
+
+            single_call = os.getenv("ANALYSIS_MODE", "two_call") == "single_call"
+            # Sessions over their usage budget send the history once, not twice
+            usage_tracker = get_usage_tracker()
+            over_budget = not single_call and usage_tracker.over_budget()
+
+            # Resolve unambiguous turns (greetings, goodbyes, sort tweaks)
+            # without calling the LLM
+            classifier = get_intent_classifier()
+            decision = None
+            state_result = None
+            if classifier:
+                decision = classifier.classify(message, self._last_search_params)
+                if classifier.should_resolve(decision):
+                    classifier.record_resolved(llm_calls=1 if single_call else 2)
+                    state_result = {
+                        "state": decision.state,
+                        "response": decision.response,
+                    }
+                    search_params = decision.search_params
+
+            # Single-call mode merges both analyses into one request and falls
+            # back to the two parallel calls if it fails
+            if state_result is None and (single_call or over_budget):
+                if over_budget:
+                    usage_tracker.record_fallback("single_call_analysis")
+                try:
+                    state_result, search_params = await self._analyze_single_call(
+                        message, chat_history
+                    )
+                except Exception as e:
+                    print(f"Error in single-call analysis, using two calls: {e}")
+
+            if state_result is None:
+                state_result, search_params = await self._analyze_two_calls(
+                    message, chat_history, on_search_params
+                )
+
+            if classifier and classifier.mode == "shadow":
+                classifier.record_shadow(
+                    decision, state_result["state"], search_params, message
+                )
 
             # Get the new state
             new_state = ConversationState(state_result["state"])
+            if new_state in [ConversationState.INITIAL, ConversationState.ENDED]:
+                self._last_search_params = None
+                self._result_set = None
+            elif (
+                new_state == ConversationState.READY_TO_SEARCH
+                and search_params
+                and search_params.base_query
+            ):
+                self._last_search_params = search_params
             print(f"State Result: {state_result}")
             print(f"Search params: {search_params}")
 
@@ -104,6 +163,121 @@ class ConversationContext(BaseModel):
                 "I'm having trouble understanding that. Could you please rephrase?",
             )
 
+    async def _analyze_two_calls(
+        self,
+        message: str,
+        chat_history: List[Dict[str, str]],
+        on_search_params: Optional[Callable[[SearchParameters], None]] = None,
+    ) -> Tuple[Dict, Optional[SearchParameters]]:
+        """Run state analysis and parameter extraction as two parallel requests"""
+
+        async def extract_search_parameters() -> SearchParameters:
+            search_params = await self._extract_search_parameters(message, chat_history)
+            if on_search_params and search_params and search_params.base_query:
+                try:
+                    on_search_params(search_params)
+                except Exception as e:
+                    print(f"Error in search parameters callback: {e}")
+            return search_params
+
+        # Run state analysis and parameter extraction in parallel
+        state_task = asyncio.create_task(
+            self._analyze_conversation_state(message, chat_history)
+        )
+        params_task = asyncio.create_task(extract_search_parameters())
+
+        # Wait for both tasks to complete
+        state_result, search_params = await asyncio.gather(
+            state_task, params_task, return_exceptions=True
+        )
+
+        # Handle any exceptions from the parallel tasks
+        if isinstance(state_result, Exception):
+            print(f"Error in state analysis: {state_result}")
+            state_result = {
+                "state": "collecting_info",
+                "response": "I'm having trouble understanding that. Could you please rephrase?",
+            }
+
+        if isinstance(search_params, Exception):
+            print(f"Error in parameter extraction: {search_params}")
+            search_params = SearchParameters(base_query=None)
+
+        return state_result, search_params
+
+    @traced("single_call_analysis")
+    async def _analyze_single_call(
+        self, message: str, chat_history: List[Dict[str, str]]
+    ) -> Tuple[Dict, Optional[SearchParameters]]:
+        """Determine state, response and search parameters in one structured request"""
+
+        system_prompt = """You are a shopping assistant. For each user message, determine the conversation state,
+        write your response to the user, and extract structured search parameters, all in one answer.
+
+        STATE GUIDELINES:
+        - "collecting_info": greetings, general shopping help, or no product info at all
+          → provide a welcoming response asking what they're looking for
+        - "ready_to_search": user gives ANY specific product name/category (e.g. "pink dress shoes", "laptop"),
+          clear product attributes (e.g. "size 4", "for girls") or preferences (e.g. "highly rated", "under $50")
+          → respond with enthusiasm about finding matching items
+        - "initial": dissatisfaction or an explicit new search request
+          → ask what they'd like to look for instead
+        - "ended": ONLY when the user explicitly ends the conversation (e.g. "goodbye", "thanks, bye")
+          → do NOT end just because user shows interest in a product
+
+        SEARCH PARAMETER GUIDELINES (search_params, null if no product has been mentioned):
+        - base_query: main search term combining attributes with hyphens, e.g. "black-leather-laptop-bag-15-inch"
+        - filters.price_range: "under $50" → max: 50, "$100-200" → min: 100, max: 200,
+          "budget" → max: 50, "premium" → min: 300
+        - filters.min_rating: "4 stars" → 4.0, "best" → 4.0, "good" → 3.0
+        - filters.free_shipping / filters.free_returns: only if explicitly requested
+        - sort_by: ONLY when user EXPLICITLY requests a sort order, otherwise null (never "relevance"):
+          "sort by rating"/"best rated" → "rating", "most reviews" → "rating_count",
+          "most popular/recommended" → "rating_weighted", "show cheapest first" → "price_low",
+          "most expensive first" → "price_high"
+
+        Consider the entire conversation context: maintain previously specified preferences
+        unless explicitly changed, and combine related information from multiple messages."""
+
+        messages = [{"role": "system", "content": system_prompt}]
+
+        # Add chat history and current message
+        messages.extend(chat_history)
+        messages.append({"role": "user", "content": message})
+
+        model = "gpt-4o-mini"
+        temperature = 0.7
+
+        # Serve identical prompts from the response cache if enabled
+        cache = get_llm_cache()
+        analysis = None
+        if cache:
+            temperature = cache.temperature(temperature)
+            cache_key = cache.make_key(
+                model, messages, ConversationAnalysis, temperature
+            )
+            cached = await cache.get(cache_key)
+            if cached is not None:
+                analysis = ConversationAnalysis.model_validate_json(cached)
+
+        if analysis is None:
+            response = await self._client.beta.chat.completions.parse(
+                model=model,
+                messages=messages,
+                response_format=ConversationAnalysis,
+                temperature=temperature,
+            )
+            get_usage_tracker().record_llm(response.model, response.usage)
+            analysis = response.choices[0].message.parsed
+            if analysis is None:
+                raise ValueError("Model returned no parsed analysis")
+            if cache:
+                await cache.set(cache_key, analysis.model_dump_json())
+
+        state_result = {"state": analysis.state.value, "response": analysis.response}
+        return state_result, analysis.search_params
+
+    @traced("state_analysis")
     async def _analyze_conversation_state(
         self, message: str, chat_history: List[Dict[str, str]]
     ) -> Dict:
@@ -166,15 +340,34 @@ class ConversationContext(BaseModel):
         messages.extend(chat_history)
         messages.append({"role": "user", "content": message})
 
+        model = "gpt-4o-mini"
+        response_format = {"type": "json_object"}
+        temperature = 0.7
+
+        # Serve identical prompts from the response cache if enabled
+        cache = get_llm_cache()
+        if cache:
+            temperature = cache.temperature(temperature)
+            cache_key = cache.make_key(model, messages, response_format, temperature)
+            cached = await cache.get(cache_key)
+            if cached is not None:
+                return json.loads(cached)
+
         response = await self._client.chat.completions.create(
-            model="gpt-4o-mini",
+            model=model,
             messages=messages,
-            response_format={"type": "json_object"},
-            temperature=0.7,
+            response_format=response_format,
+            temperature=temperature,
         )
+        get_usage_tracker().record_llm(response.model, response.usage)
 
-        return json.loads(response.choices[0].message.content)
+        content = response.choices[0].message.content
+        result = json.loads(content)
+        if cache:
+            await cache.set(cache_key, content)
+        return result
 
+    @traced("parameter_extraction")
     async def _extract_search_parameters(
         self, message: str, chat_history: List[Dict[str, str]]
     ) -> SearchParameters:
@@ -236,14 +429,47 @@ class ConversationContext(BaseModel):
 
             # print(f"_extract_search_parameters-Messages: {messages}")
 
+            model = "gpt-4o-mini"
+            temperature = 0.7
+
+            # Serve identical prompts from the response cache if enabled
+            cache = get_llm_cache()
+            if cache:
+                temperature = cache.temperature(temperature)
+                cache_key = cache.make_key(
+                    model, messages, SearchParameters, temperature
+                )
+                cached = await cache.get(cache_key)
+                if cached is not None:
+                    return SearchParameters.model_validate_json(cached)
+
+            # First-turn messages can reuse parameters extracted for a paraphrase
+            semantic_cache = get_semantic_cache() if not chat_history else None
+            embedding = None
+            if semantic_cache:
+                try:
+                    embedding = await semantic_cache.embed(message)
+                    cached_params = semantic_cache.lookup(embedding, message)
+                    if cached_params is not None:
+                        return cached_params
+                except Exception as e:
+                    print(f"Error in semantic cache lookup: {e}")
+                    semantic_cache.errors += 1
+
             response = await self._client.beta.chat.completions.parse(
-                model="gpt-4o-mini",
+                model=model,
                 messages=messages,
                 response_format=SearchParameters,
-                temperature=0.7,
+                temperature=temperature,
             )
-
-            return response.choices[0].message.parsed
+            get_usage_tracker().record_llm(response.model, response.usage)
+
+            search_params = response.choices[0].message.parsed
+            if cache and search_params is not None:
+                await cache.set(cache_key, search_params.model_dump_json())
+            if embedding is not None and search_params and search_params.base_query:
+                semantic_cache.add(embedding, message, search_params)
+            return search_params
 
         except Exception as e:
             print(f"Error extracting search parameters: {e}")
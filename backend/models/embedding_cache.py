@@ -0,0 +1,295 @@
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from .tracing import upstream_call
+from .usage import get_usage_tracker
+
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed cache in front of an embeddings model.
+
+    Vectors are keyed by a hash of (model, text). With `path` set they are
+    stored as one float32 array file (`embeddings.f32`, one row per entry)
+    plus a key file (`embeddings.keys`, one hex key per line, same order)
+    and a meta file with the vector dimension, and the array is
+    memory-mapped so cached vectors are read without copying the file into
+    memory. Without `path`, at most `max_memory_entries` vectors are kept
+    in memory, least recently used first out.
+
+    Misses from one call are deduplicated, split into batches of up to
+    `batch_size` texts (one API request each) and sent with at most
+    `max_concurrency` requests in flight.
+    """
+
+    VECTORS_FILE = "embeddings.f32"
+    KEYS_FILE = "embeddings.keys"
+    META_FILE = "embeddings.json"
+    # 64 hex digits and a newline
+    KEY_LINE_BYTES = 65
+
+    def __init__(
+        self,
+        embeddings: OpenAIEmbeddings,
+        path: Optional[str] = None,
+        batch_size: int = 1000,
+        max_concurrency: int = 4,
+        max_memory_entries: int = 10000,
+    ):
+        self.embeddings = embeddings
+        self.model = embeddings.model
+        self.path = path
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_memory_entries = max_memory_entries
+
+        # key -> row in the memory-mapped array, or vector for entries not on disk
+        self._rows: Dict[str, int] = {}
+        self._vectors: Optional[np.ndarray] = None
+        self._dim: Optional[int] = None
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.api_requests = 0
+        self.calls = 0
+        self.calls_served_from_cache = 0
+        self.evictions = 0
+
+        if path:
+            self._load()
+
+    @classmethod
+    def from_env(cls) -> "CachedEmbeddings":
+        """Create a cache from EMBEDDING_* environment variables"""
+        batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "1000"))
+        return cls(
+            OpenAIEmbeddings(
+                api_key=os.getenv("OPENAI_API_KEY"), chunk_size=batch_size
+            ),
+            path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+            batch_size=batch_size,
+            max_concurrency=int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4")),
+            max_memory_entries=int(os.getenv("EMBEDDING_MEMORY_MAX_ENTRIES", "10000")),
+        )
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        """Memory-map vectors saved by earlier runs"""
+        vectors_file = self._file(self.VECTORS_FILE)
+        keys_file = self._file(self.KEYS_FILE)
+        meta_file = self._file(self.META_FILE)
+        if not all(os.path.exists(f) for f in (vectors_file, keys_file, meta_file)):
+            # Files from before the meta file was written are rebuilt on the
+            # next append, since their dimension isn't known
+            return
+
+        with open(meta_file) as f:
+            self._dim = int(json.load(f)["dim"])
+        with open(keys_file) as f:
+            keys = f.read().split("\n")
+        # A key cut short by an interrupted append has no complete line
+        keys = [key for key in keys if len(key) == self.KEY_LINE_BYTES - 1]
+
+        # Rows or keys written without their counterpart (interrupted append)
+        # are dropped, and the files truncated to match
+        rows = min(len(keys), os.path.getsize(vectors_file) // (4 * self._dim))
+        self._truncate(rows)
+        if rows == 0:
+            return
+        self._vectors = np.memmap(
+            vectors_file, dtype=np.float32, mode="r", shape=(rows, self._dim)
+        )
+        self._rows = {key: row for row, key in enumerate(keys[:rows])}
+
+    def _truncate(self, rows: int):
+        """Cut the vectors and keys files down to the first `rows` entries"""
+        for name, row_bytes in (
+            (self.VECTORS_FILE, 4 * (self._dim or 0)),
+            (self.KEYS_FILE, self.KEY_LINE_BYTES),
+        ):
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > rows * row_bytes:
+                os.truncate(path, rows * row_bytes)
+
+    def _append(self, entries: Dict[str, np.ndarray]):
+        """Append new vectors to the files on disk and remap the array"""
+        os.makedirs(self.path, exist_ok=True)
+        keys = list(entries)
+        if self._dim is None:
+            self._dim = entries[keys[0]].shape[0]
+            self._truncate(0)
+            with open(self._file(self.META_FILE), "w") as f:
+                json.dump({"model": self.model, "dim": self._dim}, f)
+
+        # Drop anything a failed earlier append left past the known rows
+        start = len(self._rows)
+        self._truncate(start)
+        with open(self._file(self.VECTORS_FILE), "ab") as f:
+            f.write(np.stack([entries[key] for key in keys]).tobytes())
+        with open(self._file(self.KEYS_FILE), "a") as f:
+            f.write("".join(f"{key}\n" for key in keys))
+
+        # Readers don't take the lock: publish the larger array before the
+        # rows that index into it
+        self._vectors = np.memmap(
+            self._file(self.VECTORS_FILE),
+            dtype=np.float32,
+            mode="r",
+            shape=(start + len(keys), self._dim),
+        )
+        self._rows.update({key: start + offset for offset, key in enumerate(keys)})
+
+    def _lookup(self, key: str) -> Optional[np.ndarray]:
+        row = self._rows.get(key)
+        if row is not None:
+            return self._vectors[row]
+        vector = self._memory.get(key)
+        if vector is not None:
+            try:
+                self._memory.move_to_end(key)
+            except KeyError:
+                # Evicted by a concurrent store
+                pass
+        return vector
+
+    def _store(
+        self, texts: List[str], vectors: List[List[float]]
+    ) -> Dict[str, np.ndarray]:
+        """Cache new vectors, returning them by key"""
+        entries = {
+            self._key(text): np.asarray(vector, dtype=np.float32)
+            for text, vector in zip(texts, vectors)
+        }
+        found = dict(entries)
+        with self._lock:
+            entries = {k: v for k, v in entries.items() if self._lookup(k) is None}
+            if not entries:
+                return found
+            if self.path:
+                self._append(entries)
+            else:
+                self._memory.update(entries)
+                while len(self._memory) > self.max_memory_entries:
+                    self._memory.popitem(last=False)
+                    self.evictions += 1
+        return found
+
+    def _partition(self, texts: List[str]) -> Tuple[Dict[str, np.ndarray], List[str]]:
+        """
+        Count hits and misses, returning the cached vectors by key and the
+        unique texts that need embedding
+        """
+        self.calls += 1
+        found = {}
+        missing = []
+        seen = set()
+        for text in texts:
+            key = self._key(text)
+            vector = self._lookup(key)
+            if vector is not None:
+                found[key] = vector
+                self.hits += 1
+            else:
+                self.misses += 1
+                if key not in seen:
+                    seen.add(key)
+                    missing.append(text)
+        if not missing:
+            self.calls_served_from_cache += 1
+        return found, missing
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        return [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+
+    def _collect(
+        self, texts: List[str], found: Dict[str, np.ndarray]
+    ) -> List[List[float]]:
+        # Vectors are held here, since the cache may evict them meanwhile
+        return [found[self._key(text)].tolist() for text in texts]
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        with upstream_call("openai", "embeddings"):
+            return self.embeddings.embed_documents(batch)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, calling the API only for uncached texts"""
+        found, missing = self._partition(texts)
+        if missing:
+            batches = self._batches(missing)
+            self.api_requests += len(batches)
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                results = list(pool.map(self._embed_batch, batches))
+            for batch, vectors in zip(batches, results):
+                # Recorded here: worker threads don't see the request context
+                get_usage_tracker().record_embeddings(self.model, batch)
+                found.update(self._store(batch, vectors))
+        return self._collect(texts, found)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Async variant of embed_documents"""
+        found, missing = self._partition(texts)
+        if missing:
+            batches = self._batches(missing)
+            self.api_requests += len(batches)
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def embed_batch(batch: List[str]):
+                async with semaphore:
+                    with upstream_call("openai", "embeddings"):
+                        vectors = await self.embeddings.aembed_documents(batch)
+                get_usage_tracker().record_embeddings(self.model, batch)
+                # Appending to the files on disk would block the event loop
+                found.update(await asyncio.to_thread(self._store, batch, vectors))
+
+            await asyncio.gather(*[embed_batch(batch) for batch in batches])
+        return self._collect(texts, found)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit rate and API usage counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._rows) + len(self._memory),
+            "persistent": self.path is not None,
+            "evictions": self.evictions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "api_requests": self.api_requests,
+            "calls": self.calls,
+            "api_calls_saved": self.calls_served_from_cache,
+        }
+
+
+_embeddings: Optional[CachedEmbeddings] = None
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """Return the process-wide cached embeddings model"""
+    global _embeddings
+    if _embeddings is None:
+        _embeddings = CachedEmbeddings.from_env()
+    return _embeddings
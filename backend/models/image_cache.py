@@ -0,0 +1,244 @@
+import os
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+
+def difference_hash(path: str, size: int = 8) -> Optional[int]:
+    """64-bit dHash: one bit per horizontally adjacent pixel pair of a
+    9x8 grayscale thumbnail. Re-encoded or resized copies of an image get
+    hashes a few bits apart. Returns None if Pillow can't read the image."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    try:
+        with Image.open(path) as image:
+            image.draft("L", (size * 4, size * 4))
+            pixels = np.asarray(
+                image.convert("L").resize((size + 1, size), Image.BILINEAR),
+                dtype=np.int16,
+            )
+    except Exception as e:
+        print(f"Error hashing image: {e}")
+        return None
+
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def fingerprint(path: str, sha256: Optional[str] = None) -> Tuple[str, Optional[int]]:
+    """Return (sha256 of the file, perceptual hash) for an image file.
+    Pass sha256 if it is already known to skip re-reading the file for it."""
+    if sha256 is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+    return sha256, difference_hash(path)
+
+
+class ImageAnalysisCache:
+    """Cache of image analysis results (the extracted base_query).
+
+    Lookups match the exact file content by SHA-256 first, then the
+    nearest perceptual hash within `max_distance` bits, so re-encoded or
+    resized copies of an image also hit. Entries are kept in memory, up to
+    `max_size` (least recently used evicted first), and if `db_path` is
+    set, also in a SQLite file that is loaded on startup and pruned along
+    with the memory.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        max_distance: int = 6,
+        db_path: Optional[str] = None,
+    ):
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.db_path = db_path
+
+        # sha256 -> (perceptual hash, base_query), least recently used first
+        self._entries: "OrderedDict[str, Tuple[Optional[int], str]]" = OrderedDict()
+        # Perceptual hashes as a uint64 array for vectorized Hamming distance
+        self._hash_keys: List[str] = []
+        self._hashes: Optional[np.ndarray] = None
+        # Hit since the last write, to record as recent use on disk
+        self._touched: Dict[str, float] = {}
+
+        # Counters
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            with self._db_lock:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS image_cache "
+                    "(sha256 TEXT PRIMARY KEY, phash TEXT, base_query TEXT NOT NULL, "
+                    "created REAL NOT NULL, last_used REAL)"
+                )
+                try:
+                    # Tables created before last_used was tracked
+                    self._db.execute(
+                        "ALTER TABLE image_cache ADD COLUMN last_used REAL"
+                    )
+                except sqlite3.OperationalError:
+                    pass
+                # Drop rows past max_size, e.g. after it was lowered
+                self._db.execute(
+                    "DELETE FROM image_cache WHERE sha256 NOT IN "
+                    "(SELECT sha256 FROM image_cache "
+                    "ORDER BY COALESCE(last_used, created) DESC LIMIT ?)",
+                    (max_size,),
+                )
+                self._db.commit()
+                rows = self._db.execute(
+                    "SELECT sha256, phash, base_query FROM image_cache "
+                    "ORDER BY COALESCE(last_used, created) DESC",
+                ).fetchall()
+            for sha256, phash, base_query in reversed(rows):
+                self._entries[sha256] = (
+                    int(phash, 16) if phash else None,
+                    base_query,
+                )
+
+    @classmethod
+    def from_env(cls) -> Optional["ImageAnalysisCache"]:
+        """Create a cache from IMAGE_CACHE_* environment variables, or None if disabled"""
+        if os.getenv("IMAGE_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            max_size=int(os.getenv("IMAGE_CACHE_SIZE", "10000")),
+            max_distance=int(os.getenv("IMAGE_CACHE_MAX_DISTANCE", "6")),
+            db_path=os.getenv("IMAGE_CACHE_DB") or None,
+        )
+
+    async def fingerprint(
+        self, path: str, sha256: Optional[str] = None
+    ) -> Tuple[str, Optional[int]]:
+        """Hash an image file off the event loop"""
+        return await asyncio.to_thread(fingerprint, path, sha256)
+
+    def _nearest(self, phash: int) -> Optional[str]:
+        """Return the sha256 of the closest perceptual hash within max_distance"""
+        if self._hashes is None:
+            self._hash_keys = [
+                key for key, (h, _) in self._entries.items() if h is not None
+            ]
+            self._hashes = np.array(
+                [self._entries[key][0] for key in self._hash_keys], dtype=np.uint64
+            )
+        if not len(self._hashes):
+            return None
+
+        xor = np.bitwise_xor(self._hashes, np.uint64(phash))
+        distances = np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        best = int(np.argmin(distances))
+        if distances[best] > self.max_distance:
+            return None
+        return self._hash_keys[best]
+
+    def lookup(self, sha256: str, phash: Optional[int]) -> Optional[str]:
+        """Return the cached base_query for an image, or None"""
+        entry = self._entries.get(sha256)
+        if entry is not None:
+            self.exact_hits += 1
+            self._touch(sha256)
+            return entry[1]
+
+        if phash is not None:
+            key = self._nearest(phash)
+            if key is not None:
+                self.near_hits += 1
+                self._touch(key)
+                return self._entries[key][1]
+
+        self.misses += 1
+        return None
+
+    def _touch(self, sha256: str):
+        self._entries.move_to_end(sha256)
+        if self._db is not None:
+            self._touched[sha256] = time.time()
+
+    async def add(self, sha256: str, phash: Optional[int], base_query: str):
+        """Store an analysis result in memory and, if configured, on disk"""
+        self._entries[sha256] = (phash, base_query)
+        self._entries.move_to_end(sha256)
+        evicted = []
+        while len(self._entries) > self.max_size:
+            evicted.append(self._entries.popitem(last=False)[0])
+            self.evictions += 1
+        # Rebuilt on the next near-duplicate lookup
+        self._hashes = None
+
+        if self._db is not None:
+            # Hits are written with the next addition rather than on lookup
+            touched, self._touched = self._touched, {}
+            for key in evicted:
+                touched.pop(key, None)
+            await asyncio.to_thread(
+                self._disk_set, sha256, phash, base_query, evicted, touched
+            )
+
+    def _disk_set(
+        self,
+        sha256: str,
+        phash: Optional[int],
+        base_query: str,
+        evicted: List[str],
+        touched: Dict[str, float],
+    ):
+        now = time.time()
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO image_cache "
+                "(sha256, phash, base_query, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    sha256,
+                    f"{phash:016x}" if phash is not None else None,
+                    base_query,
+                    now,
+                    now,
+                ),
+            )
+            self._db.executemany(
+                "UPDATE image_cache SET last_used = ? WHERE sha256 = ?",
+                [(used, key) for key, used in touched.items()],
+            )
+            self._db.executemany(
+                "DELETE FROM image_cache WHERE sha256 = ?",
+                [(key,) for key in evicted],
+            )
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit rate counters"""
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return {
+            "enabled": True,
+            "size": len(self._entries),
+            "max_distance": self.max_distance,
+            "disk_enabled": self._db is not None,
+            "evictions": self.evictions,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (
+                (self.exact_hits + self.near_hits) / lookups if lookups else 0.0
+            ),
+        }
@@ -0,0 +1,273 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from .search import SearchParameters
+from .product_store import SortOption
+
+
+class FastPathDecision(BaseModel):
+    """Result of the rule-based classifier for one message"""
+
+    state: str
+    response: str
+    search_params: Optional[SearchParameters] = None
+    confidence: float
+    rule: str
+
+
+# Whole-message patterns: (rule name, pattern, state, response, confidence)
+MESSAGE_RULES: List[Tuple[str, re.Pattern, str, str, float]] = [
+    (
+        "greeting",
+        re.compile(
+            r"^(hi+|hello|hey+|hiya|howdy|yo|greetings|good (morning|afternoon|evening))"
+            r"( there| again)?[!. ]*$"
+        ),
+        "collecting_info",
+        "Hello! I'm here to help you find the perfect products. What are you looking for today?",
+        0.98,
+    ),
+    (
+        "goodbye",
+        re.compile(
+            r"^((ok(ay)?|great|thanks?|thank you( so much)?|thx|cheers)[,!. ]*)?"
+            r"(bye+|goodbye|bye bye|see (you|ya)( later)?|that'?s all|that is all|i'?m done)"
+            r"( for now| then)?[!. ]*$"
+        ),
+        "ended",
+        "Thanks for shopping with me! Have a great day!",
+        0.97,
+    ),
+    (
+        "thanks",
+        re.compile(r"^(thanks|thank you|thx|ty)( so much| a lot| very much)?[!. ]*$"),
+        "collecting_info",
+        "You're welcome! Is there anything else I can help you find?",
+        0.85,
+    ),
+]
+
+# Sort phrases: (sort option, pattern, description used in the response)
+SORT_RULES: List[Tuple[SortOption, re.Pattern, str]] = [
+    (
+        SortOption.PRICE_LOW,
+        re.compile(
+            r"\b(cheapest|lowest price[sd]?|price low to high|least expensive|"
+            r"sort(ed)? by price|low(est)? to high(est)?)\b"
+        ),
+        "lowest priced",
+    ),
+    (
+        SortOption.PRICE_HIGH,
+        re.compile(
+            r"\b(most expensive|highest price[sd]?|price high to low|priciest|"
+            r"high(est)? to low(est)?)\b"
+        ),
+        "highest priced",
+    ),
+    (
+        SortOption.RATING,
+        re.compile(
+            r"\b(highest rated|best rated|top rated|highest rating|best rating|"
+            r"sort(ed)? by (rating|ratings|stars))\b"
+        ),
+        "highest rated",
+    ),
+    (
+        SortOption.RATING_COUNT,
+        re.compile(
+            r"\b(most reviews|most reviewed|sort(ed)? by (reviews|review count)|"
+            r"number of reviews|most ratings)\b"
+        ),
+        "most reviewed",
+    ),
+    (
+        SortOption.RATING_WEIGHTED,
+        re.compile(r"\b(most popular|most recommended|sort(ed)? by popularity)\b"),
+        "most popular",
+    ),
+]
+
+# Words that may surround a sort phrase without changing what is searched for
+FILLER_WORDS = set("""
+    a all and by can could do first for give i instead items just let's list
+    me now ok okay on one ones options order please products results see show sort
+    sorted the them then those to top want with would you
+    """.split())
+
+# Questions about a sort phrase ("what is the lowest price?") aren't sort tweaks
+QUESTION_PATTERN = re.compile(r"^(what|which|how|why|where|when|who|is|are)\b")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9$']+")
+
+
+class IntentClassifier:
+    """Deterministic pre-classifier for unambiguous conversation turns.
+
+    Greetings, goodbyes and thanks are matched against whole-message
+    patterns. Sort tweaks ("show cheapest first") are matched against sort
+    phrases and only apply when the session already has search parameters
+    and the message isn't a question. Their confidence is the share of the
+    message covered by the sort phrase and filler words, so messages that
+    add new product details fall below the threshold and go to the LLM.
+
+    Modes: "off" disables the classifier, "shadow" classifies but always
+    calls the LLM and records agreement, "on" answers confident turns
+    without calling the LLM.
+    """
+
+    def __init__(self, mode: str = "off", threshold: float = 0.9):
+        self.mode = mode
+        self.threshold = threshold
+
+        # Counters
+        self.checked = 0
+        self.matched = 0
+        self.below_threshold = 0
+        self.resolved = 0
+        self.llm_calls_avoided = 0
+        self.shadow_agree = 0
+        self.shadow_disagree = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["IntentClassifier"]:
+        """Create a classifier from FAST_PATH_* environment variables, or None if off"""
+        mode = os.getenv("FAST_PATH_MODE", "off").lower()
+        if mode not in ("shadow", "on"):
+            return None
+        return cls(mode=mode, threshold=float(os.getenv("FAST_PATH_THRESHOLD", "0.9")))
+
+    def classify(
+        self, message: str, last_search_params: Optional[SearchParameters] = None
+    ) -> Optional[FastPathDecision]:
+        """Classify a message, returning None if no rule matches"""
+        self.checked += 1
+        text = " ".join(message.lower().split())
+
+        decision = None
+        for rule, pattern, state, response, confidence in MESSAGE_RULES:
+            if pattern.match(text):
+                decision = FastPathDecision(
+                    state=state, response=response, confidence=confidence, rule=rule
+                )
+                break
+
+        if (
+            decision is None
+            and last_search_params
+            and last_search_params.base_query
+            and not QUESTION_PATTERN.match(text)
+        ):
+            decision = self._classify_sort(text, last_search_params)
+
+        if decision is not None:
+            self.matched += 1
+            if decision.confidence < self.threshold:
+                self.below_threshold += 1
+        return decision
+
+    def _classify_sort(
+        self, text: str, last_search_params: SearchParameters
+    ) -> Optional[FastPathDecision]:
+        """Match a sort tweak on the previous search"""
+        matches = [
+            (sort_by, match, label)
+            for sort_by, pattern, label in SORT_RULES
+            for match in [pattern.search(text)]
+            if match
+        ]
+        # Conflicting sort requests are left to the LLM
+        if len({sort_by for sort_by, _, _ in matches}) != 1:
+            return None
+
+        sort_by, match, label = matches[0]
+        tokens = TOKEN_PATTERN.findall(text)
+        phrase_tokens = TOKEN_PATTERN.findall(match.group(0))
+        remaining = list(tokens)
+        for token in phrase_tokens:
+            if token in remaining:
+                remaining.remove(token)
+        other = [t for t in remaining if t not in FILLER_WORDS]
+        confidence = 0.95 * (1 - len(other) / len(tokens)) if tokens else 0.0
+
+        query = last_search_params.base_query.replace("-", " ")
+        return FastPathDecision(
+            state="ready_to_search",
+            response=f"Sure! Here are the {label} {query} options I found.",
+            search_params=last_search_params.model_copy(update={"sort_by": sort_by}),
+            confidence=confidence,
+            rule=f"sort:{sort_by.value}",
+        )
+
+    def should_resolve(self, decision: Optional[FastPathDecision]) -> bool:
+        """Whether a decision should be used instead of calling the LLM"""
+        return (
+            self.mode == "on"
+            and decision is not None
+            and decision.confidence >= self.threshold
+        )
+
+    def record_resolved(self, llm_calls: int):
+        """Count a turn answered by the classifier"""
+        self.resolved += 1
+        self.llm_calls_avoided += llm_calls
+
+    def record_shadow(
+        self,
+        decision: Optional[FastPathDecision],
+        state: str,
+        search_params: Optional[SearchParameters],
+        message: str,
+    ):
+        """Compare a confident decision with the LLM's answer and log disagreements"""
+        if decision is None or decision.confidence < self.threshold:
+            return
+
+        agree = decision.state == state
+        if agree and decision.search_params is not None:
+            agree = search_params is not None and (
+                search_params.sort_by == decision.search_params.sort_by
+            )
+
+        if agree:
+            self.shadow_agree += 1
+        else:
+            self.shadow_disagree += 1
+            print(
+                f"Fast-path disagreement: rule={decision.rule} message={message!r} "
+                f"fast_state={decision.state} llm_state={state} "
+                f"llm_sort={search_params.sort_by if search_params else None}"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Return classifier counters"""
+        shadow_total = self.shadow_agree + self.shadow_disagree
+        return {
+            "enabled": True,
+            "mode": self.mode,
+            "threshold": self.threshold,
+            "checked": self.checked,
+            "matched": self.matched,
+            "below_threshold": self.below_threshold,
+            "resolved": self.resolved,
+            "llm_calls_avoided": self.llm_calls_avoided,
+            "shadow_agree": self.shadow_agree,
+            "shadow_disagree": self.shadow_disagree,
+            "shadow_agreement_rate": (
+                self.shadow_agree / shadow_total if shadow_total else 0.0
+            ),
+        }
+
+
+_intent_classifier: Optional[IntentClassifier] = None
+_intent_classifier_loaded = False
+
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """Return the process-wide fast-path classifier, or None if off"""
+    global _intent_classifier, _intent_classifier_loaded
+    if not _intent_classifier_loaded:
+        _intent_classifier = IntentClassifier.from_env()
+        _intent_classifier_loaded = True
+    return _intent_classifier
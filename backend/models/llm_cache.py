@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel
+from .cache import TTLCache
+
+
+class LLMResponseCache:
+    """Exact-match cache for LLM completions.
+
+    Keys are a hash of (model, messages, response_format, temperature), so the
+    system prompt and chat history are part of the key. Values are the raw
+    message content. Lookups go to an in-memory LRU first and then, if
+    configured, to a SQLite file that survives restarts.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: float = 86400,
+        db_path: Optional[str] = None,
+        zero_temperature: bool = True,
+    ):
+        self.memory = TTLCache(max_size=max_size, ttl=ttl)
+        self.ttl = ttl
+        self.db_path = db_path
+        self.zero_temperature = zero_temperature
+
+        self.disk_hits = 0
+        self.disk_misses = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            with self._db_lock:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                self._db.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["LLMResponseCache"]:
+        """Create a cache from LLM_CACHE_* environment variables, or None if disabled"""
+        if os.getenv("LLM_CACHE_ENABLED", "false").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            max_size=int(os.getenv("LLM_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+            db_path=os.getenv("LLM_CACHE_DB") or None,
+            zero_temperature=os.getenv("LLM_CACHE_ZERO_TEMPERATURE", "true").lower()
+            in ("1", "true", "yes"),
+        )
+
+    def temperature(self, default: float) -> float:
+        """Temperature to use for a cacheable call"""
+        return 0.0 if self.zero_temperature else default
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: List[Dict[str, Any]],
+        response_format: Any,
+        temperature: float,
+    ) -> str:
+        """Hash the request fields that determine the response"""
+        if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+            response_format = {
+                "name": response_format.__name__,
+                "schema": response_format.model_json_schema(),
+            }
+        raw = json.dumps(
+            {
+                "model": model,
+                "messages": messages,
+                "response_format": response_format,
+                "temperature": temperature,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return cached content for a key, checking memory then disk"""
+        value, _ = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if self._db is None:
+            return None
+
+        value = await asyncio.to_thread(self._disk_get, key)
+        if value is None:
+            self.disk_misses += 1
+            return None
+
+        self.disk_hits += 1
+        self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: str):
+        """Store content in memory and, if configured, on disk"""
+        self.memory.set(key, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_set, key, value)
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, created FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if time.time() - created > self.ttl:
+                self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            return value
+
+    def _disk_set(self, key: str, value: str):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return memory and disk tier counters"""
+        return {
+            "memory": self.memory.stats(),
+            "disk_enabled": self._db is not None,
+            "disk_hits": self.disk_hits,
+            "disk_misses": self.disk_misses,
+            "zero_temperature": self.zero_temperature,
+        }
+
+
+_llm_cache: Optional[LLMResponseCache] = None
+_llm_cache_loaded = False
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Return the process-wide LLM response cache, or None if disabled"""
+    global _llm_cache, _llm_cache_loaded
+    if not _llm_cache_loaded:
+        _llm_cache = LLMResponseCache.from_env()
+        _llm_cache_loaded = True
+    return _llm_cache
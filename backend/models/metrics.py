@@ -0,0 +1,207 @@
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds in seconds; LLM calls need the long tail past 10s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        key = tuple(str(v) for v in label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(tuple(str(v) for v in label_values), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, in the Prometheus layout"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Iterable[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        key = tuple(str(v) for v in label_values)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def count(self, *label_values: str) -> int:
+        series = self._values.get(tuple(str(v) for v in label_values))
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._values.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series[:-1]):
+                cumulative += count
+                labels = _format_labels(
+                    self.labels + ("le",), key + (_format_value(bound),)
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """Process-wide request, stage and upstream metrics, rendered in the
+    Prometheus text exposition format for /metrics"""
+
+    def __init__(self):
+        self.http_requests = Counter(
+            "http_requests_total",
+            "HTTP requests by route and status",
+            ("method", "route", "status"),
+        )
+        self.http_duration = Histogram(
+            "http_request_duration_seconds",
+            "HTTP request latency, until the last body chunk is sent",
+            ("method", "route"),
+        )
+        self.stage_duration = Histogram(
+            "stage_duration_seconds",
+            "Latency of each pipeline stage",
+            ("stage",),
+        )
+        self.upstream_requests = Counter(
+            "upstream_requests_total",
+            "Calls to OpenAI and Serper by status code (or error)",
+            ("service", "operation", "status"),
+        )
+        self.upstream_duration = Histogram(
+            "upstream_request_duration_seconds",
+            "Latency of calls to OpenAI and Serper",
+            ("service", "operation"),
+        )
+        self.upstream_retries = Counter(
+            "upstream_retries_total",
+            "Retried calls to OpenAI and Serper",
+            ("service", "operation"),
+        )
+        self.llm_tokens = Counter(
+            "llm_tokens_total",
+            "OpenAI tokens by pipeline stage, model and kind (prompt or completion)",
+            ("stage", "model", "kind"),
+        )
+        self.usage_cost = Counter(
+            "usage_cost_usd_total",
+            "Estimated OpenAI and Serper spend by pipeline stage",
+            ("stage",),
+        )
+        self.instruments = [
+            self.http_requests,
+            self.http_duration,
+            self.stage_duration,
+            self.upstream_requests,
+            self.upstream_duration,
+            self.upstream_retries,
+            self.llm_tokens,
+            self.usage_cost,
+        ]
+
+    def render(self, stats: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Render all metrics. Numeric values of `stats` (the /api/stats
+        sections) are added as an `app_stat` gauge labeled by section and name.
+        """
+        lines = []
+        for instrument in self.instruments:
+            lines.append(f"# HELP {instrument.name} {instrument.help}")
+            lines.append(f"# TYPE {instrument.name} {instrument.kind}")
+            lines.extend(instrument.render())
+
+        if stats:
+            lines.append("# HELP app_stat Numeric values from /api/stats")
+            lines.append("# TYPE app_stat gauge")
+            for section, values in stats.items():
+                for name, value in _flatten(values):
+                    labels = _format_labels(("section", "name"), (section, name))
+                    lines.append(f"app_stat{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(values: Any, prefix: str = "") -> Iterable[Tuple[str, float]]:
+    """Yield (dotted name, number) for the numeric leaves of a stats dict"""
+    if isinstance(values, dict):
+        for key, value in values.items():
+            yield from _flatten(value, f"{prefix}{key}.")
+    elif isinstance(values, bool):
+        yield prefix[:-1], float(values)
+    elif isinstance(values, (int, float)) and not math.isnan(values):
+        yield prefix[:-1], float(values)
+
+
+_metrics: Optional[Metrics] = None
+
+
+def get_metrics() -> Metrics:
+    """Return the process-wide metrics"""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
@@ -0,0 +1,209 @@
+import os
+import asyncio
+import secrets
+from typing import Any, Dict, List, Optional, Set
+from .cache import TTLCache
+from .product import AnyProduct
+from .product_store import product_key
+from .ranking import get_sorted_products
+from .search import ProductSearcher, SearchParameters
+
+
+class CandidateSet:
+    """Sorted products of one search, paged through by cursors"""
+
+    __slots__ = (
+        "search_params",
+        "products",
+        "keys",
+        "page",
+        "exhausted",
+        "prefetch_task",
+    )
+
+    def __init__(
+        self,
+        search_params: SearchParameters,
+        products: List[AnyProduct],
+        exhausted: bool,
+    ):
+        self.search_params = search_params
+        self.products = products
+        self.keys: Set[str] = {product_key(product) for product in products}
+        # Last upstream page merged into products
+        self.page = 1
+        self.exhausted = exhausted
+        self.prefetch_task: Optional[asyncio.Task] = None
+
+
+class ProductPaginator:
+    """Serves "show more" pages from sorted candidates kept server-side.
+
+    A cursor is "<set id>.<offset>", so serving a page is a slice of the
+    stored list and repeating a request returns the same page. Candidate
+    sets expire `ttl` seconds after their last use. Once the user pages
+    through a set and fewer than `prefetch_pages` pages are left, the next
+    Serper page is fetched in the background and appended, sorted the same
+    way. Sets nobody pages through never cost an upstream call.
+    """
+
+    def __init__(
+        self,
+        searcher: ProductSearcher,
+        max_sets: int = 10000,
+        ttl: float = 900,
+        page_size: int = 3,
+        prefetch: bool = True,
+        prefetch_pages: int = 2,
+        max_upstream_pages: int = 5,
+    ):
+        self.searcher = searcher
+        self.sets = TTLCache(max_size=max_sets, ttl=ttl)
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.prefetch_pages = prefetch_pages
+        self.max_upstream_pages = max_upstream_pages
+
+        # Counters
+        self.pages_served = 0
+        self.expired_cursors = 0
+        self.prefetches = 0
+        self.prefetched_products = 0
+
+    @classmethod
+    def from_env(cls, searcher: ProductSearcher) -> Optional["ProductPaginator"]:
+        """Create from PAGINATION_* environment variables, or None if disabled"""
+        enabled = ("1", "true", "yes")
+        if os.getenv("PAGINATION_ENABLED", "true").lower() not in enabled:
+            return None
+        return cls(
+            searcher,
+            max_sets=int(os.getenv("PAGINATION_MAX_SETS", "10000")),
+            ttl=float(os.getenv("PAGINATION_CURSOR_TTL", "900")),
+            prefetch=os.getenv("PAGINATION_PREFETCH", "true").lower() in enabled,
+            prefetch_pages=int(os.getenv("PAGINATION_PREFETCH_PAGES", "2")),
+            max_upstream_pages=int(os.getenv("PAGINATION_MAX_UPSTREAM_PAGES", "5")),
+        )
+
+    def create(
+        self,
+        search_params: SearchParameters,
+        products: List[AnyProduct],
+        offset: int,
+        backend: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Store sorted products and return the cursor of the page at offset,
+        or None if there is nothing more to page through
+        """
+        # Only Serper results have further upstream pages
+        backend = backend or self.searcher.backend
+        exhausted = not self.prefetch or (
+            backend == "catalog" and self.searcher.catalog is not None
+        )
+        if offset >= len(products) and exhausted:
+            return None
+
+        set_id = secrets.token_urlsafe(12)
+        candidate_set = CandidateSet(search_params, list(products), exhausted)
+        self.sets.set(set_id, candidate_set)
+        return f"{set_id}.{offset}"
+
+    async def next_page(
+        self, cursor: str, limit: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return {"products", "cursor"} for a cursor, where cursor is the next
+        page's cursor or None at the end. Returns None for unknown or
+        expired cursors.
+        """
+        set_id, _, offset = cursor.rpartition(".")
+        if not set_id or not offset.isdigit():
+            return None
+        offset = int(offset)
+        limit = limit or self.page_size
+
+        candidate_set, _ = self.sets.get(set_id)
+        if candidate_set is None:
+            self.expired_cursors += 1
+            return None
+        # Using a cursor keeps its set alive for another ttl
+        self.sets.set(set_id, candidate_set)
+
+        # The page starts past what we have; wait for the (started) prefetch
+        self._maybe_prefetch(candidate_set, offset)
+        task = candidate_set.prefetch_task
+        if offset + limit > len(candidate_set.products) and task and not task.done():
+            await asyncio.shield(task)
+
+        products = candidate_set.products[offset : offset + limit]
+        next_offset = offset + len(products)
+        self.pages_served += 1
+        self._maybe_prefetch(candidate_set, next_offset)
+
+        has_more = next_offset < len(candidate_set.products) or (
+            products and not candidate_set.exhausted
+        )
+        return {
+            "products": [product.model_dump() for product in products],
+            "cursor": f"{set_id}.{next_offset}" if has_more else None,
+        }
+
+    def _maybe_prefetch(self, candidate_set: CandidateSet, offset: int):
+        """Fetch the next upstream page if the set is nearly used up"""
+        if candidate_set.exhausted:
+            return
+        if candidate_set.prefetch_task and not candidate_set.prefetch_task.done():
+            return
+        remaining = len(candidate_set.products) - offset
+        if remaining >= self.prefetch_pages * self.page_size:
+            return
+        candidate_set.prefetch_task = asyncio.create_task(
+            self._fetch_next_page(candidate_set)
+        )
+
+    async def _fetch_next_page(self, candidate_set: CandidateSet):
+        """Append the next Serper page, deduplicated and sorted like the set"""
+        page = candidate_set.page + 1
+        if page > self.max_upstream_pages:
+            candidate_set.exhausted = True
+            return
+
+        self.prefetches += 1
+        try:
+            products = await self.searcher.search_page(
+                candidate_set.search_params, page
+            )
+        except Exception as e:
+            print(f"Error prefetching products page: {e}")
+            candidate_set.exhausted = True
+            return
+
+        new_products = []
+        for product in products:
+            key = product_key(product)
+            if key not in candidate_set.keys:
+                candidate_set.keys.add(key)
+                new_products.append(product)
+        if not new_products:
+            candidate_set.exhausted = True
+            return
+
+        if candidate_set.search_params.sort_by:
+            new_products = get_sorted_products(
+                new_products, candidate_set.search_params.sort_by
+            )
+        candidate_set.products.extend(new_products)
+        candidate_set.page = page
+        self.prefetched_products += len(new_products)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cursor and prefetch counters"""
+        return {
+            "enabled": True,
+            "candidate_sets": len(self.sets),
+            "pages_served": self.pages_served,
+            "expired_cursors": self.expired_cursors,
+            "prefetches": self.prefetches,
+            "prefetched_products": self.prefetched_products,
+        }
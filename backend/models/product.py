@@ -1,7 +1,32 @@
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple, Union
 from pydantic import BaseModel, Field
 import re
 
+# Plain prices like "$1,234.56" or "1234", parsed without a failing float()
+PLAIN_PRICE_PATTERN = re.compile(r"\$?(\d[\d,]*(?:\.\d*)?)")
+PRICE_NUMBER_PATTERN = re.compile(r"\d+\.?\d*")
+
+
+def parse_price(price_str: Optional[str]) -> Tuple[float, str]:
+    """Parse a Serper price string into (price, display string)"""
+    if not price_str:
+        return 0.0, "Contact for price"
+
+    match = PLAIN_PRICE_PATTERN.fullmatch(price_str)
+    if match:
+        return float(match.group(1).replace(",", "")), price_str
+
+    try:
+        # Remove $ and , from price string and convert to float
+        return float(price_str.replace("$", "").replace(",", "")), price_str
+    except (ValueError, TypeError):
+        # If price conversion fails, try to extract numbers from the string
+        number = PRICE_NUMBER_PATTERN.search(price_str)
+        if number:
+            price = float(number.group())
+            return price, f"${price:,.2f}"
+        return 0.0, "Contact for price"
+
 
 class Product(BaseModel):
     """Product model for search results"""
@@ -21,30 +46,7 @@ class Product(BaseModel):
     @classmethod
     def from_serper_result(cls, result: dict) -> "Product":
         """Create a Product instance from Serper API result"""
-        # Extract price from the price string
-        price_str = result.get("price")
-        price = 0.0
-
-        if price_str:
-            try:
-                # Remove $ and , from price string and convert to float
-                price = float(price_str.replace("$", "").replace(",", ""))
-                # Keep the original formatted price string if valid
-                price_str = result["price"]
-            except (ValueError, TypeError):
-                # If price conversion fails, try to extract numbers from the string
-                numbers = re.findall(r"\d+\.?\d*", price_str)
-                if numbers:
-                    try:
-                        price = float(numbers[0])
-                        price_str = f"${price:,.2f}"
-                    except (ValueError, TypeError):
-                        price = 0.0
-                        price_str = "Contact for price"
-                else:
-                    price_str = "Contact for price"
-        else:
-            price_str = "Contact for price"
+        price, price_str = parse_price(result.get("price"))
 
         return cls(
             id=str(result.get("position", "")),
@@ -59,3 +61,84 @@ class Product(BaseModel):
             delivery=result.get("delivery"),
             source=result.get("source", "Unknown store"),
         )
+
+
+class ProductRecord:
+    """Lightweight product used inside the search pipeline.
+
+    Has the same fields as Product and the model_dump() used at the
+    response boundary, but no validation, so building one per Serper result
+    is cheap. Use to_product() where a Pydantic Product is needed.
+    """
+
+    __slots__ = tuple(Product.model_fields)
+
+    def __init__(
+        self,
+        id: str,
+        title: str,
+        description: Optional[str],
+        price: float,
+        price_str: str,
+        link: str,
+        imageUrl: str,
+        rating: Optional[float],
+        ratingCount: int,
+        delivery: Optional[str],
+        source: str,
+    ):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.price = price
+        self.price_str = price_str
+        self.link = link
+        self.imageUrl = imageUrl
+        self.rating = rating
+        self.ratingCount = ratingCount
+        self.delivery = delivery
+        self.source = source
+
+    @classmethod
+    def from_serper_result(cls, result: dict) -> "ProductRecord":
+        """Create a record from a Serper API result, trusting its field types"""
+        price, price_str = parse_price(result.get("price"))
+        rating = result.get("rating")
+
+        return cls(
+            str(result.get("position", "")),
+            result.get("title", "No title"),
+            result.get("description", ""),
+            price,
+            price_str,
+            result.get("link", "#"),
+            result.get("imageUrl", ""),
+            float(rating) if rating is not None else None,
+            result.get("ratingCount") or 0,
+            result.get("delivery"),
+            result.get("source", "Unknown store"),
+        )
+
+    def model_dump(self) -> Dict[str, Any]:
+        """Return the fields as a dict, like Product.model_dump()"""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def to_product(self) -> Product:
+        """Convert to a Product without re-validating"""
+        return Product.model_construct(**self.model_dump())
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, (ProductRecord, Product)):
+            return NotImplemented
+        return self.model_dump() == other.model_dump()
+
+    # Mutable and compared by value, so unhashable like Product
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"ProductRecord(id={self.id!r}, title={self.title!r})"
+
+
+# What the search pipeline passes around: records from Serper, Products
+# from the catalog and product store
+AnyProduct = Union[Product, ProductRecord]
@@ -1,164 +1,223 @@
-from typing import List, Dict, Optional
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
+from typing import List, Dict, Optional, Tuple
+import faiss
+import hashlib
 import json
+import numpy as np
 import os
-from enum import Enum
 from .product import Product
+from .ranking import SortOption, get_sorted_products
+from .embedding_cache import get_embeddings
 
 
-class SortOption(Enum):
-    """Enum for product sorting options"""
+def product_key(product: Product) -> str:
+    """Stable key for a product: its link, or source and title if it has none"""
+    if product.link and product.link != "#":
+        return product.link
+    return f"{product.source}:{product.title}"
 
-    RELEVANCE = "relevance"  # Default sorting by search relevance
-    RATING = "rating"  # Sort by rating (high to low)
-    RATING_COUNT = "rating_count"  # Sort by number of reviews (high to low)
-    RATING_WEIGHTED = "rating_weighted"  # Sort by rating weighted by review count
-    PRICE_LOW = "price_low"  # Sort by price (low to high)
-    PRICE_HIGH = "price_high"  # Sort by price (high to low)
 
+def _key_to_id(key: str) -> int:
+    """Map a product key to a stable non-negative int64 FAISS id"""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & 0x7FFFFFFFFFFFFFFF
 
-def get_sorted_products(
-    products: List[Product],
-    sort_by: SortOption = SortOption.RELEVANCE,
-    limit: Optional[int] = None,
-) -> List[Product]:
-    """
-    Sort products by the specified option.
 
-    Args:
-        products: List of products to sort
-        sort_by: SortOption enum specifying sort method
-        limit: Optional maximum number of products to return
+class ProductStore:
+    """Vector index of products, keyed by a stable product key.
 
-    Returns:
-        List of sorted products, optionally limited to specified count
+    Vectors live in a FAISS inner-product index wrapped in IndexIDMap2, so
+    products can be upserted and deleted by id. With `index_path` set, the
+    index and product metadata are saved to disk and loaded (memory-mapped
+    where the index type supports it) on startup, and products whose
+    document text is already indexed are not embedded again.
     """
-    sorted_products = products.copy()  # Don't modify original list
 
-    if sort_by == SortOption.RELEVANCE:
-        # Keep original order (assumed to be by relevance)
-        pass
+    INDEX_FILE = "products.faiss"
+    METADATA_FILE = "products.json"
 
-    elif sort_by == SortOption.RATING:
-        # Sort by rating high to low, handle None ratings
-        sorted_products.sort(
-            key=lambda p: (p.rating if p.rating is not None else -1), reverse=True
-        )
+    def __init__(self, index_path: Optional[str] = None):
+        self.embeddings = get_embeddings()
+        self.index_path = index_path or os.getenv("PRODUCT_INDEX_PATH") or None
+        self.index: Optional[faiss.IndexIDMap2] = None
+        # FAISS id -> product, and FAISS id -> hash of the embedded document
+        self.products: Dict[int, Product] = {}
+        self.document_hashes: Dict[int, str] = {}
 
-    elif sort_by == SortOption.RATING_COUNT:
-        # Sort by number of reviews high to low
-        sorted_products.sort(
-            key=lambda p: p.ratingCount if p.ratingCount is not None else 0,
-            reverse=True,
-        )
+        if self.index_path:
+            self.load()
 
-    elif sort_by == SortOption.RATING_WEIGHTED:
-        # Wilson score interval sort - balances rating with number of reviews
-        def wilson_score(product: Product) -> float:
-            if not product.rating or not product.ratingCount:
-                return -1
+    def _create_product_document(self, product: Product) -> str:
+        """Create a searchable document from a product."""
+        return f"""
+        Product: {product.title}
+        Price: {product.price_str}
+        Source: {product.source}
+        Rating: {product.rating if product.rating is not None else "N/A"} ({product.ratingCount} reviews)
+        Delivery: {product.delivery or ""}
+        Description: From {product.source}
+        URL: {product.link}
+        """
 
-            # Convert 5-star rating to proportion (0-1)
-            pos = (product.rating / 5.0) * product.ratingCount
-            n = product.ratingCount
+    def _embed_documents(self, documents: List[str]) -> np.ndarray:
+        """Embed documents as normalized float32 rows"""
+        vectors = np.array(self.embeddings.embed_documents(documents), dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        return vectors
 
-            # Constants for 95% confidence
-            z = 1.96
-            zsqr = z * z
+    def _embed_query(self, query: str) -> np.ndarray:
+        """Embed a query as a normalized float32 row"""
+        vector = np.array([self.embeddings.embed_query(query)], dtype=np.float32)
+        faiss.normalize_L2(vector)
+        return vector
 
-            # Wilson score calculation
-            numerator = (pos + zsqr / 2) / n
-            denominator = 1 + zsqr / n
+    def add_products(self, products: List[Product]) -> int:
+        """Upsert products into the vector store.
 
-            return numerator / denominator
+        Products are deduplicated by key. Products whose document is unchanged
+        only have their metadata updated; new or changed ones are embedded in
+        one batch.
 
-        sorted_products.sort(key=wilson_score, reverse=True)
+        Returns:
+            Number of products embedded
+        """
+        # Dedupe by key, last one wins
+        pending: Dict[int, Tuple[Product, str, str]] = {}
+        for product in products:
+            document = self._create_product_document(product)
+            document_hash = hashlib.sha256(document.encode("utf-8")).hexdigest()
+            pending[_key_to_id(product_key(product))] = (
+                product,
+                document,
+                document_hash,
+            )
 
-    elif sort_by == SortOption.PRICE_LOW:
-        # Sort by price low to high, handle None prices
-        sorted_products.sort(
-            key=lambda p: float(p.price) if p.price is not None else float("inf")
-        )
+        to_embed = []
+        for product_id, (product, document, document_hash) in pending.items():
+            self.products[product_id] = product
+            if self.document_hashes.get(product_id) != document_hash:
+                to_embed.append((product_id, document, document_hash))
 
-    elif sort_by == SortOption.PRICE_HIGH:
-        # Sort by price high to low, handle None prices
-        sorted_products.sort(
-            key=lambda p: float(p.price) if p.price is not None else -1, reverse=True
-        )
+        if not to_embed:
+            return 0
 
-    # Apply limit if specified
-    if limit is not None:
-        sorted_products = sorted_products[:limit]
+        ids = np.array([product_id for product_id, _, _ in to_embed], dtype=np.int64)
+        vectors = self._embed_documents([document for _, document, _ in to_embed])
 
-    return sorted_products
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+        else:
+            # Replace vectors of changed products
+            self.index.remove_ids(ids)
+        self.index.add_with_ids(vectors, ids)
 
+        for product_id, _, document_hash in to_embed:
+            self.document_hashes[product_id] = document_hash
 
-class ProductStore:
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
-        self.vector_store = None
-        self.products: List[Product] = []
+        return len(to_embed)
 
-    def _create_product_document(self, product: Dict) -> str:
-        """Create a searchable document from a product."""
-        return f"""
-        Product: {product.get("title", "")}
-        Price: {product.get("price", "")}
-        Source: {product.get("source", "")}
-        Rating: {product.get("rating", "N/A")} ({product.get("ratingCount", 0)} reviews)
-        Delivery: {product.get("delivery", "")}
-        Description: From {product.get("source", "")}
-        URL: {product.get("link", "")}
-        """
-
-    def add_products(self, products: List[Product]):
-        """Add products to the vector store."""
-        self.products.extend(products)
-
-        # Create documents from products
-        documents = [self._create_product_document(product) for product in products]
+    def delete_products(self, keys: List[str]) -> int:
+        """Delete products by key. Returns the number removed."""
+        ids = [_key_to_id(key) for key in keys]
+        ids = [product_id for product_id in ids if product_id in self.products]
+        if not ids:
+            return 0
 
-        # Create or update vector store
-        if self.vector_store is None:
-            self.vector_store = FAISS.from_texts(
-                documents,
-                self.embeddings,
-                metadatas=[{"index": i} for i in range(len(documents))],
-            )
-        else:
-            self.vector_store.add_texts(
-                documents,
-                metadatas=[
-                    {"index": i + len(self.products)} for i in range(len(documents))
-                ],
-            )
+        if self.index is not None:
+            self.index.remove_ids(np.array(ids, dtype=np.int64))
+        for product_id in ids:
+            self.products.pop(product_id, None)
+            self.document_hashes.pop(product_id, None)
+        return len(ids)
 
     def search_products(self, query: str, k: int = 3) -> List[Dict]:
         """Search for products using semantic similarity."""
-        if not self.vector_store or not self.products:
+        if self.index is None or self.index.ntotal == 0:
             return []
 
         # Perform similarity search
-        results = self.vector_store.similarity_search_with_score(query, k=k)
+        scores, ids = self.index.search(self._embed_query(query), k)
 
-        # Get original products using metadata indices
+        # Get original products using FAISS ids
         relevant_products = []
-        for doc, score in results:
-            index = doc.metadata.get("index")
-            if index is not None and 0 <= index < len(self.products):
-                product = self.products[index]
+        for score, product_id in zip(scores[0], ids[0]):
+            product = self.products.get(int(product_id))
+            if product is not None:
                 # Add similarity score to product
-                product_with_score = {**product, "similarity_score": float(score)}
+                product_with_score = {
+                    **product.model_dump(),
+                    "similarity_score": float(score),
+                }
                 relevant_products.append(product_with_score)
 
         return relevant_products
 
+    def save(self, index_path: Optional[str] = None):
+        """Save the index and product metadata to disk"""
+        index_path = index_path or self.index_path
+        if not index_path or self.index is None:
+            return
+
+        os.makedirs(index_path, exist_ok=True)
+        index_file = os.path.join(index_path, self.INDEX_FILE)
+        metadata_file = os.path.join(index_path, self.METADATA_FILE)
+        # Write both to temp files first so a crash can't leave a new index
+        # next to old metadata (load() also checks that their sizes match)
+        faiss.write_index(self.index, index_file + ".tmp")
+        metadata = [
+            {
+                "id": product_id,
+                "document_hash": self.document_hashes.get(product_id),
+                "product": product.model_dump(),
+            }
+            for product_id, product in self.products.items()
+        ]
+        with open(metadata_file + ".tmp", "w") as f:
+            json.dump(metadata, f)
+        os.replace(index_file + ".tmp", index_file)
+        os.replace(metadata_file + ".tmp", metadata_file)
+
+    def load(self, index_path: Optional[str] = None):
+        """Load a saved index and product metadata from disk, if present"""
+        index_path = index_path or self.index_path
+        index_file = os.path.join(index_path, self.INDEX_FILE)
+        metadata_file = os.path.join(index_path, self.METADATA_FILE)
+        if not (os.path.exists(index_file) and os.path.exists(metadata_file)):
+            return
+
+        try:
+            index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP)
+        except RuntimeError:
+            index = faiss.read_index(index_file)
+
+        with open(metadata_file) as f:
+            metadata = json.load(f)
+        indexed = sum(1 for item in metadata if item["document_hash"])
+        if index.ntotal != indexed:
+            print(
+                f"Error loading product store: index has {index.ntotal} vectors "
+                f"but metadata has {indexed} embedded products"
+            )
+            return
+
+        self.index = index
+        self.products = {
+            item["id"]: Product.model_validate(item["product"]) for item in metadata
+        }
+        self.document_hashes = {
+            item["id"]: item["document_hash"]
+            for item in metadata
+            if item["document_hash"]
+        }
+
+    def __len__(self) -> int:
+        return len(self.products)
+
     def clear(self):
         """Clear all products and reset the vector store."""
-        self.products = []
-        self.vector_store = None
+        self.products = {}
+        self.document_hashes = {}
+        self.index = None
 
     def clear_products(self):
-        """Clear all products from the store"""
-        self.products = []
+        """Clear all products from the store, along with their vectors"""
+        self.clear()
@@ -0,0 +1,161 @@
+from enum import Enum
+from typing import List, Optional, Sequence, Union
+import numpy as np
+from .product import AnyProduct
+
+
+class SortOption(Enum):
+    """Enum for product sorting options"""
+
+    RELEVANCE = "relevance"  # Default sorting by search relevance
+    RATING = "rating"  # Sort by rating (high to low)
+    RATING_COUNT = "rating_count"  # Sort by number of reviews (high to low)
+    RATING_WEIGHTED = "rating_weighted"  # Sort by rating weighted by review count
+    PRICE_LOW = "price_low"  # Sort by price (low to high)
+    PRICE_HIGH = "price_high"  # Sort by price (high to low)
+
+
+# z for a 95% confidence Wilson interval
+WILSON_Z = 1.96
+
+
+class ProductColumns:
+    """Columnar view of a product list for vectorized ranking.
+
+    Each column is extracted from the products the first time it is used,
+    so a single-key sort only reads one attribute per product. Missing
+    prices and ratings are NaN and missing rating counts are 0. Build it
+    once per result set and rank it as many times as needed.
+    """
+
+    __slots__ = ("products", "_price", "_rating", "_rating_count")
+
+    def __init__(self, products: Sequence[AnyProduct]):
+        self.products = products
+        self._price: Optional[np.ndarray] = None
+        self._rating: Optional[np.ndarray] = None
+        self._rating_count: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def _column(self, values) -> np.ndarray:
+        return np.fromiter(values, dtype=np.float64, count=len(self.products))
+
+    @property
+    def price(self) -> np.ndarray:
+        if self._price is None:
+            self._price = self._column(
+                np.nan if p.price is None else p.price for p in self.products
+            )
+        return self._price
+
+    @property
+    def rating(self) -> np.ndarray:
+        if self._rating is None:
+            self._rating = self._column(
+                np.nan if p.rating is None else p.rating for p in self.products
+            )
+        return self._rating
+
+    @property
+    def rating_count(self) -> np.ndarray:
+        if self._rating_count is None:
+            self._rating_count = self._column(p.ratingCount or 0 for p in self.products)
+        return self._rating_count
+
+
+def wilson_scores(rating: np.ndarray, rating_count: np.ndarray) -> np.ndarray:
+    """Vectorized Wilson score of 5-star ratings, -1 where rating or count is missing"""
+    valid = (rating > 0) & (rating_count > 0)
+    n = np.where(valid, rating_count, 1.0)
+    # Convert 5-star rating to the number of positive ratings
+    pos = np.where(valid, rating, 0.0) / 5.0 * n
+    zsqr = WILSON_Z * WILSON_Z
+    scores = ((pos + zsqr / 2) / n) / (1 + zsqr / n)
+    return np.where(valid, scores, -1.0)
+
+
+def sort_key(columns: ProductColumns, sort_by: SortOption) -> np.ndarray:
+    """Return a per-product key where higher values rank first"""
+    if sort_by == SortOption.RELEVANCE:
+        # Keep original order (assumed to be by relevance)
+        return -np.arange(len(columns), dtype=np.float64)
+    if sort_by == SortOption.RATING:
+        return np.nan_to_num(columns.rating, nan=-1.0)
+    if sort_by == SortOption.RATING_COUNT:
+        return columns.rating_count
+    if sort_by == SortOption.RATING_WEIGHTED:
+        return wilson_scores(columns.rating, columns.rating_count)
+    if sort_by == SortOption.PRICE_LOW:
+        return -np.nan_to_num(columns.price, nan=np.inf)
+    if sort_by == SortOption.PRICE_HIGH:
+        return np.nan_to_num(columns.price, nan=-1.0)
+    raise ValueError(f"Unknown sort option: {sort_by}")
+
+
+def rank_products(
+    columns: ProductColumns,
+    sort_by: Union[SortOption, Sequence[SortOption]] = SortOption.RELEVANCE,
+    limit: Optional[int] = None,
+    mask: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Rank products without copying them.
+
+    Args:
+        columns: ProductColumns of the products to rank
+        sort_by: SortOption, or a sequence of them for a composite key where
+            later options break ties of earlier ones
+        limit: Optional maximum number of products to return
+        mask: Optional boolean array; only products where it is True are ranked
+
+    Returns:
+        Indices into the product list, best first. Ties keep their original
+        (relevance) order.
+    """
+    options = [sort_by] if isinstance(sort_by, SortOption) else list(sort_by)
+    candidates = np.arange(len(columns)) if mask is None else np.flatnonzero(mask)
+    n = len(candidates)
+    if limit is None or limit > n:
+        limit = n
+    if limit <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    # Relevance is the original order, so later options can't change anything
+    if not options or options[0] == SortOption.RELEVANCE:
+        return candidates[:limit]
+
+    keys = [sort_key(columns, option) for option in options]
+    if limit < n:
+        # Keep every product tied with the k-th best primary key, so the
+        # tie-breakers below decide the boundary like a full stable sort
+        primary = -keys[0][candidates]
+        threshold = np.partition(primary, limit - 1)[limit - 1]
+        candidates = candidates[primary <= threshold]
+
+    # lexsort is stable and uses its last key as the primary one
+    order = np.lexsort([-key[candidates] for key in reversed(keys)])
+    return candidates[order[:limit]]
+
+
+def get_sorted_products(
+    products: List[AnyProduct],
+    sort_by: Union[SortOption, Sequence[SortOption]] = SortOption.RELEVANCE,
+    limit: Optional[int] = None,
+) -> List[AnyProduct]:
+    """
+    Sort products by the specified option.
+
+    Args:
+        products: List of products to sort
+        sort_by: SortOption enum, or a sequence of them for a composite key
+        limit: Optional maximum number of products to return
+
+    Returns:
+        List of sorted products, optionally limited to specified count
+    """
+    if not products:
+        return []
+    indices = rank_products(ProductColumns(products), sort_by, limit)
+    return [products[i] for i in indices]
@@ -0,0 +1,85 @@
+from typing import List, Optional, Sequence
+import numpy as np
+from .product import AnyProduct
+from .ranking import ProductColumns, SortOption, rank_products
+from .search import SearchFilters, SearchParameters
+
+
+def _normalize_query(query: Optional[str]) -> str:
+    return " ".join((query or "").lower().replace("-", " ").split())
+
+
+def _within(new: Optional[float], old: Optional[float], narrower: str) -> bool:
+    """Whether bound `new` is at least as tight as `old` ("min" or "max")"""
+    if old is None:
+        return True
+    if new is None:
+        return False
+    return new >= old if narrower == "min" else new <= old
+
+
+class ResultSet:
+    """Products fetched for a search, kept so follow-up turns that only
+    change the sort order or narrow the price/rating filters can be answered
+    locally instead of searching again"""
+
+    __slots__ = ("search_params", "products", "columns")
+
+    def __init__(self, search_params: SearchParameters, products: Sequence[AnyProduct]):
+        self.search_params = search_params
+        self.products = products
+        self.columns = ProductColumns(products)
+
+    def can_refine(self, search_params: SearchParameters) -> bool:
+        """Whether search_params has the same query and filters that are the
+        same as, or narrower than, the ones this set was fetched with"""
+        if _normalize_query(search_params.base_query) != _normalize_query(
+            self.search_params.base_query
+        ):
+            return False
+
+        old = self.search_params.filters or SearchFilters()
+        new = search_params.filters or SearchFilters()
+        if bool(new.free_shipping) != bool(old.free_shipping):
+            return False
+        if bool(new.free_returns) != bool(old.free_returns):
+            return False
+
+        old_price = old.price_range
+        new_price = new.price_range
+        return (
+            _within(
+                new_price.min if new_price else None,
+                old_price.min if old_price else None,
+                "min",
+            )
+            and _within(
+                new_price.max if new_price else None,
+                old_price.max if old_price else None,
+                "max",
+            )
+            and _within(new.min_rating, old.min_rating, "min")
+        )
+
+    def refine(
+        self, search_params: SearchParameters, limit: Optional[int] = None
+    ) -> List[AnyProduct]:
+        """Filter and sort the stored products for search_params"""
+        mask = np.ones(len(self.products), dtype=np.bool_)
+        filters = search_params.filters
+        if filters and filters.price_range:
+            price = self.columns.price
+            # Products without a price ("Contact for price") can't match a range
+            mask &= price > 0
+            if filters.price_range.min is not None:
+                mask &= price >= filters.price_range.min
+            if filters.price_range.max is not None:
+                mask &= price <= filters.price_range.max
+        if filters and filters.min_rating:
+            # NaN ratings compare False, so unrated products are dropped
+            mask &= self.columns.rating >= filters.min_rating
+
+        indices = rank_products(
+            self.columns, search_params.sort_by or SortOption.RELEVANCE, limit, mask
+        )
+        return [self.products[i] for i in indices]
@@ -1,12 +1,19 @@
 import os
+import re
 import json
+import asyncio
 import aiohttp
 import ssl
 import certifi
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set, Tuple
 from pydantic import BaseModel, Field, conint, confloat
-from .product import Product
+from .product import AnyProduct, ProductRecord
 from .product_store import SortOption
+from .cache import TTLCache
+from .tracing import upstream_call
+from .usage import get_usage_tracker
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
 
 
 class PriceRange(BaseModel):
@@ -82,24 +89,154 @@ class SearchParameters(BaseModel):
 class ProductSearcher:
     """Handles product search operations using external APIs"""
 
-    def __init__(self):
+    BACKENDS = ("serper", "catalog", "auto")
+
+    def __init__(self, catalog: Optional[Any] = None):
         self.api_key = os.getenv("SERPER_API_KEY")
         if not self.api_key:
             raise ValueError("SERPER_API_KEY environment variable is not set")
+        # Overridable so load tests can point at a local stand-in
+        self.url = os.getenv("SERPER_URL", "https://google.serper.dev/shopping")
 
-    async def search_products(self, search_params: SearchParameters) -> List[Product]:
-        """
-        Search for products using Serper API with the provided search parameters
-        """
+        # Connection pool settings for the shared Serper session
+        self.pool_size = int(os.getenv("SERPER_POOL_SIZE", "20"))
+        self.dns_cache_ttl = int(os.getenv("SERPER_DNS_CACHE_TTL", "300"))
+        self.keepalive_timeout = float(os.getenv("SERPER_KEEPALIVE_TIMEOUT", "60"))
+        self.connect_timeout = float(os.getenv("SERPER_CONNECT_TIMEOUT", "5"))
+        self.read_timeout = float(os.getenv("SERPER_READ_TIMEOUT", "15"))
+
+        # Shared session, created in start() and closed in close()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._in_flight = 0
+        # Connection counters, from aiohttp trace signals
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.pool_waits = 0
+        self._waiting_for_connection = 0
+
+        # Result cache keyed by (normalized query, tbs, location).
+        # SERPER_CACHE_SIZE=0 disables caching.
+        cache_size = int(os.getenv("SERPER_CACHE_SIZE", "512"))
+        self.cache: Optional[TTLCache] = (
+            TTLCache(
+                max_size=cache_size,
+                ttl=float(os.getenv("SERPER_CACHE_TTL", "900")),
+                stale_ttl=float(os.getenv("SERPER_CACHE_STALE_TTL", "3600")),
+            )
+            if cache_size > 0
+            else None
+        )
+        self._background_tasks: Set[asyncio.Task] = set()
+
+        # In-flight upstream searches, shared by identical concurrent requests
+        self._pending_searches: Dict[Tuple[str, str, str, int], asyncio.Task] = {}
+        self.upstream_searches = 0
+        self.coalesced_searches = 0
+
+        # Optional local catalog (CatalogSearcher) built from upstream results.
+        # SEARCH_BACKEND picks the default backend: "serper", "catalog", or
+        # "auto" (catalog first, Serper if it has too few results).
+        self.catalog = catalog
+        self.backend = os.getenv("SEARCH_BACKEND", "serper")
+        self.catalog_min_results = int(os.getenv("CATALOG_MIN_RESULTS", "3"))
+        enabled = ("1", "true", "yes")
+        self.catalog_fallback = os.getenv("CATALOG_FALLBACK", "true").lower() in enabled
+        self.catalog_collect = os.getenv("CATALOG_COLLECT", "true").lower() in enabled
+        self.catalog_fallbacks = 0
+
+        # Fan-out mode: search several variants of the query concurrently and
+        # merge them with reciprocal-rank fusion within a wall-clock deadline
+        self.fanout = os.getenv("SEARCH_FANOUT", "false").lower() in enabled
+        self.fanout_max_variants = int(os.getenv("SEARCH_FANOUT_MAX_VARIANTS", "3"))
+        self.fanout_concurrency = int(os.getenv("SEARCH_FANOUT_CONCURRENCY", "3"))
+        self.fanout_deadline = float(os.getenv("SEARCH_FANOUT_DEADLINE", "4"))
+        self.fanout_rrf_k = int(os.getenv("SEARCH_FANOUT_RRF_K", "60"))
+        self.fanout_searches = 0
+        self.fanout_variants = 0
+        self.fanout_cancelled = 0
+        self.fanout_duplicates = 0
+
+    async def start(self):
+        """Create the shared keep-alive HTTP session (called on app startup)"""
+        if self._session is not None and not self._session.closed:
+            return
+
+        # Load the CA bundle once for the lifetime of the session
+        ssl_context = ssl.create_default_context(cafile=certifi.where())
+
+        connector = aiohttp.TCPConnector(
+            ssl=ssl_context,
+            limit=self.pool_size,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self.connect_timeout, sock_read=self.read_timeout
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector, timeout=timeout, trace_configs=[self._trace_config()]
+        )
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        """Count new, reused and queued connections for pool_stats()"""
+
+        async def on_create(session, context, params):
+            self.connections_created += 1
+
+        async def on_reuse(session, context, params):
+            self.connections_reused += 1
+
+        async def on_queued_start(session, context, params):
+            self.pool_waits += 1
+            self._waiting_for_connection += 1
+
+        async def on_queued_end(session, context, params):
+            self._waiting_for_connection -= 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_create)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        trace_config.on_connection_queued_start.append(on_queued_start)
+        trace_config.on_connection_queued_end.append(on_queued_end)
+        return trace_config
+
+    async def close(self):
+        """Close the shared HTTP session (called on app shutdown)"""
+        for task in list(self._background_tasks):
+            task.cancel()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it lazily if start() was not called"""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Return connection pool statistics for sizing the pool under load"""
+        connections = self.connections_created + self.connections_reused
+        return {
+            "pool_size": self.pool_size,
+            "in_flight": self._in_flight,
+            "waiting_for_connection": self._waiting_for_connection,
+            "pool_waits": self.pool_waits,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_rate": (
+                self.connections_reused / connections if connections else 0.0
+            ),
+        }
+
+    def _build_payload(self, search_params: SearchParameters) -> Dict[str, Any]:
+        """Build the Serper /shopping request payload from search parameters"""
         # Build the search query
         search_query = search_params.build_search_query()
 
         # Build the filters
         filters = search_params.filters or SearchFilters()
 
-        url = "https://google.serper.dev/shopping"
-        headers = {"X-API-KEY": self.api_key, "Content-Type": "application/json"}
-
         # Build tbs parameter for filters
         tbs_parts = ["mr:1"]  # Always include mr:1
 
@@ -135,34 +272,292 @@ class ProductSearcher:
         if len(tbs_parts) > 1:  # More than just mr:1
             payload["tbs"] = ",".join(tbs_parts)
 
-        # Create SSL context
-        ssl_context = ssl.create_default_context(cafile=certifi.where())
+        return payload
+
+    @staticmethod
+    def _cache_key(payload: Dict[str, Any]) -> Tuple[str, str, str, int]:
+        """Canonical cache key: normalized query, tbs string, location and page"""
+        query = " ".join(str(payload.get("q") or "").lower().split())
+        return (
+            query,
+            payload.get("tbs", ""),
+            payload.get("location", ""),
+            payload.get("page", 1),
+        )
+
+    def is_cached(self, search_params: SearchParameters) -> bool:
+        """
+        Whether a Serper search for these parameters has a fresh cached result.
+        Stale results are served, but refreshed with an upstream call.
+        """
+        if self.cache is None:
+            return False
+        key = self._cache_key(self._build_payload(search_params))
+        cached, is_stale = self.cache.peek(key)
+        return cached is not None and not is_stale
+
+    async def search_products(
+        self, search_params: SearchParameters, backend: Optional[str] = None
+    ) -> List[AnyProduct]:
+        """
+        Search for products with the provided search parameters, using Serper,
+        the local catalog, or the catalog with Serper as backup ("auto")
+        """
+        backend = backend or self.backend
+        if self.catalog is not None and backend in ("catalog", "auto"):
+            products = await self.catalog.search_products(search_params)
+            if backend == "catalog" or len(products) >= self.catalog_min_results:
+                return products
 
+        if self.fanout:
+            products = await self._search_fanout(search_params)
+        else:
+            products = await self._search_upstream(search_params)
+
+        # Serve from the catalog if Serper failed or found nothing
+        if not products and self.catalog is not None and self.catalog_fallback:
+            self.catalog_fallbacks += 1
+            products = await self.catalog.search_products(search_params)
+        return products
+
+    async def search_page(
+        self, search_params: SearchParameters, page: int
+    ) -> List[AnyProduct]:
+        """Fetch a later page of Serper results (page 1 is search_products)"""
+        return await self._search_upstream(search_params, page)
+
+    async def _search_upstream(
+        self, search_params: SearchParameters, page: int = 1
+    ) -> List[AnyProduct]:
+        """
+        Search for products using Serper API with the provided search parameters
+        """
+        payload = self._build_payload(search_params)
+        if page > 1:
+            payload["page"] = page
+        key = self._cache_key(payload)
+
+        if self.cache is not None:
+            cached, is_stale = self.cache.get(key)
+            if cached is not None:
+                if is_stale:
+                    self._schedule_refresh(key, payload)
+                return list(cached)
+
+        products = await self._fetch_shared(key, payload)
+        if products is None:
+            return []
+
+        # Each caller gets its own list so sorting one can't reorder another
+        return list(products)
+
+    def query_variants(self, search_params: SearchParameters) -> List[SearchParameters]:
+        """
+        Return up to fanout_max_variants versions of the search, starting with
+        the original: the query with hyphens replaced by spaces, then a
+        broader one without its leading modifier (e.g. a color)
+        """
+        query = search_params.build_search_query()
+        words = WORD_PATTERN.findall(query.lower())
+        candidates = [query, " ".join(words)]
+        if len(words) >= 3:
+            candidates.append(" ".join(words[1:]))
+
+        variants = []
+        seen = set()
+        for candidate in candidates:
+            normalized = " ".join(candidate.lower().split())
+            if not normalized or normalized in seen:
+                continue
+            seen.add(normalized)
+            variants.append(search_params.model_copy(update={"base_query": candidate}))
+        return variants[: self.fanout_max_variants]
+
+    async def _search_fanout(self, search_params: SearchParameters) -> List[AnyProduct]:
+        """
+        Search all query variants concurrently and fuse their rankings.
+        Variants still running at the deadline are cancelled and the results
+        that did arrive are returned.
+        """
+        variants = self.query_variants(search_params)
+        self.fanout_searches += 1
+        self.fanout_variants += len(variants)
+        semaphore = asyncio.Semaphore(self.fanout_concurrency)
+
+        async def search_variant(variant: SearchParameters) -> List[AnyProduct]:
+            async with semaphore:
+                return await self._search_upstream(variant)
+
+        tasks = [asyncio.create_task(search_variant(v)) for v in variants]
         try:
-            async with aiohttp.ClientSession(
-                connector=aiohttp.TCPConnector(ssl=ssl_context)
-            ) as session:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        print(
-                            f"Serper API error: Status {response.status}, Response: {error_text}"
-                        )
-                        return []
-
-                    data = await response.json()
-                    products = []
-
-                    for result in data.get("shopping", []):
-                        try:
-                            product = Product.from_serper_result(result)
-                            products.append(product)
-                        except Exception as e:
-                            print(f"Error processing product result: {e}")
-                            continue
-
-                    return products
+            done, pending = await asyncio.wait(tasks, timeout=self.fanout_deadline)
+        finally:
+            # Also cancels every variant if this search itself is cancelled
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        self.fanout_cancelled += len(pending)
+
+        # Keep the variants' order, so the original query wins fusion ties
+        rankings = []
+        for task in tasks:
+            if task in done and not task.cancelled() and task.exception() is None:
+                rankings.append(task.result())
+            elif task in done and not task.cancelled():
+                print(f"Error searching query variant: {task.exception()}")
+        return self._fuse_rankings(rankings)
+
+    @staticmethod
+    def _dedupe_keys(product: AnyProduct) -> List[str]:
+        """Keys under which two listings count as the same product"""
+        keys = []
+        link = (product.link or "").lower().split("?", 1)[0].split("#", 1)[0]
+        link = link.split("://", 1)[-1].removeprefix("www.").rstrip("/")
+        if link:
+            keys.append(f"link:{link}")
+        title = " ".join(WORD_PATTERN.findall((product.title or "").lower()))
+        if title:
+            keys.append(f"title:{product.source}:{title}")
+        return keys
+
+    def _fuse_rankings(self, rankings: List[List[AnyProduct]]) -> List[AnyProduct]:
+        """Merge ranked result lists with reciprocal-rank fusion, deduplicating
+        listings by normalized link or by source and title"""
+        cluster_of: Dict[str, int] = {}
+        products: List[AnyProduct] = []
+        scores: List[float] = []
+
+        for ranking in rankings:
+            scored = set()
+            for rank, product in enumerate(ranking):
+                keys = self._dedupe_keys(product)
+                cluster = next(
+                    (cluster_of[key] for key in keys if key in cluster_of), None
+                )
+                if cluster is None:
+                    cluster = len(products)
+                    products.append(product)
+                    scores.append(0.0)
+                else:
+                    self.fanout_duplicates += 1
+                for key in keys:
+                    cluster_of.setdefault(key, cluster)
+
+                # A listing repeated within one ranking only counts once
+                if cluster not in scored:
+                    scored.add(cluster)
+                    scores[cluster] += 1.0 / (self.fanout_rrf_k + rank + 1)
+
+        # sorted is stable, so ties keep first-seen order
+        order = sorted(range(len(products)), key=lambda i: -scores[i])
+        return [products[i] for i in order]
+
+    async def _fetch_shared(
+        self, key: Tuple[str, str, str, int], payload: Dict[str, Any]
+    ) -> Optional[Tuple[AnyProduct, ...]]:
+        """Fetch and cache results, sharing one upstream call between identical
+        concurrent searches"""
+        task = self._pending_searches.get(key)
+        if task is not None:
+            self.coalesced_searches += 1
+        else:
+            task = asyncio.create_task(self._fetch_and_cache(key, payload))
+            self._pending_searches[key] = task
+            task.add_done_callback(lambda _: self._pending_searches.pop(key, None))
+
+        # Shield so one cancelled waiter doesn't cancel the shared call
+        return await asyncio.shield(task)
+
+    async def _fetch_and_cache(
+        self, key: Tuple[str, str, str, int], payload: Dict[str, Any]
+    ) -> Optional[Tuple[AnyProduct, ...]]:
+        """Fetch results from upstream and store them in the cache"""
+        self.upstream_searches += 1
+        products = await self._fetch_products(payload)
+        if products is None:
+            return None
+
+        products = tuple(products)
+        if self.cache is not None:
+            self.cache.set(key, products)
+
+        # Grow the local catalog from upstream results in the background
+        if self.catalog is not None and self.catalog_collect and products:
+            task = asyncio.create_task(self.catalog.collect(list(products)))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+        return products
+
+    def _schedule_refresh(
+        self, key: Tuple[str, str, str, int], payload: Dict[str, Any]
+    ):
+        """Refresh a stale cache entry in the background"""
+        if key in self._pending_searches:
+            return
+
+        task = asyncio.create_task(self._fetch_shared(key, payload))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def search_stats(self) -> Dict[str, Any]:
+        """Return upstream search and coalescing counters"""
+        return {
+            "backend": self.backend,
+            "upstream_searches": self.upstream_searches,
+            "coalesced_searches": self.coalesced_searches,
+            "pending_searches": len(self._pending_searches),
+            "catalog_fallbacks": self.catalog_fallbacks,
+            "fanout": self.fanout,
+            "fanout_searches": self.fanout_searches,
+            "fanout_variants": self.fanout_variants,
+            "fanout_cancelled": self.fanout_cancelled,
+            "fanout_duplicates": self.fanout_duplicates,
+        }
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return search result cache statistics"""
+        if self.cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.cache.stats()}
+
+    async def _fetch_products(
+        self, payload: Dict[str, Any]
+    ) -> Optional[List[AnyProduct]]:
+        """Call the Serper /shopping endpoint. Returns None if the request failed."""
+        headers = {"X-API-KEY": self.api_key, "Content-Type": "application/json"}
+
+        try:
+            session = await self._get_session()
+            self._in_flight += 1
+            try:
+                with upstream_call("serper", "shopping") as call:
+                    async with session.post(
+                        self.url, headers=headers, json=payload
+                    ) as response:
+                        call.attributes["status"] = str(response.status)
+                        if response.status != 200:
+                            error_text = await response.text()
+                            print(
+                                f"Serper API error: Status {response.status}, Response: {error_text}"
+                            )
+                            return None
+
+                        data = await response.json()
+            finally:
+                self._in_flight -= 1
+            get_usage_tracker().record_search()
+
+            products = []
+            for result in data.get("shopping", []):
+                try:
+                    # Records skip validation; they're dumped at the response
+                    products.append(ProductRecord.from_serper_result(result))
+                except Exception as e:
+                    print(f"Error processing product result: {e}")
+                    continue
+
+            return products
 
         except Exception as e:
             print(f"Error searching products: {e}")
-            return []
+            return None
@@ -0,0 +1,246 @@
+import os
+import re
+import json
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Optional
+import faiss
+import numpy as np
+from .search import SearchParameters
+from .embedding_cache import get_embeddings
+
+# Words that change the extracted filters or query without moving the
+# embedding much ("red dress under $50" vs "blue dress under $100")
+ATTRIBUTE_WORDS = frozenset("""
+    black white red blue green yellow orange purple pink brown grey gray beige
+    navy gold silver tan cream ivory teal maroon burgundy olive khaki
+    xxs xs xl xxl xxxl small medium large extra petite plus tall
+    mens men's womens women's boys girls kids baby toddler
+    cheap cheapest budget affordable inexpensive premium luxury expensive
+    under over below above between less more than max min least most
+    free shipping returns star stars rated rating reviews best top
+    """.split())
+
+ATTRIBUTE_PATTERN = re.compile(r"\d+(?:\.\d+)?|[a-z]+(?:'s)?")
+
+
+def message_attributes(message: str) -> FrozenSet[str]:
+    """Numbers and attribute words of a message, which a cache hit must share"""
+    return frozenset(
+        token
+        for token in ATTRIBUTE_PATTERN.findall(message.lower().replace(",", ""))
+        if token[0].isdigit() or token in ATTRIBUTE_WORDS
+    )
+
+
+class SemanticCache:
+    """Nearest-neighbor cache of SearchParameters for first-turn messages.
+
+    Messages are embedded and stored in a FAISS inner-product index over
+    normalized vectors, so scores are cosine similarities. A lookup returns
+    the stored SearchParameters of the nearest message when its similarity
+    is at or above `threshold` and both messages have the same numbers and
+    attribute words (colors, sizes, price and rating terms); paraphrases
+    differing only in those would otherwise get the wrong filters. The
+    least recently used entries are evicted once `max_size` is reached.
+    Every `save_every` additions the cache is saved in a worker thread.
+    """
+
+    INDEX_FILE = "semantic_cache.faiss"
+    ENTRIES_FILE = "semantic_cache.json"
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_size: int = 5000,
+        path: Optional[str] = None,
+        save_every: int = 50,
+    ):
+        self.embeddings = get_embeddings()
+        self.threshold = threshold
+        self.max_size = max_size
+        self.path = path
+        self.save_every = save_every
+
+        self.index: Optional[faiss.IndexIDMap2] = None
+        # id -> {"message": str, "params": json}, in LRU order
+        self.entries: "OrderedDict[int, Dict[str, str]]" = OrderedDict()
+        self._next_id = 0
+        self._unsaved = 0
+        self._save_task: Optional[asyncio.Task] = None
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.attribute_mismatches = 0
+        self.evictions = 0
+        self.errors = 0
+
+        if path:
+            self.load()
+
+    @classmethod
+    def from_env(cls) -> Optional["SemanticCache"]:
+        """Create a cache from SEMANTIC_CACHE_* environment variables, or None if disabled"""
+        if os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() not in (
+            "1",
+            "true",
+            "yes",
+        ):
+            return None
+        return cls(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+            max_size=int(os.getenv("SEMANTIC_CACHE_SIZE", "5000")),
+            path=os.getenv("SEMANTIC_CACHE_PATH") or None,
+            save_every=int(os.getenv("SEMANTIC_CACHE_SAVE_EVERY", "50")),
+        )
+
+    async def embed(self, message: str) -> np.ndarray:
+        """Embed a message as a normalized float32 row vector"""
+        vector = np.array(
+            [await self.embeddings.aembed_query(message)], dtype=np.float32
+        )
+        faiss.normalize_L2(vector)
+        return vector
+
+    def lookup(self, vector: np.ndarray, message: str) -> Optional[SearchParameters]:
+        """
+        Return cached parameters of the nearest message above the threshold,
+        if it has the same numbers and attribute words as `message`
+        """
+        if self.index is None or self.index.ntotal == 0:
+            self.misses += 1
+            return None
+
+        scores, ids = self.index.search(vector, 1)
+        entry_id = int(ids[0][0])
+        if entry_id < 0 or scores[0][0] < self.threshold:
+            self.misses += 1
+            return None
+
+        entry = self.entries.get(entry_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        if message_attributes(entry["message"]) != message_attributes(message):
+            self.attribute_mismatches += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(entry_id)
+        self.hits += 1
+        return SearchParameters.model_validate_json(entry["params"])
+
+    def add(self, vector: np.ndarray, message: str, params: SearchParameters):
+        """Store parameters for an embedded message, evicting the LRU entry if full"""
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+
+        while self.entries and len(self.entries) >= self.max_size:
+            evicted_id, _ = self.entries.popitem(last=False)
+            self.index.remove_ids(np.array([evicted_id], dtype=np.int64))
+            self.evictions += 1
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self.index.add_with_ids(vector, np.array([entry_id], dtype=np.int64))
+        self.entries[entry_id] = {
+            "message": message,
+            "params": params.model_dump_json(),
+        }
+
+        self._unsaved += 1
+        if (
+            self.path
+            and self._unsaved >= self.save_every
+            and (self._save_task is None or self._save_task.done())
+        ):
+            self._save_task = asyncio.get_running_loop().create_task(self.save_async())
+
+    def _snapshot(self) -> Optional[tuple]:
+        """Serialize the index and entries, for writing outside the event loop"""
+        if not self.path or self.index is None:
+            return None
+        self._unsaved = 0
+        entries = json.dumps(
+            {
+                "next_id": self._next_id,
+                "entries": [[k, v] for k, v in self.entries.items()],
+            }
+        )
+        return faiss.serialize_index(self.index), entries
+
+    def _write(self, snapshot: tuple):
+        index, entries = snapshot
+        os.makedirs(self.path, exist_ok=True)
+        # Replace both files only once both are written
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        entries_path = os.path.join(self.path, self.ENTRIES_FILE)
+        with open(index_path + ".tmp", "wb") as f:
+            f.write(index.tobytes())
+        with open(entries_path + ".tmp", "w") as f:
+            f.write(entries)
+        os.replace(index_path + ".tmp", index_path)
+        os.replace(entries_path + ".tmp", entries_path)
+
+    def save(self):
+        """Persist the index and entries to `path`"""
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            self._write(snapshot)
+
+    async def save_async(self):
+        """Persist the index and entries, writing the files in a worker thread"""
+        try:
+            snapshot = self._snapshot()
+            if snapshot is not None:
+                await asyncio.to_thread(self._write, snapshot)
+        except Exception as e:
+            print(f"Error saving semantic cache: {e}")
+
+    def load(self):
+        """Load a previously saved index and entries from `path`, if present"""
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        entries_path = os.path.join(self.path, self.ENTRIES_FILE)
+        if not (os.path.exists(index_path) and os.path.exists(entries_path)):
+            return
+        try:
+            self.index = faiss.read_index(index_path)
+            with open(entries_path) as f:
+                data = json.load(f)
+            self.entries = OrderedDict((int(k), v) for k, v in data["entries"])
+            self._next_id = data["next_id"]
+        except Exception as e:
+            print(f"Error loading semantic cache: {e}")
+            self.index = None
+            self.entries = OrderedDict()
+            self._next_id = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "attribute_mismatches": self.attribute_mismatches,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_semantic_cache: Optional[SemanticCache] = None
+_semantic_cache_loaded = False
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Return the process-wide semantic cache, or None if disabled"""
+    global _semantic_cache, _semantic_cache_loaded
+    if not _semantic_cache_loaded:
+        _semantic_cache = SemanticCache.from_env()
+        _semantic_cache_loaded = True
+    return _semantic_cache
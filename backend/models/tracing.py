@@ -0,0 +1,476 @@
+import os
+import re
+import time
+import uuid
+import asyncio
+import secrets
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import aiohttp
+import httpx
+from .metrics import get_metrics
+
+TRACEPARENT_PATTERN = re.compile(r"00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}")
+REQUEST_ID_PATTERN = re.compile(r"[\w.\-]{1,128}")
+
+
+class Span:
+    """One timed stage of a request"""
+
+    __slots__ = (
+        "name",
+        "span_id",
+        "parent_id",
+        "start",
+        "end",
+        "attributes",
+        "error",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        parent_id: Optional[str],
+        attributes: Dict[str, Any],
+        start: Optional[float] = None,
+    ):
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        # Wall-clock seconds, for export
+        self.start = time.time() if start is None else start
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+
+class Trace:
+    """Spans of one HTTP request, identified by its request ID"""
+
+    def __init__(
+        self,
+        request_id: str,
+        name: str,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+    ):
+        self.request_id = request_id
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.spans: List[Span] = []
+        self.root = Span(name, parent_id, {"request.id": request_id})
+        self.spans.append(self.root)
+
+    @classmethod
+    def from_headers(cls, name: str, headers: Dict[str, str]) -> "Trace":
+        """Start a trace, continuing the caller's W3C traceparent and
+        X-Request-ID if they sent valid ones"""
+        trace_id = parent_id = None
+        match = TRACEPARENT_PATTERN.fullmatch(headers.get("traceparent", ""))
+        if match:
+            trace_id, parent_id = match.groups()
+        trace_id = trace_id or uuid.uuid4().hex
+        request_id = headers.get("x-request-id", "")
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = trace_id
+        return cls(request_id, name, trace_id, parent_id)
+
+    def breakdown(self) -> str:
+        """One line per span, indented under its parent, for slow-request logs"""
+        children: Dict[Optional[str], List[Span]] = {}
+        for span in self.spans:
+            children.setdefault(span.parent_id, []).append(span)
+
+        lines = []
+
+        def walk(span: Span, depth: int):
+            status = f" ({span.error})" if span.error else ""
+            lines.append(
+                f"{'  ' * depth}{span.name}: {span.duration * 1000:.0f} ms{status}"
+            )
+            for child in sorted(children.get(span.span_id, []), key=lambda s: s.start):
+                walk(child, depth + 1)
+
+        walk(self.root, 0)
+        return "\n".join(lines)
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def current_stage() -> str:
+    """Name of the innermost open span, or "other" outside any span"""
+    span = _current_span.get()
+    return span.name if span is not None else "other"
+
+
+def current_endpoint() -> str:
+    """Method and path of the current request, or "background" outside one"""
+    trace = _current_trace.get()
+    return trace.root.name if trace is not None else "background"
+
+
+def _parent_id() -> Optional[str]:
+    span = _current_span.get()
+    if span is not None:
+        return span.span_id
+    trace = _current_trace.get()
+    return trace.root.span_id if trace else None
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Time a stage. The duration goes to the stage_duration_seconds histogram
+    and, inside a request, the span is added to the request's trace.
+    """
+    current = Span(name, _parent_id(), attributes)
+    # Not a reset token: spans held across a yield in a streaming generator
+    # may be closed by the event loop's asyncgen finalizer in another Context
+    previous = _current_span.get()
+    trace = _current_trace.get()
+    _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        current.end = current.start + elapsed
+        _current_span.set(previous)
+        get_metrics().stage_duration.observe(elapsed, name)
+        if trace is not None:
+            trace.spans.append(current)
+
+
+def traced(name: str) -> Callable:
+    """Decorator running a function (sync or async) inside span(name)"""
+
+    def decorate(function: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+@contextmanager
+def upstream_call(service: str, operation: str, retry: bool = False) -> Iterator[Span]:
+    """
+    Time a call to OpenAI or Serper, recording it in the upstream metrics
+    and as a span. Set `.attributes["status"]` on the yielded span to the
+    response status; it defaults to "ok", or "error" if the call raises.
+    """
+    metrics = get_metrics()
+    if retry:
+        metrics.upstream_retries.inc(service, operation)
+    started = time.perf_counter()
+    with span(f"{service}.{operation}", service=service) as call:
+        call.attributes["status"] = "ok"
+        try:
+            yield call
+        except BaseException:
+            call.attributes["status"] = "error"
+            raise
+        finally:
+            metrics.upstream_duration.observe(
+                time.perf_counter() - started, service, operation
+            )
+            metrics.upstream_requests.inc(service, operation, call.attributes["status"])
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """httpx transport that records every attempt of an OpenAI SDK call,
+    including the SDK's own retries, as an upstream call"""
+
+    def __init__(
+        self, service: str, transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.service = service
+        # Same connection limits the OpenAI SDK uses for its default transport
+        self.transport = transport or httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=1000,
+                max_keepalive_connections=100,
+                keepalive_expiry=5.0,
+            )
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # "/v1/chat/completions" -> "chat.completions"
+        operation = ".".join(request.url.path.strip("/").split("/")[1:]) or "request"
+        retry = request.headers.get("x-stainless-retry-count", "0") not in ("", "0")
+        with upstream_call(self.service, operation, retry=retry) as call:
+            response = await self.transport.handle_async_request(request)
+            call.attributes["status"] = str(response.status_code)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def instrumented_openai_http_client() -> httpx.AsyncClient:
+    """An http_client for AsyncOpenAI that records upstream metrics and spans"""
+    from openai import DefaultAsyncHttpxClient
+
+    return DefaultAsyncHttpxClient(transport=InstrumentedTransport("openai"))
+
+
+class OTLPExporter:
+    """Sends finished traces to an OpenTelemetry collector as OTLP/HTTP JSON.
+
+    Traces are queued and posted in batches every `interval` seconds by a
+    background task, so exporting never delays a response. When the queue
+    holds `max_queue` traces, new ones are dropped.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        service_name: str = "ai-shopping-assistant",
+        interval: float = 2.0,
+        max_queue: int = 2048,
+    ):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.interval = interval
+        self.max_queue = max_queue
+        self._queue: List[Trace] = []
+        self._task: Optional[asyncio.Task] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        # Counters
+        self.exported_spans = 0
+        self.dropped_traces = 0
+        self.export_errors = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["OTLPExporter"]:
+        """Create from the standard OTEL_* environment variables, or None if
+        no collector endpoint is configured"""
+        endpoint = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT")
+        if not endpoint:
+            base = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+            if not base:
+                return None
+            endpoint = base.rstrip("/") + "/v1/traces"
+        return cls(
+            endpoint,
+            service_name=os.getenv("OTEL_SERVICE_NAME", "ai-shopping-assistant"),
+            interval=float(os.getenv("OTEL_EXPORT_INTERVAL", "2")),
+        )
+
+    def export(self, trace: Trace):
+        if len(self._queue) >= self.max_queue:
+            self.dropped_traces += 1
+            return
+        self._queue.append(trace)
+
+    def _payload(self, traces: List[Trace]) -> Dict[str, Any]:
+        def attribute(key: str, value: Any) -> Dict[str, Any]:
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        spans = []
+        for trace in traces:
+            for s in trace.spans:
+                spans.append(
+                    {
+                        "traceId": trace.trace_id,
+                        "spanId": s.span_id,
+                        "parentSpanId": s.parent_id or "",
+                        "name": s.name,
+                        # SERVER for the request, INTERNAL for its stages
+                        "kind": 2 if s is trace.root else 1,
+                        "startTimeUnixNano": str(int(s.start * 1e9)),
+                        "endTimeUnixNano": str(int((s.end or s.start) * 1e9)),
+                        "attributes": [
+                            attribute(k, v) for k, v in s.attributes.items()
+                        ],
+                        "status": (
+                            {"code": 2, "message": s.error} if s.error else {"code": 0}
+                        ),
+                    }
+                )
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [attribute("service.name", self.service_name)]
+                    },
+                    "scopeSpans": [
+                        {"scope": {"name": "ai-shopping-assistant"}, "spans": spans}
+                    ],
+                }
+            ]
+        }
+
+    async def flush(self):
+        """Post all queued traces"""
+        if not self._queue:
+            return
+        traces, self._queue = self._queue, []
+        payload = self._payload(traces)
+        span_count = len(payload["resourceSpans"][0]["scopeSpans"][0]["spans"])
+        try:
+            if self._session is None:
+                self._session = aiohttp.ClientSession(
+                    timeout=aiohttp.ClientTimeout(total=10)
+                )
+            async with self._session.post(self.endpoint, json=payload) as response:
+                if response.status >= 300:
+                    raise ValueError(f"Status {response.status}")
+            self.exported_spans += span_count
+        except Exception as e:
+            print(f"Error exporting traces: {e}")
+            self.export_errors += 1
+
+    async def _export_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        """Start the background exporter (called on app startup)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._export_loop())
+
+    async def stop(self):
+        """Flush remaining traces and stop (called on app shutdown)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "endpoint": self.endpoint,
+            "queued_traces": len(self._queue),
+            "exported_spans": self.exported_spans,
+            "dropped_traces": self.dropped_traces,
+            "export_errors": self.export_errors,
+        }
+
+
+class TracingMiddleware:
+    """ASGI middleware that traces each HTTP request.
+
+    Assigns a request ID (the caller's X-Request-ID, or a new one), returns
+    it in the X-Request-ID response header, records request metrics when
+    the last body chunk is sent, so streamed responses are timed to the
+    end, and hands the finished trace to the exporter. Requests slower than
+    `slow_threshold` seconds are logged with their per-stage breakdown.
+    """
+
+    def __init__(
+        self,
+        app,
+        exporter: Optional[OTLPExporter] = None,
+        slow_threshold: Optional[float] = None,
+    ):
+        self.app = app
+        self.exporter = exporter
+        self.slow_threshold = slow_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {
+            key.decode("latin-1"): value.decode("latin-1")
+            for key, value in scope["headers"]
+        }
+        method = scope["method"]
+        trace = Trace.from_headers(f"{method} {scope['path']}", headers)
+        trace.root.attributes.update(
+            {"http.method": method, "http.target": scope["path"]}
+        )
+        token = _current_trace.set(trace)
+        started = time.perf_counter()
+        status = 500
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            elapsed = time.perf_counter() - started
+            trace.root.end = trace.root.start + elapsed
+            # Label by route template, not the raw path, to bound cardinality
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            trace.root.name = f"{method} {route_path}"
+            trace.root.attributes.update(
+                {"http.route": route_path, "http.status_code": status}
+            )
+            metrics = get_metrics()
+            metrics.http_requests.inc(method, route_path, str(status))
+            metrics.http_duration.observe(elapsed, method, route_path)
+            if self.exporter is not None:
+                self.exporter.export(trace)
+            if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+                print(
+                    f"Slow request {trace.request_id} ({elapsed * 1000:.0f} ms):\n"
+                    f"{trace.breakdown()}"
+                )
+
+        async def send_with_trace(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", trace.request_id.encode("latin-1"))
+                ]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as e:
+            trace.root.error = type(e).__name__
+            raise
+        finally:
+            finish()
+            _current_trace.reset(token)
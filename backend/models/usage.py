@@ -0,0 +1,279 @@
+import os
+import json
+import hashlib
+import threading
+import contextvars
+from types import SimpleNamespace
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from .metrics import get_metrics
+from .tracing import current_endpoint, current_stage
+
+# USD per million (prompt, completion) tokens
+DEFAULT_MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "text-embedding-ada-002": (0.10, 0.0),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens locally with tiktoken, estimating if it is unavailable"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken unavailable, estimating token counts: {e}")
+            _encoding = False
+    if _encoding is False:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text))
+
+
+_current_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_session", default=None
+)
+
+
+def set_current_session(session_id: str):
+    """Attribute usage in the current request (and the tasks it starts) to a session"""
+    _current_session.set(session_id)
+
+
+class Usage:
+    """Token, call and cost totals for one session, endpoint, stage or model"""
+
+    __slots__ = (
+        "prompt_tokens",
+        "completion_tokens",
+        "llm_calls",
+        "serper_calls",
+        "cost_usd",
+    )
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.llm_calls = 0
+        self.serper_calls = 0
+        self.cost_usd = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "llm_calls": self.llm_calls,
+            "serper_calls": self.serper_calls,
+            "cost_usd": round(self.cost_usd, 6),
+        }
+
+
+class UsageTracker:
+    """Accounts OpenAI tokens and Serper calls per session, endpoint, stage
+    and model, with optional per-session budgets.
+
+    The session comes from set_current_session(), and the endpoint and stage
+    from the current request trace and span. Cost is estimated from
+    `model_prices` (USD per million prompt and completion tokens) and
+    `serper_cost` per search. At most `max_sessions` sessions are kept,
+    least recently active first out. A session past `token_budget` tokens or
+    `cost_budget` USD is switched to cheaper paths by the callers.
+    """
+
+    def __init__(
+        self,
+        model_prices: Optional[Dict[str, Tuple[float, float]]] = None,
+        serper_cost: float = 0.001,
+        token_budget: Optional[int] = None,
+        cost_budget: Optional[float] = None,
+        max_sessions: int = 10000,
+    ):
+        self.model_prices = dict(DEFAULT_MODEL_PRICES)
+        self.model_prices.update(model_prices or {})
+        self.serper_cost = serper_cost
+        self.token_budget = token_budget
+        self.cost_budget = cost_budget
+        self.max_sessions = max_sessions
+
+        self.total = Usage()
+        self.by_session: "OrderedDict[str, Usage]" = OrderedDict()
+        self.by_endpoint: Dict[str, Usage] = {}
+        self.by_stage: Dict[str, Usage] = {}
+        self.by_model: Dict[str, Usage] = {}
+        # Embedding batches may be recorded from worker threads
+        self._lock = threading.Lock()
+
+        # Counters
+        self.unpriced_calls = 0
+        self.budget_fallbacks: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "UsageTracker":
+        """Create from USAGE_* and SESSION_*_BUDGET environment variables"""
+        prices = json.loads(os.getenv("USAGE_MODEL_PRICES", "{}"))
+        token_budget = os.getenv("SESSION_TOKEN_BUDGET")
+        cost_budget = os.getenv("SESSION_COST_BUDGET")
+        return cls(
+            model_prices={model: tuple(price) for model, price in prices.items()},
+            serper_cost=float(os.getenv("USAGE_SERPER_COST", "0.001")),
+            token_budget=int(token_budget) if token_budget else None,
+            cost_budget=float(cost_budget) if cost_budget else None,
+            max_sessions=int(os.getenv("USAGE_MAX_SESSIONS", "10000")),
+        )
+
+    def _price(self, model: str) -> Optional[Tuple[float, float]]:
+        price = self.model_prices.get(model)
+        if price is None:
+            # Dated snapshots ("gpt-4o-mini-2024-07-18") use the base price
+            matches = [name for name in self.model_prices if model.startswith(name)]
+            if matches:
+                price = self.model_prices[max(matches, key=len)]
+        return price
+
+    def _targets(self, model: Optional[str]) -> List[Usage]:
+        """Usage records to update for the current session, endpoint and stage"""
+        targets = [self.total]
+        session_id = _current_session.get()
+        if session_id is not None:
+            usage = self.by_session.get(session_id)
+            if usage is None:
+                usage = self.by_session[session_id] = Usage()
+                while len(self.by_session) > self.max_sessions:
+                    self.by_session.popitem(last=False)
+            else:
+                self.by_session.move_to_end(session_id)
+            targets.append(usage)
+        targets.append(self.by_endpoint.setdefault(current_endpoint(), Usage()))
+        targets.append(self.by_stage.setdefault(current_stage(), Usage()))
+        if model is not None:
+            targets.append(self.by_model.setdefault(model, Usage()))
+        return targets
+
+    def record_llm(self, model: str, usage: Any):
+        """Record the `usage` of an OpenAI response (ignored if None)"""
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        price = self._price(model)
+        if price is None:
+            self.unpriced_calls += 1
+            cost = 0.0
+        else:
+            cost = (prompt_tokens * price[0] + completion_tokens * price[1]) / 1e6
+
+        with self._lock:
+            for target in self._targets(model):
+                target.prompt_tokens += prompt_tokens
+                target.completion_tokens += completion_tokens
+                target.llm_calls += 1
+                target.cost_usd += cost
+
+        metrics = get_metrics()
+        stage = current_stage()
+        metrics.llm_tokens.inc(stage, model, "prompt", amount=prompt_tokens)
+        metrics.llm_tokens.inc(stage, model, "completion", amount=completion_tokens)
+        metrics.usage_cost.inc(stage, amount=cost)
+
+    def record_embeddings(self, model: str, texts: List[str]):
+        """
+        Record one embeddings request. langchain doesn't expose the response
+        usage, so the input tokens are counted locally.
+        """
+        tokens = sum(count_tokens(text) for text in texts)
+        self.record_llm(model, SimpleNamespace(prompt_tokens=tokens))
+
+    def record_search(self):
+        """Record one Serper call"""
+        with self._lock:
+            for target in self._targets(None):
+                target.serper_calls += 1
+                target.cost_usd += self.serper_cost
+        get_metrics().usage_cost.inc(current_stage(), amount=self.serper_cost)
+
+    def over_budget(self) -> bool:
+        """Whether the current session has used up its token or cost budget"""
+        if self.token_budget is None and self.cost_budget is None:
+            return False
+        session_id = _current_session.get()
+        usage = self.by_session.get(session_id) if session_id else None
+        if usage is None:
+            return False
+        if self.token_budget is not None and usage.total_tokens >= self.token_budget:
+            return True
+        return self.cost_budget is not None and usage.cost_usd >= self.cost_budget
+
+    def record_fallback(self, path: str):
+        """Count a cheaper path taken because the session was over budget"""
+        self.budget_fallbacks[path] = self.budget_fallbacks.get(path, 0) + 1
+
+    @staticmethod
+    def session_label(session_id: str) -> str:
+        """
+        Stable label for a session in reports. Session IDs are the only
+        credential for a conversation, so they are never listed.
+        """
+        return hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:12]
+
+    def session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return one session's usage, or None if it has none recorded"""
+        usage = self.by_session.get(session_id)
+        if usage is None:
+            return None
+        return {"session": self.session_label(session_id), **usage.to_dict()}
+
+    def report(self, top_sessions: int = 20) -> Dict[str, Any]:
+        """Totals by endpoint, stage and model, and the costliest sessions"""
+        with self._lock:
+            sessions = sorted(
+                self.by_session.items(), key=lambda item: item[1].cost_usd, reverse=True
+            )[:top_sessions]
+
+            def by_cost(records: Dict[str, Usage]) -> Dict[str, Dict[str, Any]]:
+                ordered = sorted(records.items(), key=lambda item: -item[1].cost_usd)
+                return {name: usage.to_dict() for name, usage in ordered}
+
+            return {
+                "total": self.total.to_dict(),
+                "by_endpoint": by_cost(self.by_endpoint),
+                "by_stage": by_cost(self.by_stage),
+                "by_model": by_cost(self.by_model),
+                "top_sessions": [
+                    {"session": self.session_label(session_id), **usage.to_dict()}
+                    for session_id, usage in sessions
+                ],
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        """Return totals and budget counters"""
+        return {
+            **self.total.to_dict(),
+            "tracked_sessions": len(self.by_session),
+            "token_budget": self.token_budget,
+            "cost_budget": self.cost_budget,
+            "unpriced_calls": self.unpriced_calls,
+            "budget_fallbacks": dict(self.budget_fallbacks),
+        }
+
+
+_usage_tracker: Optional[UsageTracker] = None
+
+
+def get_usage_tracker() -> UsageTracker:
+    """Return the process-wide usage tracker"""
+    global _usage_tracker
+    if _usage_tracker is None:
+        _usage_tracker = UsageTracker.from_env()
+    return _usage_tracker
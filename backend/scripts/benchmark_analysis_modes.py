@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import asyncio
+import statistics
+from types import SimpleNamespace
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+from models.conversation import ConversationContext
+
+# Load environment variables
+load_dotenv()
+
+DATA_PATH = os.path.join(
+    os.path.dirname(__file__), "data", "recorded_conversations.json"
+)
+MODES = ["two_call", "single_call"]
+
+
+class UsageRecordingClient:
+    """Wraps AsyncOpenAI and records token usage of every completion"""
+
+    def __init__(self, client: AsyncOpenAI):
+        self.client = client
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.beta = SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(parse=self._parse))
+        )
+
+    def _record(self, response):
+        self.calls += 1
+        if response.usage:
+            self.prompt_tokens += response.usage.prompt_tokens
+            self.completion_tokens += response.usage.completion_tokens
+        return response
+
+    async def _create(self, **kwargs):
+        return self._record(await self.client.chat.completions.create(**kwargs))
+
+    async def _parse(self, **kwargs):
+        return self._record(await self.client.beta.chat.completions.parse(**kwargs))
+
+
+def load_turns():
+    """Yield (conversation name, user message, preceding history) for every user turn"""
+    with open(DATA_PATH) as f:
+        conversations = json.load(f)
+    for conversation in conversations:
+        turns = conversation["turns"]
+        for i, turn in enumerate(turns):
+            if turn["role"] == "user":
+                yield conversation["name"], turn["content"], turns[:i]
+
+
+async def run_mode(mode: str, client: AsyncOpenAI, repeat: int):
+    """Run every recorded user turn through analyze_user_input in the given mode"""
+    os.environ["ANALYSIS_MODE"] = mode
+    latencies = []
+    recorder = UsageRecordingClient(client)
+
+    for _ in range(repeat):
+        for name, message, history in load_turns():
+            context = ConversationContext()
+            context._client = recorder
+            start = time.perf_counter()
+            await context.analyze_user_input(message, history)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    turns = len(latencies)
+    return {
+        "mode": mode,
+        "turns": turns,
+        "llm_calls": recorder.calls,
+        "latency_ms_p50": statistics.median(latencies),
+        "latency_ms_mean": statistics.mean(latencies),
+        "latency_ms_max": max(latencies),
+        "prompt_tokens_per_turn": recorder.prompt_tokens / turns,
+        "completion_tokens_per_turn": recorder.completion_tokens / turns,
+    }
+
+
+async def main():
+    # Make sure caches don't hide the real cost of each mode
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+
+    repeat = int(os.getenv("BENCHMARK_REPEAT", "3"))
+    client = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"])
+
+    results = [await run_mode(mode, client, repeat) for mode in MODES]
+
+    print(
+        f"{'mode':<12} {'turns':>6} {'calls':>6} {'p50 ms':>9} {'mean ms':>9} "
+        f"{'max ms':>9} {'in tok':>8} {'out tok':>8}"
+    )
+    for r in results:
+        print(
+            f"{r['mode']:<12} {r['turns']:>6} {r['llm_calls']:>6} "
+            f"{r['latency_ms_p50']:>9.0f} {r['latency_ms_mean']:>9.0f} "
+            f"{r['latency_ms_max']:>9.0f} {r['prompt_tokens_per_turn']:>8.0f} "
+            f"{r['completion_tokens_per_turn']:>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
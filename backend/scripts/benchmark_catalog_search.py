@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import random
+import statistics
+import numpy as np
+
+# The benchmark uses local embeddings and never calls the API
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+from models.catalog_search import CatalogSearcher, tokenize
+from models.product import Product
+from models.product_store import ProductStore
+from models.search import SearchFilters, PriceRange
+
+DIM = 64
+BATCH = 10000
+QUERIES = 200
+
+ADJECTIVES = "black white red blue pink green leather waterproof wireless vintage kids mens womens large small premium budget organic".split()
+NOUNS = "shoes boots jacket backpack laptop bag headphones keyboard lamp chair desk watch dress sneakers toy lego set mug blender".split()
+STORES = "Amazon Walmart Target BestBuy Etsy eBay Macy's Nordstrom".split()
+
+
+class LocalEmbeddings:
+    """Bag-of-words random vectors, so benchmarks don't call the embeddings API"""
+
+    model = "benchmark"
+
+    def __init__(self):
+        self.rng = np.random.default_rng(0)
+        self.vocab = {}
+
+    def _vector(self, text):
+        vector = np.zeros(DIM, dtype=np.float32)
+        for token in tokenize(text):
+            if token not in self.vocab:
+                self.vocab[token] = self.rng.standard_normal(DIM).astype(np.float32)
+            vector += self.vocab[token]
+        return vector
+
+    def embed_documents(self, texts):
+        return np.stack([self._vector(text) for text in texts])
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def make_products(start, count, rng):
+    products = []
+    for i in range(start, start + count):
+        title = " ".join(
+            [rng.choice(ADJECTIVES), rng.choice(ADJECTIVES), rng.choice(NOUNS)]
+        )
+        price = round(rng.uniform(5, 500), 2)
+        products.append(
+            Product.model_construct(
+                id=str(i),
+                title=f"{title} {i}",
+                description="",
+                price=price,
+                price_str=f"${price:,.2f}",
+                link=f"https://example.com/p/{i}",
+                imageUrl="",
+                rating=round(rng.uniform(1, 5), 1) if rng.random() < 0.8 else None,
+                ratingCount=rng.randint(0, 5000),
+                delivery=None,
+                source=rng.choice(STORES),
+            )
+        )
+    return products
+
+
+def build_catalog(size):
+    store = ProductStore()
+    store.embeddings = LocalEmbeddings()
+    catalog = CatalogSearcher(store=store)
+    rng = random.Random(size)
+    for start in range(0, size, BATCH):
+        catalog.add_products(make_products(start, min(BATCH, size - start), rng))
+    return catalog
+
+
+def run_queries(catalog):
+    rng = random.Random(1)
+    latencies = []
+    for _ in range(QUERIES):
+        query = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+        filters = None
+        if rng.random() < 0.5:
+            filters = SearchFilters(
+                price_range=PriceRange(max=rng.choice([50, 100, 200])),
+                min_rating=rng.choice([None, 3.0, 4.0]),
+            )
+        start = time.perf_counter()
+        catalog.search(query, filters, k=60)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "max": latencies[-1],
+    }
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    print(f"{'products':>10} {'build s':>9} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for size in sizes:
+        start = time.perf_counter()
+        catalog = build_catalog(size)
+        build = time.perf_counter() - start
+        result = run_queries(catalog)
+        print(
+            f"{size:>10} {build:>9.1f} {result['p50']:>8.2f} "
+            f"{result['p95']:>8.2f} {result['max']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
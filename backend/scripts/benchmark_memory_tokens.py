@@ -0,0 +1,93 @@
+import asyncio
+from langchain.memory import ConversationBufferMemory
+from chatbot.conversation_memory import (
+    TokenBudgetedMemory,
+    count_tokens,
+    format_messages,
+)
+from models.conversation import ConversationContext
+from models.search import SearchParameters, SearchFilters, PriceRange
+
+TURNS = 40
+REPORT_EVERY = 5
+
+USER_MESSAGES = [
+    "I'm looking for trail running shoes for rocky terrain",
+    "Something waterproof would be great, I run in the rain a lot",
+    "My budget is around $120, maybe a bit more for something really good",
+    "Can you show the highest rated ones first?",
+    "I usually wear a size 10.5 and have fairly wide feet",
+    "Do any of these come in a darker color like black or navy?",
+    "What about something with more cushioning for long distances?",
+    "I'd prefer brands that offer free returns",
+]
+
+ASSISTANT_MESSAGE = """Great choice! Here are some options that match what you're looking for:
+
+**Trail Runner GTX Waterproof Running Shoe**
+✨ Waterproof membrane and aggressive lugs keep you steady on wet, rocky trails.
+
+**Ultra Cushion Trail 3**
+✨ Extra midsole cushioning makes long distances comfortable without losing grip.
+
+**All Terrain Pro Wide**
+✨ Available in wide sizes with a roomy toe box for a comfortable fit.
+
+**💡 To help you better:** Would you prefer a lighter shoe or more protection underfoot?"""
+
+
+async def local_summarize(summary: str, messages) -> str:
+    """Offline stand-in for the LLM summary: keeps the user requests, capped in size"""
+    requests = [m["content"] for m in format_messages(messages) if m["role"] == "user"]
+    words = " ".join(filter(None, [summary] + requests)).split()
+    return " ".join(words[-200:])
+
+
+async def run(budgeted: bool):
+    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    context = ConversationContext()
+    context._last_search_params = SearchParameters(
+        base_query="waterproof-trail-running-shoes",
+        filters=SearchFilters(price_range=PriceRange(max=130), min_rating=4.0),
+    )
+    manager = TokenBudgetedMemory(client=None)
+    manager._summarize = local_summarize
+
+    tokens_per_turn = []
+    for turn in range(TURNS):
+        message = USER_MESSAGES[turn % len(USER_MESSAGES)]
+        if budgeted:
+            await manager.wait_for_compaction(context)
+            history = manager.build_history(memory, context)
+        else:
+            history = format_messages(memory.chat_memory.messages)
+
+        tokens = sum(count_tokens(m["content"]) for m in history)
+        tokens_per_turn.append(tokens + count_tokens(message))
+
+        memory.chat_memory.add_user_message(message)
+        memory.chat_memory.add_ai_message(ASSISTANT_MESSAGE)
+        if budgeted:
+            manager.schedule_compaction(memory, context)
+
+    return tokens_per_turn, manager
+
+
+async def main():
+    buffer_tokens, _ = await run(budgeted=False)
+    budgeted_tokens, manager = await run(budgeted=True)
+
+    print("History + message tokens sent to each analysis call")
+    print(f"budget={manager.token_budget} window_turns={manager.window_turns}\n")
+    print(f"{'turn':>5} {'buffer':>8} {'budgeted':>9}")
+    for turn in range(0, TURNS, REPORT_EVERY):
+        print(f"{turn + 1:>5} {buffer_tokens[turn]:>8} {budgeted_tokens[turn]:>9}")
+    print(f"{TURNS:>5} {buffer_tokens[-1]:>8} {budgeted_tokens[-1]:>9}")
+    print(
+        f"\ntotal {sum(buffer_tokens):>8} {sum(budgeted_tokens):>9} "
+        f"({manager.compactions} compactions, {manager.folded_messages} messages folded)"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
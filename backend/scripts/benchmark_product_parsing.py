@@ -0,0 +1,90 @@
+import re
+import time
+import random
+from models.product import Product, ProductRecord
+
+PAGE_SIZE = 60
+PAGES = 2000
+PRICES = ["$1,299.99", "$24.99", "19", "$5.00", "$12.99/mo", "From $35", "", None]
+
+
+def legacy_from_serper_result(result):
+    """The validating Product.from_serper_result this benchmark compares against"""
+    price_str = result.get("price")
+    price = 0.0
+    if price_str:
+        try:
+            price = float(price_str.replace("$", "").replace(",", ""))
+            price_str = result["price"]
+        except (ValueError, TypeError):
+            numbers = re.findall(r"\d+\.?\d*", price_str)
+            if numbers:
+                price = float(numbers[0])
+                price_str = f"${price:,.2f}"
+            else:
+                price_str = "Contact for price"
+    else:
+        price_str = "Contact for price"
+
+    return Product(
+        id=str(result.get("position", "")),
+        title=result.get("title", "No title"),
+        description=result.get("description", ""),
+        price=price,
+        price_str=price_str,
+        link=result.get("link", "#"),
+        imageUrl=result.get("imageUrl", ""),
+        rating=result.get("rating"),
+        ratingCount=result.get("ratingCount", 0),
+        delivery=result.get("delivery"),
+        source=result.get("source", "Unknown store"),
+    )
+
+
+def make_page(rng):
+    page = []
+    for position in range(1, PAGE_SIZE + 1):
+        result = {
+            "position": position,
+            "title": f"Product {position}",
+            "source": rng.choice(["Amazon", "Walmart", "Target"]),
+            "link": f"https://example.com/p/{position}",
+            "imageUrl": f"https://example.com/i/{position}.jpg",
+            "delivery": "Free delivery",
+        }
+        price = rng.choice(PRICES)
+        if price is not None:
+            result["price"] = price
+        if rng.random() < 0.8:
+            result["rating"] = round(rng.uniform(1, 5), 1)
+            result["ratingCount"] = rng.randint(1, 5000)
+        page.append(result)
+    return page
+
+
+def timed(parse, page):
+    start = time.perf_counter()
+    for _ in range(PAGES):
+        # Parse the page, then dump the 3 products returned to the client
+        products = [parse(result) for result in page]
+        [product.model_dump() for product in products[:3]]
+    return (time.perf_counter() - start) / PAGES * 1e6
+
+
+def main():
+    page = make_page(random.Random(0))
+    legacy = [legacy_from_serper_result(result).model_dump() for result in page]
+    records = [ProductRecord.from_serper_result(result).model_dump() for result in page]
+    assert legacy == records
+
+    print(f"{'parser':>28} {'us/page':>9}")
+    for name, parse in [
+        ("legacy Product", legacy_from_serper_result),
+        ("Product.from_serper_result", Product.from_serper_result),
+        ("ProductRecord", ProductRecord.from_serper_result),
+    ]:
+        print(f"{name:>28} {timed(parse, page):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
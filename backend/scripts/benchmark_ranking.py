@@ -0,0 +1,112 @@
+import sys
+import time
+import random
+from models.product import Product
+from models.ranking import (
+    ProductColumns,
+    SortOption,
+    get_sorted_products,
+    rank_products,
+)
+
+LIMIT = 3
+STORES = "Amazon Walmart Target BestBuy Etsy eBay".split()
+
+
+def legacy_sorted_products(products, sort_by, limit=None):
+    """The list-based get_sorted_products this benchmark compares against"""
+    sorted_products = products.copy()
+    if sort_by == SortOption.RATING:
+        sorted_products.sort(
+            key=lambda p: (p.rating if p.rating is not None else -1), reverse=True
+        )
+    elif sort_by == SortOption.RATING_COUNT:
+        sorted_products.sort(
+            key=lambda p: p.ratingCount if p.ratingCount is not None else 0,
+            reverse=True,
+        )
+    elif sort_by == SortOption.RATING_WEIGHTED:
+
+        def wilson_score(product):
+            if not product.rating or not product.ratingCount:
+                return -1
+            pos = (product.rating / 5.0) * product.ratingCount
+            n = product.ratingCount
+            zsqr = 1.96 * 1.96
+            return ((pos + zsqr / 2) / n) / (1 + zsqr / n)
+
+        sorted_products.sort(key=wilson_score, reverse=True)
+    elif sort_by == SortOption.PRICE_LOW:
+        sorted_products.sort(
+            key=lambda p: float(p.price) if p.price is not None else float("inf")
+        )
+    elif sort_by == SortOption.PRICE_HIGH:
+        sorted_products.sort(
+            key=lambda p: float(p.price) if p.price is not None else -1, reverse=True
+        )
+    if limit is not None:
+        sorted_products = sorted_products[:limit]
+    return sorted_products
+
+
+def make_products(count, rng):
+    products = []
+    for i in range(count):
+        price = round(rng.uniform(5, 500), 2)
+        rated = rng.random() < 0.8
+        products.append(
+            Product.model_construct(
+                id=str(i),
+                title=f"product {i}",
+                description="",
+                price=price,
+                price_str=f"${price:,.2f}",
+                link=f"https://example.com/p/{i}",
+                imageUrl="",
+                rating=round(rng.uniform(1, 5), 1) if rated else None,
+                ratingCount=rng.randint(0, 5000) if rated else 0,
+                delivery=None,
+                source=rng.choice(STORES),
+            )
+        )
+    return products
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [60, 1000, 100000]
+    print(
+        f"{'products':>9} {'sort_by':>16} {'legacy ms':>10} "
+        f"{'new ms':>8} {'rank ms':>8} {'speedup':>8}"
+    )
+    for size in sizes:
+        products = make_products(size, random.Random(size))
+        repeat = max(3, 100000 // size)
+        columns = ProductColumns(products)
+        # Extract every column up front so rank ms measures ranking alone
+        columns.price, columns.rating, columns.rating_count
+        for sort_by in SortOption:
+            if sort_by == SortOption.RELEVANCE:
+                continue
+            legacy_ms, expected = timed(
+                lambda: legacy_sorted_products(products, sort_by, LIMIT), repeat
+            )
+            new_ms, actual = timed(
+                lambda: get_sorted_products(products, sort_by, LIMIT), repeat
+            )
+            rank_ms, _ = timed(lambda: rank_products(columns, sort_by, LIMIT), repeat)
+            assert [p.id for p in actual] == [p.id for p in expected], sort_by
+            print(
+                f"{size:>9} {sort_by.value:>16} {legacy_ms:>10.3f} "
+                f"{new_ms:>8.3f} {rank_ms:>8.3f} {legacy_ms / new_ms:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
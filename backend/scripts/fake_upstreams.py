@@ -0,0 +1,399 @@
+"""Local stand-ins for the OpenAI and Serper APIs, for load tests.
+
+Serves OpenAI chat completions (plain, JSON, structured outputs, streaming
+and vision), OpenAI embeddings and Serper /shopping from one aiohttp app,
+with a configurable latency per endpoint. Point the backend at it with
+
+    OPENAI_BASE_URL=http://127.0.0.1:8800/v1
+    SERPER_URL=http://127.0.0.1:8800/shopping
+
+Run standalone with `python -m scripts.fake_upstreams` from backend.
+
+Latencies are FAKE_<ENDPOINT>_LATENCY specs (endpoints: CHAT, VISION,
+EMBEDDING, SERPER), one of "none", "fixed:<s>", "uniform:<low>:<high>" or
+"lognormal:<median>:<sigma>". FAKE_SERPER_PAYLOAD may name a JSON file with
+a Serper response to return for every query instead of generated results.
+"""
+
+import os
+import re
+import json
+import time
+import base64
+import random
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional
+import numpy as np
+from aiohttp import web
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+PRICE_MAX_PATTERN = re.compile(r"(?:under|below|less than) \$?(\d+)")
+GREETINGS = {"hi", "hello", "hey", "thanks", "thank", "morning", "there"}
+GOODBYES = {"bye", "goodbye"}
+# Words that refine a search rather than name a product
+REFINEMENTS = {
+    "cheapest": "price_low",
+    "cheaper": "price_low",
+    "expensive": "price_high",
+    "rated": "rating",
+    "rating": "rating",
+    "reviews": "rating_count",
+    "popular": "rating_weighted",
+}
+STOPWORDS = set(
+    "i im i'm a an the for to me my some any show sort by with and or of in on "
+    "looking look need want find get please can you do have first most best "
+    "under below less than ones them those these is are it that".split()
+)
+STORES = "Amazon Walmart Target BestBuy Etsy eBay Macy's Nordstrom".split()
+VISION_QUERIES = [
+    "red-leather-crossbody-handbag",
+    "blue-running-shoes-with-mesh",
+    "vintage-blue-denim-jacket",
+    "black-wireless-headphones",
+    "white-ceramic-coffee-mug",
+]
+EMBEDDING_DIM = 1536
+
+
+class Latency:
+    """A latency distribution parsed from a spec string"""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, *args = spec.split(":")
+        self.kind = kind
+        self.args = [float(arg) for arg in args]
+        if kind not in ("none", "fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return random.uniform(self.args[0], self.args[1])
+        if self.kind == "lognormal":
+            return random.lognormvariate(np.log(self.args[0]), self.args[1])
+        return 0.0
+
+    async def wait(self):
+        delay = self.sample()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _words(text: str) -> List[str]:
+    return WORD_PATTERN.findall(text.lower().replace("'", ""))
+
+
+def analyze_messages(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Rule-based stand-in for the analysis prompts: greetings collect info,
+    goodbyes end, anything naming a product is ready to search. Refinements
+    keep the product of the last user message that named one."""
+    user_messages = [
+        m["content"]
+        for m in messages
+        if m["role"] == "user" and isinstance(m["content"], str)
+    ]
+    last = user_messages[-1] if user_messages else ""
+    words = _words(last)
+
+    if GOODBYES & set(words):
+        return {"state": "ended", "response": "Goodbye!", "search_params": None}
+
+    sort_by = next((REFINEMENTS[w] for w in words if w in REFINEMENTS), None)
+    price_max = PRICE_MAX_PATTERN.search(last.lower())
+
+    base_query = None
+    for message in reversed(user_messages):
+        product_words = [
+            w
+            for w in _words(message)
+            if w not in STOPWORDS
+            and w not in GREETINGS
+            and w not in REFINEMENTS
+            and not w.isdigit()
+        ]
+        if product_words:
+            base_query = "-".join(product_words)
+            break
+
+    if base_query is None:
+        return {
+            "state": "collecting_info",
+            "response": "Hi! What are you shopping for today?",
+            "search_params": None,
+        }
+
+    return {
+        "state": "ready_to_search",
+        "response": f"Let me find some {base_query.replace('-', ' ')} for you!",
+        "search_params": {
+            "base_query": base_query,
+            "filters": (
+                {
+                    "price_range": {"min": None, "max": float(price_max.group(1))},
+                    "min_rating": None,
+                    "free_shipping": None,
+                    "free_returns": None,
+                }
+                if price_max
+                else None
+            ),
+            "sort_by": sort_by,
+        },
+    }
+
+
+def shopping_results(query: str, page: int, count: int = 40) -> List[Dict[str, Any]]:
+    """Deterministic Serper-shaped results for a query and page"""
+    seed = int.from_bytes(hashlib.sha256(f"{query}\0{page}".encode()).digest()[:8])
+    rng = random.Random(seed)
+    title = query.replace("-", " ")
+    results = []
+    for i in range(count):
+        position = (page - 1) * count + i + 1
+        rated = rng.random() < 0.8
+        results.append(
+            {
+                "title": f"{title} {rng.choice(['Pro', 'Classic', 'Lite', 'Max'])} {position}",
+                "source": rng.choice(STORES),
+                "link": f"https://shop.example.com/{query}/{position}",
+                "price": f"${rng.uniform(5, 300):.2f}",
+                "delivery": rng.choice(["Free delivery", "Free shipping", None]),
+                "imageUrl": f"https://img.example.com/{query}/{position}.jpg",
+                "rating": round(rng.uniform(2.5, 5), 1) if rated else None,
+                "ratingCount": rng.randint(1, 5000) if rated else None,
+                "productId": str(seed % 10**9 + i),
+                "position": position,
+            }
+        )
+    return results
+
+
+class FakeUpstreams:
+    """aiohttp app serving the fake OpenAI and Serper endpoints"""
+
+    def __init__(
+        self,
+        chat_latency: str = "lognormal:0.6:0.4",
+        vision_latency: str = "lognormal:1.5:0.3",
+        embedding_latency: str = "lognormal:0.15:0.3",
+        serper_latency: str = "lognormal:0.8:0.3",
+        stream_token_interval: float = 0.02,
+        serper_payload: Optional[Dict[str, Any]] = None,
+    ):
+        self.chat_latency = Latency(chat_latency)
+        self.vision_latency = Latency(vision_latency)
+        self.embedding_latency = Latency(embedding_latency)
+        self.serper_latency = Latency(serper_latency)
+        self.stream_token_interval = stream_token_interval
+        self.serper_payload = serper_payload
+
+        # Requests served per endpoint
+        self.counts = {"chat": 0, "stream": 0, "vision": 0, "embedding": 0, "serper": 0}
+
+    @classmethod
+    def from_env(cls) -> "FakeUpstreams":
+        """Create from FAKE_* environment variables"""
+        payload_path = os.getenv("FAKE_SERPER_PAYLOAD")
+        serper_payload = None
+        if payload_path:
+            with open(payload_path) as f:
+                serper_payload = json.load(f)
+        return cls(
+            chat_latency=os.getenv("FAKE_CHAT_LATENCY", "lognormal:0.6:0.4"),
+            vision_latency=os.getenv("FAKE_VISION_LATENCY", "lognormal:1.5:0.3"),
+            embedding_latency=os.getenv("FAKE_EMBEDDING_LATENCY", "lognormal:0.15:0.3"),
+            serper_latency=os.getenv("FAKE_SERPER_LATENCY", "lognormal:0.8:0.3"),
+            stream_token_interval=float(
+                os.getenv("FAKE_STREAM_TOKEN_INTERVAL", "0.02")
+            ),
+            serper_payload=serper_payload,
+        )
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/v1/embeddings", self.embeddings)
+        app.router.add_post("/shopping", self.shopping)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+    @staticmethod
+    def _completion(model: str, content: str, prompt_tokens: int) -> Dict[str, Any]:
+        completion_tokens = max(1, len(content) // 4)
+        return {
+            "id": f"chatcmpl-{random.getrandbits(64):x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                    "logprobs": None,
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "gpt-4o-mini")
+        messages = body.get("messages", [])
+        # Roughly four characters per token, like the real tokenizer
+        prompt_tokens = len(json.dumps(messages)) // 4
+        response_format = body.get("response_format") or {}
+
+        if any(isinstance(m.get("content"), list) for m in messages):
+            self.counts["vision"] += 1
+            await self.vision_latency.wait()
+            digest = hashlib.sha256(json.dumps(messages).encode()).digest()
+            content = json.dumps(
+                {"base_query": VISION_QUERIES[digest[0] % len(VISION_QUERIES)]}
+            )
+            return web.json_response(self._completion(model, content, 1000))
+
+        if body.get("stream"):
+            self.counts["stream"] += 1
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            return await self._stream(
+                request, model, prompt_tokens if include_usage else None
+            )
+
+        self.counts["chat"] += 1
+        await self.chat_latency.wait()
+        analysis = analyze_messages(messages)
+        if response_format.get("type") == "json_schema":
+            name = response_format["json_schema"].get("name")
+            if name == "SearchParameters":
+                params = analysis["search_params"] or {
+                    "base_query": "",
+                    "filters": None,
+                    "sort_by": None,
+                }
+                content = json.dumps(params)
+            else:
+                content = json.dumps(analysis)
+        elif response_format.get("type") == "json_object":
+            content = json.dumps(
+                {"state": analysis["state"], "response": analysis["response"]}
+            )
+        else:
+            content = (
+                "Here are a few options that match what you asked for. The first "
+                "one is the best value, the second has the best reviews, and the "
+                "third is a solid all-rounder."
+            )
+        return web.json_response(self._completion(model, content, prompt_tokens))
+
+    async def _stream(
+        self, request: web.Request, model: str, prompt_tokens: Optional[int] = None
+    ) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await self.chat_latency.wait()
+        chunk_id = f"chatcmpl-{random.getrandbits(64):x}"
+        tokens = "Here are a few options that match what you asked for.".split(" ")
+        for i, token in enumerate(tokens + [None]):
+            chunk = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": token + " "} if token else {},
+                        "finish_reason": None if token else "stop",
+                    }
+                ],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            if token:
+                await asyncio.sleep(self.stream_token_interval)
+        if prompt_tokens is not None:
+            # stream_options.include_usage: a last chunk with no choices
+            usage_chunk = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(tokens),
+                    "total_tokens": prompt_tokens + len(tokens),
+                },
+            }
+            await response.write(f"data: {json.dumps(usage_chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        self.counts["embedding"] += 1
+        await self.embedding_latency.wait()
+
+        data = []
+        for i, text in enumerate(inputs):
+            seed = int.from_bytes(
+                hashlib.sha256(json.dumps(text).encode()).digest()[:8]
+            )
+            vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM)
+            vector = (vector / np.linalg.norm(vector)).astype(np.float32)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+
+        tokens = sum(
+            len(text) if isinstance(text, list) else len(text) // 4 for text in inputs
+        )
+        return web.json_response(
+            {
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "text-embedding-ada-002"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            }
+        )
+
+    async def shopping(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.counts["serper"] += 1
+        await self.serper_latency.wait()
+        if self.serper_payload is not None:
+            return web.json_response(self.serper_payload)
+        return web.json_response(
+            {
+                "searchParameters": body,
+                "shopping": shopping_results(body.get("q", ""), body.get("page", 1)),
+            }
+        )
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.counts)
+
+
+if __name__ == "__main__":
+    port = int(os.getenv("FAKE_UPSTREAM_PORT", "8800"))
+    print(f"Fake OpenAI and Serper listening on http://127.0.0.1:{port}")
+    web.run_app(
+        FakeUpstreams.from_env().app(),
+        host="127.0.0.1",
+        port=port,
+        print=None,
+        access_log=None,
+    )
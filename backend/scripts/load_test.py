@@ -0,0 +1,422 @@
+"""Load test the API against local OpenAI and Serper stand-ins.
+
+Starts scripts.fake_upstreams and the app (uvicorn) as subprocesses, then
+drives each scenario with LOAD_TEST_CONCURRENCY concurrent clients and
+reports latency percentiles, throughput, and the app's CPU and RSS.
+Run from backend with `python -m scripts.load_test`.
+
+Results are written to LOAD_TEST_OUTPUT_DIR (default benchmark_results) as
+one JSON file per run, and appended to load_test_history.jsonl, which is
+used to show the change from the previous run.
+
+Scenarios (LOAD_TEST_SCENARIOS, comma separated):
+    greeting     "hi there" in a new session
+    search       a product request in a new session
+    refinement   "show the cheapest first" after an (untimed) search
+    image        an image upload, from a pool of LOAD_TEST_IMAGE_VARIANTS images
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import random
+import asyncio
+import tempfile
+import platform
+import subprocess
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ["greeting", "search", "refinement", "image"]
+
+ADJECTIVES = "black white red blue pink green leather waterproof wireless vintage kids mens womens large small premium".split()
+NOUNS = "shoes boots jacket backpack laptop headphones keyboard lamp chair desk watch dress sneakers mug blender".split()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ProcessMonitor:
+    """Samples CPU time and RSS of a process from /proc (or psutil if installed)"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.rss_peak = 0
+        try:
+            import psutil
+
+            self._process = psutil.Process(pid)
+        except ImportError:
+            self._process = None
+        self._clock_ticks = os.sysconf("SC_CLK_TCK") if self._process is None else 1
+
+    def cpu_seconds(self) -> float:
+        if self._process is not None:
+            times = self._process.cpu_times()
+            return times.user + times.system
+        with open(f"/proc/{self.pid}/stat") as f:
+            # Fields after the parenthesized command name; utime and stime
+            # are fields 14 and 15 of the full line
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self._clock_ticks
+
+    def rss_bytes(self) -> int:
+        if self._process is not None:
+            rss = self._process.memory_info().rss
+        else:
+            with open(f"/proc/{self.pid}/statm") as f:
+                rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        self.rss_peak = max(self.rss_peak, rss)
+        return rss
+
+    async def sample(self, interval: float = 0.1):
+        """Track peak RSS until cancelled"""
+        while True:
+            self.rss_bytes()
+            await asyncio.sleep(interval)
+
+
+def make_images(count: int) -> List[bytes]:
+    """Distinct JPEG photos-sized images for the upload scenario"""
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:900, 0:1200]
+    images = []
+    for _ in range(count):
+        a, b, c = rng.uniform(0.5, 2, 3)
+        pixels = np.stack(
+            [(x * a) % 256, (y * b) % 256, ((x + y) * c) % 256], axis=-1
+        ).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, "JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def product_request(rng: random.Random) -> str:
+    return f"I'm looking for {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+
+
+async def chat(client: httpx.AsyncClient, text: str, session_id: str) -> httpx.Response:
+    return await client.post(
+        "/api/chat/text/v2", json={"text": text, "sessionId": session_id}
+    )
+
+
+def build_scenarios(
+    rng: random.Random, images: List[bytes]
+) -> Dict[str, Tuple[Optional[Callable], Callable]]:
+    """Map each scenario to (untimed setup, timed request). Both take
+    (client, session_id); the timed request returns the response."""
+
+    async def search_setup(client, session_id):
+        await chat(client, product_request(rng), session_id)
+
+    async def upload(client, session_id):
+        image = rng.choice(images)
+        return await client.post(
+            "/api/chat/image",
+            files={"image": ("photo.jpg", image, "image/jpeg")},
+            data={"sessionId": session_id},
+        )
+
+    return {
+        "greeting": (None, lambda client, sid: chat(client, "hi there", sid)),
+        "search": (None, lambda client, sid: chat(client, product_request(rng), sid)),
+        "refinement": (
+            search_setup,
+            lambda client, sid: chat(client, "show the cheapest first", sid),
+        ),
+        "image": (None, upload),
+    }
+
+
+async def run_scenario(
+    name: str,
+    setup: Optional[Callable],
+    request: Callable,
+    base_url: str,
+    upstream_url: str,
+    monitor: ProcessMonitor,
+    concurrency: int,
+    requests: int,
+    warmup: int,
+) -> Dict[str, Any]:
+    """Send `requests` timed requests from `concurrency` clients"""
+    limits = httpx.Limits(max_connections=concurrency)
+    timeout = httpx.Timeout(60)
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=timeout
+    ) as client:
+        for _ in range(warmup):
+            session_id = str(uuid.uuid4())
+            if setup:
+                await setup(client, session_id)
+            await request(client, session_id)
+
+        latencies: List[float] = []
+        errors = 0
+        remaining = requests
+
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                session_id = str(uuid.uuid4())
+                try:
+                    if setup:
+                        await setup(client, session_id)
+                    start = time.perf_counter()
+                    response = await request(client, session_id)
+                    elapsed = time.perf_counter() - start
+                except httpx.HTTPError as e:
+                    print(f"Error in {name} request: {e}")
+                    errors += 1
+                    continue
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+                latencies.append(elapsed)
+
+        upstream_before = (await client.get(f"{upstream_url}/stats")).json()
+        cpu_before = monitor.cpu_seconds()
+        monitor.rss_peak = monitor.rss_bytes()
+        sampler = asyncio.create_task(monitor.sample())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        duration = time.perf_counter() - start
+        sampler.cancel()
+        cpu_seconds = monitor.cpu_seconds() - cpu_before
+        upstream_after = (await client.get(f"{upstream_url}/stats")).json()
+
+    latencies_ms = np.array(latencies) * 1000
+    completed = len(latencies)
+    percentile = lambda q: float(np.percentile(latencies_ms, q)) if completed else None
+    return {
+        "scenario": name,
+        "requests": requests,
+        "completed": completed,
+        "errors": errors,
+        "duration_s": duration,
+        "requests_per_second": completed / duration if duration else 0.0,
+        "latency_ms_p50": percentile(50),
+        "latency_ms_p95": percentile(95),
+        "latency_ms_p99": percentile(99),
+        "latency_ms_max": float(latencies_ms.max()) if completed else None,
+        # Includes the untimed setup requests of the refinement scenario
+        "cpu_seconds": cpu_seconds,
+        "cpu_percent": 100 * cpu_seconds / duration if duration else 0.0,
+        "rss_mb_peak": monitor.rss_peak / 1024 / 1024,
+        "rss_mb_end": monitor.rss_bytes() / 1024 / 1024,
+        "upstream_calls": {
+            key: upstream_after[key] - upstream_before.get(key, 0)
+            for key in upstream_after
+        },
+    }
+
+
+async def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with status {process.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: List[Dict[str, Any]], previous: Optional[Dict[str, Any]]):
+    previous_by_name = {r["scenario"]: r for r in (previous or {}).get("scenarios", [])}
+    print(
+        f"{'scenario':<11} {'done':>5} {'err':>4} {'req/s':>7} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {'p99 ms':>8} {'cpu %':>6} {'rss MB':>7}  vs previous"
+    )
+    for r in results:
+        if not r["completed"]:
+            print(f"{r['scenario']:<11} {0:>5} {r['errors']:>4}")
+            continue
+        change = ""
+        old = previous_by_name.get(r["scenario"])
+        if old and old.get("latency_ms_p95") and old.get("requests_per_second"):
+            change = (
+                f"p95 {100 * (r['latency_ms_p95'] / old['latency_ms_p95'] - 1):+.0f}%, "
+                f"req/s {100 * (r['requests_per_second'] / old['requests_per_second'] - 1):+.0f}%"
+            )
+        print(
+            f"{r['scenario']:<11} {r['completed']:>5} {r['errors']:>4} "
+            f"{r['requests_per_second']:>7.1f} {r['latency_ms_p50']:>8.0f} "
+            f"{r['latency_ms_p95']:>8.0f} {r['latency_ms_p99']:>8.0f} "
+            f"{r['cpu_percent']:>6.0f} {r['rss_mb_peak']:>7.0f}  {change}"
+        )
+
+
+async def main():
+    concurrency = int(os.getenv("LOAD_TEST_CONCURRENCY", "20"))
+    requests = int(os.getenv("LOAD_TEST_REQUESTS", "200"))
+    warmup = int(os.getenv("LOAD_TEST_WARMUP", "5"))
+    scenarios = os.getenv("LOAD_TEST_SCENARIOS", ",".join(SCENARIOS)).split(",")
+    output_dir = os.getenv(
+        "LOAD_TEST_OUTPUT_DIR", os.path.join(BACKEND_DIR, "benchmark_results")
+    )
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    upstream_port = free_port()
+    app_port = free_port()
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+    base_url = f"http://127.0.0.1:{app_port}"
+
+    # Never reach the real APIs, whatever .env says. The app runs in a
+    # scratch directory so uploads and cache files don't touch the tree.
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "load-test",
+        "OPENAI_BASE_URL": f"{upstream_url}/v1",
+        "SERPER_API_KEY": "load-test",
+        "SERPER_URL": f"{upstream_url}/shopping",
+        "FAKE_UPSTREAM_PORT": str(upstream_port),
+        "PYTHONPATH": BACKEND_DIR,
+    }
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    log_path = os.path.join(workdir, "app.log")
+    log = open(log_path, "w")
+
+    upstream = subprocess.Popen(
+        [sys.executable, "-m", "scripts.fake_upstreams"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    app = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--app-dir",
+            BACKEND_DIR,
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(app_port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        cwd=workdir,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+    results = []
+    try:
+        await wait_until_ready(f"{upstream_url}/stats", upstream)
+        await wait_until_ready(f"{base_url}/api/stats", app)
+        monitor = ProcessMonitor(app.pid)
+        rng = random.Random(0)
+        images = make_images(int(os.getenv("LOAD_TEST_IMAGE_VARIANTS", "20")))
+        scenario_functions = build_scenarios(rng, images)
+
+        for name in scenarios:
+            setup, request = scenario_functions[name]
+            print(f"Running {name} ({requests} requests, {concurrency} clients)...")
+            results.append(
+                await run_scenario(
+                    name,
+                    setup,
+                    request,
+                    base_url,
+                    upstream_url,
+                    monitor,
+                    concurrency,
+                    requests,
+                    warmup,
+                )
+            )
+
+        async with httpx.AsyncClient() as client:
+            app_stats = (await client.get(f"{base_url}/api/stats")).json()
+    finally:
+        for process in (app, upstream):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        log.close()
+
+    run = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "concurrency": concurrency,
+            "requests": requests,
+            "warmup": warmup,
+            **{
+                key: value
+                for key, value in sorted(os.environ.items())
+                if key.startswith(("FAKE_", "LOAD_TEST_"))
+            },
+        },
+        "scenarios": results,
+        "app_stats": app_stats,
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    history_path = os.path.join(output_dir, "load_test_history.jsonl")
+    previous = None
+    if os.path.exists(history_path):
+        with open(history_path) as f:
+            lines = f.read().splitlines()
+        previous = json.loads(lines[-1]) if lines else None
+
+    run_path = os.path.join(
+        output_dir, f"load_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    with open(run_path, "w") as f:
+        json.dump(run, f, indent=2)
+    # The history keeps one summary line per run, without the app stats
+    with open(history_path, "a") as f:
+        f.write(json.dumps({k: v for k, v in run.items() if k != "app_stats"}) + "\n")
+
+    print_results(results, previous)
+    print(f"\nResults written to {run_path}")
+    print(f"App log: {log_path}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+import os
+import tempfile
+from typing import List
+import numpy as np
+from models.embedding_cache import CachedEmbeddings
+
+
+class FakeEmbeddings:
+    """Stands in for OpenAIEmbeddings: text "abc" embeds to [len, len, len]"""
+
+    model = "fake-embedding"
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        return [[float(len(text))] * 3 for text in texts]
+
+
+def check_vectors(cache: CachedEmbeddings, texts: List[str]):
+    for text, vector in zip(texts, cache.embed_documents(texts)):
+        expected = [float(len(text))] * 3
+        assert vector == expected, f"{text!r}: got {vector}, expected {expected}"
+
+
+def check_interrupted_append(path: str):
+    texts = ["a", "bb", "ccc"]
+    check_vectors(CachedEmbeddings(FakeEmbeddings(), path=path), texts)
+
+    # An append interrupted after the vectors were written: one row, no key
+    with open(os.path.join(path, CachedEmbeddings.VECTORS_FILE), "ab") as f:
+        f.write(np.full(3, 9, dtype=np.float32).tobytes())
+    # ...and one cut short inside a key
+    with open(os.path.join(path, CachedEmbeddings.KEYS_FILE), "a") as f:
+        f.write("0123abcd")
+
+    model = FakeEmbeddings()
+    cache = CachedEmbeddings(model, path=path)
+    assert cache._vectors.shape == (3, 3), cache._vectors.shape
+    check_vectors(cache, texts)
+    assert model.calls == 0, "Reloaded vectors should be served from disk"
+
+    # New keys must point at their own rows, not the orphan's
+    check_vectors(cache, ["dddd"])
+    check_vectors(CachedEmbeddings(FakeEmbeddings(), path=path), texts + ["dddd"])
+    print("Interrupted append: ok")
+
+
+def check_memory_bound():
+    model = FakeEmbeddings()
+    cache = CachedEmbeddings(model, max_memory_entries=2)
+    # Larger than the cache: vectors must still come back for every text
+    check_vectors(cache, ["a", "bb", "ccc", "dddd"])
+    assert len(cache._memory) == 2 and cache.evictions == 2, cache.stats()
+    print("Memory bound: ok")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as path:
+        check_interrupted_append(path)
+    check_memory_bound()
+
+
+if __name__ == "__main__":
+    main()
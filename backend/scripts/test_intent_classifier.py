@@ -0,0 +1,39 @@
+from typing import List, Optional, Tuple
+from models.intent_classifier import IntentClassifier
+from models.search import SearchParameters
+
+# (message, rule expected to resolve it, or None when it must go to the LLM)
+EXAMPLES: List[Tuple[str, Optional[str]]] = [
+    ("hi", "greeting"),
+    ("Hello there!", "greeting"),
+    ("thanks, bye", "goodbye"),
+    # Below the default threshold: thanks may come with a follow-up request
+    ("thank you so much", None),
+    ("show cheapest first", "sort:price_low"),
+    ("sort by price please", "sort:price_low"),
+    ("show me the highest rated ones", "sort:rating"),
+    ("most popular first", "sort:rating_weighted"),
+    ("what is the lowest price", None),
+    ("what is the lowest price?", None),
+    ("which ones are highest rated?", None),
+    ("cheapest red ones in size 10", None),
+    ("show me cheapest but also highest rated", None),
+    ("I need running shoes", None),
+]
+
+
+def main():
+    classifier = IntentClassifier(mode="on")
+    last_search_params = SearchParameters(base_query="running-shoes")
+    failures = 0
+    for message, expected in EXAMPLES:
+        decision = classifier.classify(message, last_search_params)
+        rule = decision.rule if classifier.should_resolve(decision) else None
+        status = "ok" if rule == expected else "FAIL"
+        failures += status == "FAIL"
+        print(f"{status:4} {message!r}: {rule} (expected {expected})")
+    assert failures == 0, f"{failures} examples misclassified"
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import os
 from dotenv import load_dotenv
 from models.search import SearchParameters, SearchFilters, PriceRange, ProductSearcher
+from models.product_store import SortOption
 
 # Load environment variables
 load_dotenv()
@@ -9,6 +10,7 @@ load_dotenv()
 async def main():
     # Initialize the product searcher
     searcher = ProductSearcher()
+    await searcher.start()
 
     # Test cases with different search parameters
     test_cases = [
@@ -19,27 +21,21 @@ async def main():
             ),
         ),
         SearchParameters(
-            base_query="educational toys",
-            color="blue",
-            age=6,
-            gender="male",
-            occasion="learning",
+            base_query="educational-science-toys",
             filters=SearchFilters(
                 price_range=PriceRange(min=20, max=50),
                 min_rating=4.0,
                 free_shipping=True,
             ),
-            properties={"type": "science"},
+            sort_by=SortOption.RATING_WEIGHTED,
         ),
         SearchParameters(
-            base_query="princess toys",
-            age=5,
-            gender="female",
+            base_query="princess-toys-for-girls",
             filters=SearchFilters(
                 price_range=PriceRange(max=30),
                 free_returns=True,
-                sellers=["amazon", "walmart"],
             ),
+            sort_by=SortOption.PRICE_LOW,
         ),
     ]
 
@@ -62,6 +58,8 @@ async def main():
             print(f"  Link: {product.link}")
         print("-" * 80)
 
+    await searcher.close()
+
 
 if __name__ == "__main__":
     import asyncio
@@ -58,6 +58,8 @@ export interface ChatResponse {
     timestamp: string;
     products: Product[];
     search_params?: SearchParameters;
+    // Pass to /api/chat/products/more for the next page of products
+    cursor?: string | null;
     user_message?: {
         type: 'image';
         content: string;